@@ -0,0 +1,59 @@
+"""
+Compares decoding a synthetic mixed stream with decode_packet, which
+allocates a message per packet, against BatchDecoder.decode_many,
+which reuses one message per packet type, with and without reuse.
+"""
+
+import sys
+import time
+import tracemalloc
+
+from hearthy.benchmark import synthetic
+from hearthy.protocol.decoder import BatchDecoder, decode_packet
+
+def run_single(frames):
+    """ Returns the number of message objects created. """
+    n = 0
+    for atype, buf in frames:
+        decode_packet(atype, buf)
+        n += 1
+    return n
+
+def run_batch(frames, reuse=True):
+    decoder = BatchDecoder(reuse=reuse)
+    decoder.decode_many(frames, lambda atype, message: None)
+    return len(decoder._messages) if reuse else len(frames)
+
+def run_batch_fresh(frames):
+    return run_batch(frames, reuse=False)
+
+def measure(fun, frames, rounds=5):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        fun(frames)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # only sees allocations made through the python allocator,
+    # messages of the upb backend live in its own arenas
+    tracemalloc.start()
+    n_messages = fun(frames)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, n_messages, peak
+
+if __name__ == '__main__':
+    n_packets = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    frames = synthetic.frames(synthetic.generate('mixed', n_packets))
+    n_bytes = sum(len(buf) for atype, buf in frames)
+    print('{0} packets, {1} bytes'.format(len(frames), n_bytes))
+
+    print('{0:>14} {1:>10} {2:>12} {3:>10} {4:>12}'.format(
+        'mode', 'ms', 'packets/s', 'messages', 'peak KiB'))
+    for name, fun in (('decode_packet', run_single), ('decode_many', run_batch),
+                      ('no reuse', run_batch_fresh)):
+        elapsed, n_messages, peak = measure(fun, frames)
+        print('{0:>14} {1:10.1f} {2:12.0f} {3:10} {4:12.1f}'.format(
+            name, elapsed * 1e3, len(frames) / elapsed, n_messages, peak / 1024))
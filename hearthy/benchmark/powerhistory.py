@@ -0,0 +1,126 @@
+"""
+Compares the protobuf and the wire level PowerHistory paths of the
+tracker on an hcapng capture.
+
+For every game stream in the capture both paths are replayed through
+a Processor and the resulting worlds are checked to be identical.
+"""
+
+import logging
+import time
+
+from hearthy.datasource import hcapng
+from hearthy.protocol import decoder, powerhistory
+from hearthy.protocol.splitter import Splitter
+from hearthy.tracker.processor import Processor
+from pegasus.game_pb2 import PowerHistory
+
+def load_streams(f):
+    """ Returns {stream_id: [(who, atype, data)]} of all packets in a capture. """
+    streams = {}
+    splitters = {}
+    for ts, event in hcapng.parse(f):
+        if isinstance(event, hcapng.EvNewConnection):
+            streams[event.stream_id] = []
+            splitters[event.stream_id] = [Splitter(), Splitter()]
+        elif isinstance(event, hcapng.EvData) and event.stream_id in streams:
+            packets = streams[event.stream_id]
+            for atype, buf in splitters[event.stream_id][event.who].feed(event.data):
+                packets.append((event.who, atype, bytes(buf)))
+    return streams
+
+def replay(packets, wire):
+    p = Processor(wire=wire)
+    for who, atype, buf in packets:
+        p.process(who, decoder.decode_packet(atype, buf, interest=p.interest))
+    return p._world
+
+def compare_worlds(a, b):
+    """ Returns a list of differences between two worlds. """
+    diffs = []
+    tags_a = {e.id: e._tags for e in a}
+    tags_b = {e.id: e._tags for e in b}
+
+    for eid in sorted(tags_a.keys() | tags_b.keys()):
+        ta = tags_a.get(eid, None)
+        tb = tags_b.get(eid, None)
+        if ta is None or tb is None:
+            diffs.append('entity {0} only in {1}'.format(eid, 'b' if ta is None else 'a'))
+        elif ta != tb:
+            for tag in sorted(ta.keys() | tb.keys()):
+                if ta.get(tag) != tb.get(tag):
+                    diffs.append('entity {0} tag {1}: {2!r} != {3!r}'.format(
+                        eid, tag, ta.get(tag), tb.get(tag)))
+    return diffs
+
+def _walk_protobuf(buf):
+    n = 0
+    for power in decoder.decode_packet(PowerHistory.ID, buf).list:
+        if power.HasField('full_entity'):
+            n += len(power.full_entity.tags)
+        if power.HasField('show_entity'):
+            n += len(power.show_entity.tags)
+        if power.HasField('tag_change'):
+            n += power.tag_change.value
+    return n
+
+def _walk_wire(buf):
+    n = 0
+    for kind, eid, a, b in powerhistory.scan(buf):
+        if kind == powerhistory.TAG_CHANGE:
+            n += b
+        elif kind == powerhistory.FULL_ENTITY or kind == powerhistory.SHOW_ENTITY:
+            n += len(b) // 2
+    return n
+
+def _timeit(fun, *args):
+    start = time.perf_counter()
+    ret = fun(*args)
+    return time.perf_counter() - start, ret
+
+def run(streams):
+    ok = True
+    histories = [buf for packets in streams.values()
+                 for who, atype, buf in packets if atype == PowerHistory.ID]
+    total = sum(map(len, histories))
+
+    t_pb, n_pb = _timeit(lambda: [_walk_protobuf(buf) for buf in histories])
+    t_wire, n_wire = _timeit(lambda: [_walk_wire(buf) for buf in histories])
+    if n_pb != n_wire:
+        ok = False
+        print('protobuf and wire readers disagree')
+    print('reading {0} PowerHistory packets ({1} bytes)'.format(len(histories), total))
+    print('  protobuf {0:8.3f}s  wire {1:8.3f}s  speedup {2:.2f}x'.format(
+        t_pb, t_wire, t_pb / max(t_wire, 1e-9)))
+
+    t_pb = t_wire = 0
+    for stream_id, packets in sorted(streams.items()):
+        dt, world_pb = _timeit(replay, packets, False)
+        t_pb += dt
+        dt, world_wire = _timeit(replay, packets, True)
+        t_wire += dt
+
+        diffs = compare_worlds(world_pb, world_wire)
+        if diffs:
+            ok = False
+            print('stream {0}: worlds differ'.format(stream_id))
+            for diff in diffs:
+                print('  ' + diff)
+
+    print('replaying {0} streams through Processor'.format(len(streams)))
+    print('  protobuf {0:8.3f}s  wire {1:8.3f}s  speedup {2:.2f}x'.format(
+        t_pb, t_wire, t_pb / max(t_wire, 1e-9)))
+    print('worlds identical' if ok else 'MISMATCH')
+    return ok
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('Usage: {0} <hcapng file>'.format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with open(sys.argv[1], 'rb') as f:
+        streams = load_streams(f)
+    sys.exit(0 if run(streams) else 1)
@@ -0,0 +1,144 @@
+"""
+Framing, decoding and encoding throughput on synthetic streams.
+
+For every profile in synthetic.PROFILES the stream is cut into socket
+sized chunks and run through the splitters, then every packet is
+decoded and encoded again. Results are printed and written as JSON so
+runs of different versions can be compared:
+
+    python -m hearthy.benchmark.protocol -o before.json
+"""
+
+import json
+import platform
+import sys
+import time
+
+from google.protobuf import __version__ as protobuf_version
+from google.protobuf.internal import api_implementation
+
+from hearthy.benchmark import synthetic
+from hearthy.protocol.decoder import decode_packet, encode_packet
+from hearthy.protocol.registry import messages_by_id
+from hearthy.protocol.splitter import Splitter
+from modern_hearthy.protocol.splitter import ModernSplitter
+
+def _best_of(rounds, fun, *args):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        fun(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _result(elapsed, n_bytes, n_packets):
+    elapsed = max(elapsed, 1e-9)
+    return {
+        'bytes': n_bytes,
+        'packets': n_packets,
+        'seconds': elapsed,
+        'mb_per_s': n_bytes / elapsed / 1e6,
+        'packets_per_s': n_packets / elapsed
+    }
+
+def _split(splitter_type, chunks):
+    splitter = splitter_type()
+    for chunk in chunks:
+        for atype, buf in splitter.feed(chunk):
+            pass
+
+def _decode(atype, bufs):
+    for buf in bufs:
+        decode_packet(atype, buf)
+
+def _encode(messages):
+    out = bytearray()
+    for message in messages:
+        encode_packet(message, out)
+
+def _type_name(atype):
+    try:
+        return messages_by_id.name(atype)
+    except KeyError:
+        return str(atype)
+
+def bench_profile(profile, n_packets=5000, rounds=5, seed=0):
+    messages = list(synthetic.generate(profile, n_packets, seed))
+    frames = synthetic.frames(messages)
+    data = synthetic.stream(messages)
+    chunks = synthetic.chunks(data, seed=seed)
+
+    ret = {
+        'chunks': len(chunks),
+        'splitter': {},
+        'decode': {},
+        'encode': {}
+    }
+    for name, splitter_type in (('Splitter', Splitter), ('ModernSplitter', ModernSplitter)):
+        elapsed = _best_of(rounds, _split, splitter_type, chunks)
+        ret['splitter'][name] = _result(elapsed, len(data), len(frames))
+
+    by_type = {}
+    for message, (atype, buf) in zip(messages, frames):
+        by_type.setdefault(atype, ([], []))
+        by_type[atype][0].append(message)
+        by_type[atype][1].append(buf)
+
+    for atype, (type_messages, bufs) in sorted(by_type.items()):
+        name = _type_name(atype)
+        n_bytes = sum(map(len, bufs))
+        elapsed = _best_of(rounds, _decode, atype, bufs)
+        ret['decode'][name] = _result(elapsed, n_bytes, len(bufs))
+        elapsed = _best_of(rounds, _encode, type_messages)
+        ret['encode'][name] = _result(elapsed, n_bytes, len(bufs))
+
+    return ret
+
+def run(profiles=None, n_packets=5000, rounds=5, seed=0):
+    if profiles is None:
+        profiles = sorted(synthetic.PROFILES)
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'protobuf': protobuf_version,
+            'protobuf_backend': api_implementation.Type()
+        },
+        'parameters': {
+            'packets': n_packets,
+            'rounds': rounds,
+            'seed': seed
+        },
+        'profiles': {profile: bench_profile(profile, n_packets, rounds, seed)
+                     for profile in profiles}
+    }
+
+def print_results(results, file=sys.stdout):
+    line = '  {0:<24} {1:>10.1f} MB/s {2:>12.0f} packets/s'
+    for profile, result in sorted(results['profiles'].items()):
+        print('{0} ({1} chunks)'.format(profile, result['chunks']), file=file)
+        for section in ('splitter', 'decode', 'encode'):
+            print(' ' + section, file=file)
+            for name, r in sorted(result[section].items()):
+                print(line.format(name, r['mb_per_s'], r['packets_per_s']), file=file)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Protocol throughput benchmark')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('-p', '--profile', action='append', choices=sorted(synthetic.PROFILES),
+                        help='profile to run, may be repeated (default: all)')
+    parser.add_argument('-n', '--packets', type=int, default=5000,
+                        help='packets per profile (default: %(default)s)')
+    parser.add_argument('-r', '--rounds', type=int, default=5,
+                        help='best of this many rounds (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(args.profile, args.packets, args.rounds, args.seed)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,50 @@
+"""
+Measures how the splitter scales with the number of frames per chunk.
+
+The time spent per frame should stay flat when going from one to
+thousands of frames per fed chunk.
+"""
+
+import struct
+import time
+
+from hearthy.protocol.splitter import Splitter
+
+def make_chunk(n_frames, payload_len=32):
+    frame = struct.pack('<II', 1, payload_len) + bytes(payload_len)
+    return frame * n_frames
+
+def bench_chunk(n_frames, payload_len=32, total_frames=200000):
+    chunk = make_chunk(n_frames, payload_len)
+    rounds = max(1, total_frames // n_frames)
+    splitter = Splitter()
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        for atype, buf in splitter.feed(chunk):
+            pass
+    elapsed = time.perf_counter() - start
+
+    return elapsed * 1e9 / (rounds * n_frames)
+
+def bench_straddling(n_frames, payload_len=32, total_frames=200000, read_size=1000):
+    """ Same stream, but cut at arbitrary offsets so frames span chunks. """
+    data = make_chunk(n_frames, payload_len)
+    chunks = [data[i:i+read_size] for i in range(0, len(data), read_size)]
+    rounds = max(1, total_frames // n_frames)
+    splitter = Splitter()
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        for chunk in chunks:
+            for atype, buf in splitter.feed(chunk):
+                pass
+    elapsed = time.perf_counter() - start
+
+    return elapsed * 1e9 / (rounds * n_frames)
+
+if __name__ == '__main__':
+    print('{0:>8} {1:>14} {2:>14}'.format('frames', 'ns/frame', 'ns/frame (cut)'))
+    for n_frames in (1, 10, 100, 1000, 10000, 100000):
+        print('{0:8} {1:14.1f} {2:14.1f}'.format(
+            n_frames, bench_chunk(n_frames), bench_straddling(n_frames)))
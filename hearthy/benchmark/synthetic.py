@@ -0,0 +1,112 @@
+"""
+Builds synthetic pegasus packet streams for benchmarking.
+
+The packets are not a playable game, but have the shape of real
+traffic: a burst of full entities at game start followed by turns of
+tag changes, options and the odd chat or ping packet.
+"""
+
+import random
+import struct
+
+from pegasus.game_pb2 import (
+    AllOptions, PowerHistory, TurnTimer, UserUI, Ping
+    )
+
+# Tags commonly seen on entities, the zone is added separately
+_ENTITY_TAGS = (45, 47, 48, 50, 53, 202, 203, 263, 313, 466, 479)
+_CHANGE_TAGS = (44, 45, 47, 48, 49, 263, 1068, 43, 18, 20)
+_CARD_IDS = ('CS2_231', 'EX1_001', 'GVG_001', 'CS2_172', 'EX1_tk28', 'NEW1_008',
+             'EX1_116', 'CS2_189', 'OG_123', 'AT_132')
+
+def _power_history(rnd, n_entries, first_entity, full_ratio):
+    packet = PowerHistory()
+    for i in range(n_entries):
+        entry = packet.list.add()
+        if rnd.random() < full_ratio:
+            e = entry.full_entity
+            e.entity = first_entity + i
+            e.name = rnd.choice(_CARD_IDS)
+            e.tags.add(name=49, value=rnd.randrange(1, 7))
+            for tag in rnd.sample(_ENTITY_TAGS, 8):
+                e.tags.add(name=tag, value=rnd.randrange(0, 12))
+        elif rnd.random() < 0.1:
+            e = entry.show_entity
+            e.entity = rnd.randrange(4, first_entity + n_entries)
+            e.name = rnd.choice(_CARD_IDS)
+            for tag in rnd.sample(_ENTITY_TAGS, 4):
+                e.tags.add(name=tag, value=rnd.randrange(0, 12))
+        else:
+            change = entry.tag_change
+            change.entity = rnd.randrange(1, first_entity + n_entries)
+            change.tag = rnd.choice(_CHANGE_TAGS)
+            change.value = rnd.randrange(0, 30)
+    return packet
+
+def _all_options(rnd, turn):
+    packet = AllOptions(id=turn)
+    for i in range(rnd.randrange(1, 12)):
+        option = packet.options.add(type=3)
+        option.main_option.id = rnd.randrange(4, 80)
+        option.main_option.targets.extend(rnd.sample(range(4, 80), rnd.randrange(0, 8)))
+    return packet
+
+def _user_ui(rnd):
+    packet = UserUI()
+    packet.emote = rnd.randrange(0, 8)
+    packet.player_id = rnd.randrange(1, 3)
+    return packet
+
+# packet mix per profile: relative weights of (power history, options, other)
+PROFILES = {
+    'mixed': (4, 2, 3),
+    'power': (20, 1, 1),
+    'options': (1, 20, 1),
+}
+
+def generate(profile='mixed', n_packets=1000, seed=0):
+    """ Yields n_packets messages of the given profile. """
+    weights = PROFILES[profile]
+    rnd = random.Random(seed)
+
+    # game start: lots of full entities
+    yield _power_history(rnd, 80, 4, 1.0)
+
+    next_entity = 84
+    for i in range(1, n_packets):
+        kind = rnd.choices(range(3), weights)[0]
+        if kind == 0:
+            n = rnd.randrange(1, 40)
+            yield _power_history(rnd, n, next_entity, 0.05)
+            next_entity += n
+        elif kind == 1:
+            yield _all_options(rnd, i)
+        elif rnd.random() < 0.5:
+            yield _user_ui(rnd)
+        elif rnd.random() < 0.5:
+            yield TurnTimer(seconds=75, turn=i, show=True)
+        else:
+            yield Ping()
+
+def frames(messages):
+    """ Returns a list of (packet type, serialized message). """
+    return [(m.ID, m.SerializePartialToString()) for m in messages]
+
+def stream(messages):
+    """ Returns the messages framed into a single byte string. """
+    return b''.join(struct.pack('<II', atype, len(data)) + data
+                    for atype, data in frames(messages))
+
+def chunks(data, mss=1448, seed=0):
+    """
+    Cuts data the way it arrives from a socket: mostly full segments,
+    sometimes a short one, so frames regularly span chunks.
+    """
+    rnd = random.Random(seed)
+    ret = []
+    pos = 0
+    while pos < len(data):
+        n = mss if rnd.random() < 0.8 else rnd.randrange(1, mss)
+        ret.append(data[pos:pos+n])
+        pos += n
+    return ret
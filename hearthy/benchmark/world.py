@@ -0,0 +1,79 @@
+"""
+Compares the tag stores of hearthy.tracker.tagstore: memory per game
+with all games of a capture tracked at once, and replay throughput
+through a Processor.
+"""
+
+import gc
+import logging
+import time
+import tracemalloc
+
+from hearthy.benchmark.powerhistory import load_streams
+from hearthy.protocol import decoder
+from hearthy.tracker import tagstore
+from hearthy.tracker.processor import Processor
+from hearthy.tracker.world import World
+
+LAYOUTS = {
+    'dict': tagstore.DictTagStore,
+    'compact': tagstore.TagStore
+}
+
+def replay(games, layout):
+    """ Replays all games, returns their worlds. """
+    worlds = []
+    for packets in games:
+        p = Processor(wire=True)
+        p._world = World(LAYOUTS[layout]())
+        for who, packet in packets:
+            p.process(who, packet)
+        worlds.append(p._world)
+    return worlds
+
+def run(streams, rounds=3):
+    # decoded up front, only the tracker is measured
+    games = [[(who, decoder.decode_packet(atype, buf, interest=frozenset()))
+              for who, atype, buf in packets]
+             for packets in streams.values()]
+    n_packets = sum(map(len, games))
+
+    print('{0} games, {1} packets'.format(len(games), n_packets))
+    results = {}
+    for layout in LAYOUTS:
+        best = None
+        for i in range(rounds):
+            start = time.perf_counter()
+            replay(games, layout)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        gc.collect()
+        tracemalloc.start()
+        worlds = replay(games, layout)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        n_entities = sum(len(w._e) for w in worlds)
+        results[layout] = [{e.id: e._tags for e in w} for w in worlds]
+        print('{0:8} {1:8.1f} KB/game {2:6.0f} B/entity {3:10.0f} packets/s'.format(
+            layout, size / 1024 / max(len(games), 1), size / max(n_entities, 1),
+            n_packets / best))
+        del worlds
+
+    same = results['dict'] == results['compact']
+    print('worlds identical' if same else 'MISMATCH')
+    return same
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('Usage: {0} <hcapng file>'.format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with open(sys.argv[1], 'rb') as f:
+        streams = load_streams(f)
+    sys.exit(0 if run(streams) else 1)
@@ -1,6 +1,10 @@
 import re
+import time
+
+from . import hcapng
 from ..protocol.decoder import decode_packet
-from ..protocol.utils import hexdump, Splitter
+from ..protocol.utils import hexdump
+from ..protocol.splitter import Splitter
 
 READ_BUFSIZE = 16 * 1024
 
@@ -26,40 +30,92 @@ def tokenizer(f):
     if leftover:
         yield leftover
 
-def parse_cdump(f):
-    t = tokenizer(f)
+class CDumpException(Exception):
+    """ Raised on malformed C array dumps """
+    pass
 
-    header = next(t, None)
-    ret = []
+_HEAD = re.compile(r'char\s+peer(\d+)_(\d+)\s*\[\]\s*=\s*\{')
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_HEX = re.compile(r'0x([0-9a-fA-F]+)')
+_NOT_HEX = str.maketrans('', '', ' \t\r\n,')
 
-    while header != None:
-        assert(header == 'char')
+def _block_bytes(body):
+    body = _COMMENT.sub('', body)
+    try:
+        buf = bytes.fromhex(body.replace('0x', '').translate(_NOT_HEX))
+    except ValueError:
+        buf = None
+    # a byte written with a single digit would shift all others
+    if buf is not None and len(buf) == body.count('0x'):
+        return buf
 
-        # peerN_N[] where N is some decimal?
-        peer = next(t, None)
-        assert(peer.startswith('peer'))
-        assert(peer.endswith('[]'))
-        p,n = map(int, peer[4:-2].split('_'))
+    if _HEX.sub('', body).translate(_NOT_HEX):
+        raise CDumpException('Unexpected tokens in array')
+    try:
+        return bytes(int(x, 16) for x in _HEX.findall(body))
+    except ValueError as e:
+        raise CDumpException('Bad array contents: {0}'.format(e))
 
-        assert(next(t) == '=')
-        assert(next(t) == '{')
+def parse_cdump(f):
+    """
+    Yields (peer, sequence, data) for every peerN_M[] array in a
+    Wireshark "C Arrays" dump, as soon as the array has been read.
+    """
+    parts = []
+    last = ''
+    while True:
+        chunk = f.read(READ_BUFSIZE)
+        if not chunk:
+            break
+        parts.append(chunk)
 
-        l = []
+        # only look for arrays once one can have been completed
+        completed = '};' in chunk or (last == '}' and chunk[0] == ';')
+        last = chunk[-1]
+        if not completed:
+            continue
+
+        buf = ''.join(parts)
+        pos = 0
         while True:
-            a = next(t)
-            if a == '};':
+            m = _HEAD.search(buf, pos)
+            if m is None:
+                break
+            end = buf.find('};', m.end())
+            if end < 0:
                 break
-            l.append(int(a.rstrip(','), 16))
+            yield (int(m.group(1)), int(m.group(2)), _block_bytes(buf[m.end():end]))
+            pos = end + 2
+        parts = [buf[pos:]]
 
-        yield (p, n, bytes(l))
-        header = next(t, None)
+    if 'peer' in _COMMENT.sub('', ''.join(parts)):
+        raise CDumpException('Unexpected EOF')
+
+def to_hcapng(f, out, ts=None, source=('0.0.0.0', 0), dest=('0.0.0.0', 0), stream_id=0):
+    """
+    Converts a C array dump into an hcapng capture with a single
+    connection. Arrays of peer 0 are sent by source. The dump has no
+    timing information, so all events are at time 0.
+    """
+    if ts is None:
+        ts = int(time.time())
+    writer = hcapng.Writer(out, ts)
+    writer.new_connection(0, stream_id, source, dest)
+    for p, n, buf in parse_cdump(f):
+        writer.data(0, stream_id, p, buf)
+    writer.close_connection(0, stream_id)
 
 if __name__ == '__main__':
     import sys
     if len(sys.argv) < 2:
-        print('Usage: {0} <file>'.format(sys.argv[0]), file=sys.stderr)
+        print('Usage: {0} <file> [hcapng output]'.format(sys.argv[0]), file=sys.stderr)
         sys.exit(1)
 
+    if len(sys.argv) > 2:
+        with open(sys.argv[1], 'r') as f, open(sys.argv[2], 'wb') as out:
+            to_hcapng(f, out)
+        sys.exit(0)
+
     with open(sys.argv[1], 'r') as f:
         s = Splitter()
         for p, n, buf in parse_cdump(f):
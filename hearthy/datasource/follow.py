@@ -0,0 +1,180 @@
+"""
+Follows capture files that are still being written.
+
+A Follower hands out whatever has been appended to a file since the
+last read and blocks until there is more, using inotify on Linux and
+polling elsewhere. FollowThread feeds it through an AsyncParser and
+puts the events into a bounded queue in batches, so a slow consumer
+holds back reading instead of piling up events.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import threading
+import time
+
+from . import hcapng
+
+MIN_READ = 64 * 1024
+MAX_READ = 4 * 1024 * 1024
+POLL_INTERVAL = 0.1
+
+# from <sys/inotify.h>
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+
+class _Inotify:
+    """ Minimal inotify watch on a single file. """
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_ATTRIB
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # the events themselves don't matter, only that there were some
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        return bool(readable)
+
+    def close(self):
+        os.close(self.fd)
+
+def _watch(path):
+    try:
+        return _Inotify(path)
+    except (OSError, AttributeError, TypeError):
+        # no inotify (not Linux, or no libc to be found)
+        return None
+
+class Follower:
+    """
+    Reads a growing file. The read size adapts to the rate the file
+    grows at: it doubles while reads come back full and halves when
+    they come back mostly empty.
+    """
+    def __init__(self, path, min_read=MIN_READ, max_read=MAX_READ,
+                 poll_interval=POLL_INTERVAL):
+        self._f = open(path, 'rb', buffering=0)
+        self._watch = _watch(path)
+        self._min_read = min_read
+        self._max_read = max_read
+        self._read_size = min_read
+        self._poll_interval = poll_interval
+
+    @property
+    def uses_inotify(self):
+        return self._watch is not None
+
+    def read(self):
+        """ Returns the data appended since the last read, b'' if none. """
+        buf = self._f.read(self._read_size)
+        if buf is None:
+            return b''
+        if len(buf) == self._read_size:
+            self._read_size = min(self._read_size * 2, self._max_read)
+        elif len(buf) < self._read_size // 2:
+            self._read_size = max(self._read_size // 2, self._min_read)
+        return buf
+
+    def wait(self, timeout=None):
+        """
+        Waits up to timeout seconds (or the poll interval) for the file
+        to change. May return early, so read can come back empty.
+        """
+        if timeout is None:
+            timeout = self._poll_interval
+        if self._watch is not None:
+            # returns as soon as the file is written to
+            self._watch.wait(timeout)
+        else:
+            time.sleep(min(timeout, self._poll_interval))
+
+    def chunks(self, stop=None):
+        """ Yields data as it is appended, until stop (an Event) is set. """
+        while stop is None or not stop.is_set():
+            buf = self.read()
+            if buf:
+                yield buf
+            else:
+                self.wait()
+
+    def close(self):
+        self._f.close()
+        if self._watch is not None:
+            self._watch.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class FollowThread(threading.Thread):
+    """
+    Parses a growing capture in the background. Every chunk read
+    becomes one list of (time, event) on self.queue; when the queue
+    is full the thread stops reading until the consumer catches up.
+    A parse error is put on the queue as the exception instance.
+    """
+    def __init__(self, path, maxsize=64, **kwargs):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxsize)
+        self._follower = Follower(path, **kwargs)
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _put(self, item):
+        while not self._stopping.is_set():
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def run(self):
+        parser = hcapng.AsyncParser()
+        try:
+            with self._follower as follower:
+                for buf in follower.chunks(self._stopping):
+                    batch = list(parser.feed_buf(buf))
+                    if batch:
+                        self._put(batch)
+        except Exception as e:
+            self._put(e)
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('Usage: {0} <hcapng file>'.format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+
+    t = FollowThread(sys.argv[1])
+    t.start()
+    try:
+        while True:
+            batch = t.queue.get()
+            if isinstance(batch, Exception):
+                raise batch
+            for ts, event in batch:
+                print('[{0:8}] {1!r}'.format(ts, event))
+    except KeyboardInterrupt:
+        t.stop()
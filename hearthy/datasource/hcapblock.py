@@ -0,0 +1,396 @@
+"""
+Block compressed captures (HCaptureV1).
+
+The events are the same as in HCaptureV0, but written into blocks of
+about BLOCK_SIZE bytes that are compressed independently:
+
+    header     'HCaptureV1\\0', <q timestamp, <B codec
+    block      <BII kind (0), compressed length, raw length, data
+    ...
+    directory  <BII kind (1), length, entry count, then per block
+               <QIIqqII offset, compressed length, raw length,
+               first and last event time, event count, stream count
+               followed by the <I stream ids in the block
+    trailer    <Q directory offset, 'HCapDir\\0'
+
+A block only holds whole events, so the raw contents of a block are
+V0 events back to back. Readers going through the file front to back
+stop at the directory; BlockReader uses it to only decompress the
+blocks holding a stream or time window.
+"""
+
+import lzma
+import os
+import struct
+import zlib
+
+from . import hcapng
+
+VERSION = b'HCaptureV1\x00'
+CODEC_NONE, CODEC_ZLIB, CODEC_LZMA = range(3)
+CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA}
+
+BLOCK_SIZE = 256 * 1024
+# Sanity check for readers, we don't want unbounded buffer sizes
+MAX_BLOCK = 16 * 1024 * 1024
+
+KIND_BLOCK, KIND_DIRECTORY = range(2)
+
+_HEADER = struct.Struct('<qB')
+_BLOCK = struct.Struct('<BII')
+_ENTRY = struct.Struct('<QIIqqII')
+_TRAILER = struct.Struct('<Q8s')
+TRAILER_MAGIC = b'HCapDir\x00'
+
+HEADER_SIZE = len(VERSION) + _HEADER.size
+
+def _compress(codec, level, data):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, level)
+    elif codec == CODEC_LZMA:
+        return lzma.compress(data, preset=level)
+    elif codec == CODEC_NONE:
+        return bytes(data)
+    raise hcapng.HCapException('Unknown codec {0}'.format(codec))
+
+class _Identity:
+    def decompress(self, data, max_length=-1):
+        return bytes(data)
+
+def _decompressor(codec):
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    elif codec == CODEC_LZMA:
+        return lzma.LZMADecompressor()
+    elif codec == CODEC_NONE:
+        return _Identity()
+    raise hcapng.HCapException('Unknown codec {0}'.format(codec))
+
+def _check_block(kind, length, raw_length):
+    if kind != KIND_BLOCK:
+        raise hcapng.HCapException('Unknown block kind {0}'.format(kind))
+    if length > MAX_BLOCK or raw_length > MAX_BLOCK:
+        raise hcapng.HCapException('Block of {0} bytes exceeds maximum of {1}'.format(
+            max(length, raw_length), MAX_BLOCK))
+
+def _inflate(decompressor, data, limit):
+    """ Decompresses data, failing if it makes more than limit bytes. """
+    # one byte more than allowed tells an oversized block apart
+    out = decompressor.decompress(data, limit + 1)
+    if len(out) > limit:
+        raise hcapng.HCapException('Block decompresses to more than its declared size')
+    return out
+
+def _check_raw_length(out_length, raw_length):
+    if out_length != raw_length:
+        raise hcapng.HCapException('Block decompressed to {0} bytes instead of {1}'.format(
+            out_length, raw_length))
+
+class BlockInfo:
+    __slots__ = ['offset', 'length', 'raw_length', 'start', 'end', 'events', 'streams']
+
+    def __init__(self, offset, length, raw_length, start, end, events, streams):
+        self.offset = offset
+        self.length = length
+        self.raw_length = raw_length
+        # times of the first and last event
+        self.start = start
+        self.end = end
+        self.events = events
+        self.streams = streams
+
+    def __repr__(self):
+        return '<BlockInfo offset={0} length={1}/{2} time={3}-{4} streams={5}>'.format(
+            self.offset, self.length, self.raw_length, self.start, self.end,
+            len(self.streams))
+
+class Writer(hcapng.Writer):
+    """
+    Same interface as hcapng.Writer, close() must be called at the
+    end to write out the last block and the directory.
+    """
+    def __init__(self, stream, ts, codec=CODEC_ZLIB, level=6, block_size=BLOCK_SIZE):
+        self._stream = stream
+        self._codec = codec
+        self._level = level
+        self._block_size = block_size
+        self._offset = HEADER_SIZE
+        self._blocks = []
+        self._buf = bytearray()
+        self._start = self._end = None
+        self._events = 0
+        self._streams = set()
+
+        # fail early on bad arguments
+        _compress(codec, level, b'')
+        if block_size + hcapng.MAX_EVLEN > MAX_BLOCK:
+            raise hcapng.HCapException('Block size {0} too large'.format(block_size))
+        stream.write(VERSION + _HEADER.pack(ts, codec))
+
+    def _write(self, evtime, evtype, *parts):
+        evlen = hcapng.PREFIX_LEN + sum(map(len, parts))
+        event = struct.pack('<IqB', evlen, evtime, evtype) + b''.join(parts)
+        self.write_raw(evtime, struct.unpack_from('<I', event, hcapng.PREFIX_LEN)[0], event)
+
+    def write_raw(self, evtime, stream_id, event):
+        """ Adds an event already serialized in the V0 format. """
+        if self._start is None:
+            self._start = evtime
+        self._end = evtime
+        self._events += 1
+        self._streams.add(stream_id)
+        self._buf += event
+        if len(self._buf) >= self._block_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the pending events as a block. """
+        if not self._buf:
+            return
+        data = _compress(self._codec, self._level, self._buf)
+        self._stream.write(_BLOCK.pack(KIND_BLOCK, len(data), len(self._buf)))
+        self._stream.write(data)
+
+        self._blocks.append(BlockInfo(self._offset, len(data), len(self._buf),
+                                      self._start, self._end, self._events,
+                                      frozenset(self._streams)))
+        self._offset += _BLOCK.size + len(data)
+        self._buf = bytearray()
+        self._start = self._end = None
+        self._events = 0
+        self._streams = set()
+
+    def close(self):
+        self.flush()
+        directory = bytearray()
+        for b in self._blocks:
+            directory += _ENTRY.pack(b.offset, b.length, b.raw_length, b.start, b.end,
+                                     b.events, len(b.streams))
+            directory += struct.pack('<{0}I'.format(len(b.streams)), *sorted(b.streams))
+        self._stream.write(_BLOCK.pack(KIND_DIRECTORY, len(directory), len(self._blocks)))
+        self._stream.write(directory)
+        self._stream.write(_TRAILER.pack(self._offset, TRAILER_MAGIC))
+
+class BlockStream:
+    """
+    Decodes the blocks following the header from data fed in pieces
+    of any size. Only one block is decompressed at a time and its
+    output goes through an event parser right away.
+    """
+    def __init__(self, codec):
+        _decompressor(codec)
+        self._codec = codec
+        self._header = bytearray()
+        self._remaining = 0
+        # decompressed bytes still expected from the current block
+        self._raw_remaining = 0
+        self._decompressor = None
+        self._parser = hcapng.AsyncParser(header=False)
+        self.done = False
+
+    @property
+    def partial(self):
+        """ Whether the data fed so far ends within a block. """
+        return bool(self._remaining or self._header)
+
+    def feed(self, buf):
+        buf = memoryview(buf)
+        pos = 0
+        while pos < len(buf) and not self.done:
+            if self._remaining == 0:
+                take = min(_BLOCK.size - len(self._header), len(buf) - pos)
+                self._header += buf[pos:pos+take]
+                pos += take
+                if len(self._header) < _BLOCK.size:
+                    break
+
+                kind, length, raw_length = _BLOCK.unpack(self._header)
+                self._header.clear()
+                if kind == KIND_DIRECTORY:
+                    # the rest is only needed for random access
+                    self.done = True
+                    break
+                _check_block(kind, length, raw_length)
+                self._remaining = length
+                self._raw_remaining = raw_length
+                self._decompressor = _decompressor(self._codec)
+            else:
+                take = min(self._remaining, len(buf) - pos)
+                out = _inflate(self._decompressor, buf[pos:pos+take], self._raw_remaining)
+                pos += take
+                self._remaining -= take
+                if self._remaining == 0:
+                    if hasattr(self._decompressor, 'flush'):
+                        out += self._decompressor.flush()
+                    _check_raw_length(len(out), self._raw_remaining)
+                self._raw_remaining -= len(out)
+                yield from self._parser.feed_buf(out)
+
+def parse_stream(stream):
+    """
+    Yields the events of a V1 capture read front to back, the
+    version magic having been read already.
+    """
+    buf = stream.read(_HEADER.size)
+    if len(buf) < _HEADER.size:
+        raise hcapng.TruncatedException('Unexpected EOF!')
+    ts, codec = _HEADER.unpack(buf)
+    yield (0, hcapng.EvHeader(ts))
+
+    blocks = BlockStream(codec)
+    while not blocks.done:
+        buf = stream.read(hcapng.MAX_BUF)
+        if not buf:
+            if blocks.partial:
+                raise hcapng.TruncatedException('Unexpected EOF!')
+            break
+        yield from blocks.feed(buf)
+
+class BlockReader:
+    """
+    Random access to a V1 capture in a seekable file, through the
+    block directory.
+    """
+    def __init__(self, f):
+        self._f = f
+        f.seek(0)
+        version = f.read(len(VERSION))
+        if version != VERSION:
+            raise hcapng.HCapException('Expected to read {0!r} but got {1!r}'.format(
+                VERSION, version))
+        self.ts, self._codec = _HEADER.unpack(f.read(_HEADER.size))
+        self.blocks = self._read_directory()
+
+    def _read_directory(self):
+        f = self._f
+        size = f.seek(0, os.SEEK_END)
+        if size >= HEADER_SIZE + _TRAILER.size:
+            f.seek(size - _TRAILER.size)
+            offset, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic == TRAILER_MAGIC:
+                f.seek(offset)
+                kind, length, count = _BLOCK.unpack(f.read(_BLOCK.size))
+                if kind != KIND_DIRECTORY:
+                    raise hcapng.HCapException('Bad directory offset {0}'.format(offset))
+                return self._parse_directory(f.read(length), count)
+
+        # no directory, e.g. the writer did not finish
+        return self._scan_blocks(size)
+
+    def _parse_directory(self, buf, count):
+        blocks = []
+        pos = 0
+        for i in range(count):
+            offset, length, raw_length, start, end, events, n = _ENTRY.unpack_from(buf, pos)
+            pos += _ENTRY.size
+            streams = frozenset(struct.unpack_from('<{0}I'.format(n), buf, pos))
+            pos += 4 * n
+            blocks.append(BlockInfo(offset, length, raw_length, start, end, events, streams))
+        return blocks
+
+    def _scan_blocks(self, size):
+        blocks = []
+        offset = HEADER_SIZE
+        while offset + _BLOCK.size <= size:
+            self._f.seek(offset)
+            kind, length, raw_length = _BLOCK.unpack(self._f.read(_BLOCK.size))
+            if kind == KIND_DIRECTORY or offset + _BLOCK.size + length > size:
+                break
+            info = BlockInfo(offset, length, raw_length, None, None, 0, None)
+            streams = set()
+            for evtime, event in self._events(info):
+                if info.start is None:
+                    info.start = evtime
+                info.end = evtime
+                info.events += 1
+                streams.add(event.stream_id)
+            info.streams = frozenset(streams)
+            blocks.append(info)
+            offset += _BLOCK.size + length
+        return blocks
+
+    def read_block(self, info):
+        """ Returns the raw (decompressed) contents of a block. """
+        self._f.seek(info.offset)
+        kind, length, raw_length = _BLOCK.unpack(self._f.read(_BLOCK.size))
+        _check_block(kind, length, raw_length)
+        data = self._f.read(length)
+        if len(data) < length:
+            raise hcapng.TruncatedException('Unexpected EOF!')
+        if self._codec == CODEC_NONE:
+            out = data
+        else:
+            decompressor = _decompressor(self._codec)
+            out = _inflate(decompressor, data, raw_length)
+            if hasattr(decompressor, 'flush'):
+                out += decompressor.flush()
+        _check_raw_length(len(out), raw_length)
+        return out
+
+    def _events(self, info):
+        return hcapng.decode_events(self.read_block(info))
+
+    def select(self, stream_id=None, start=None, end=None):
+        """ Returns the blocks that may hold events matching the arguments. """
+        return [b for b in self.blocks
+                if (stream_id is None or stream_id in b.streams) and
+                   (start is None or b.end >= start) and
+                   (end is None or b.start < end)]
+
+    def events(self, stream_id=None, start=None, end=None):
+        """
+        Yields (time, event) for the events of stream_id (if given)
+        with start <= time < end, decompressing only the blocks
+        that can contain them.
+        """
+        for info in self.select(stream_id, start, end):
+            for evtime, event in self._events(info):
+                if ((stream_id is None or event.stream_id == stream_id) and
+                    (start is None or evtime >= start) and
+                    (end is None or evtime < end)):
+                    yield (evtime, event)
+
+def compress(src, dst, codec=CODEC_ZLIB, level=6, block_size=BLOCK_SIZE):
+    """ Converts the V0 capture in file src into a V1 capture written to dst. """
+    with hcapng.Reader(src) as reader:
+        writer = Writer(dst, reader.ts, codec, level, block_size)
+        for pos, evlen, evtime, evtype in reader.scan():
+            writer.write_raw(evtime, reader.stream_id_at(pos), reader.raw_event(pos))
+        writer.close()
+
+def decompress(src, dst):
+    """ Converts the V1 capture in file src into a V0 capture written to dst. """
+    reader = BlockReader(src)
+    dst.write(hcapng.EXPECTED_VERSION + struct.pack('<q', reader.ts))
+    for info in reader.blocks:
+        # blocks hold V0 events verbatim
+        dst.write(reader.read_block(info))
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert between HCaptureV0 and V1')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('compress', help='V0 to block compressed V1')
+    p.add_argument('src')
+    p.add_argument('dst')
+    p.add_argument('--codec', choices=sorted(CODECS), default='zlib')
+    p.add_argument('--level', type=int, default=6)
+    p.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    p = sub.add_parser('decompress', help='V1 to V0')
+    p.add_argument('src')
+    p.add_argument('dst')
+    p = sub.add_parser('info', help='list the blocks of a V1 capture')
+    p.add_argument('src')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        with open(args.src, 'rb') as f:
+            for info in BlockReader(f).blocks:
+                print(info)
+    else:
+        with open(args.src, 'rb') as src, open(args.dst, 'wb') as dst:
+            if args.command == 'compress':
+                compress(src, dst, CODECS[args.codec], args.level, args.block_size)
+            else:
+                decompress(src, dst)
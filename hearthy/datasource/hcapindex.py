@@ -0,0 +1,216 @@
+"""
+Sidecar seek index for hcapng captures.
+
+The index of capture.hcapng lives in capture.hcapng.idx and records
+for every stream the offsets of its events and its open/close times,
+plus (time, offset) checkpoints every CHECKPOINT_INTERVAL ms. It is
+built in one pass over the event prefixes and extended from where it
+left off when the capture has grown since.
+"""
+
+import array
+import bisect
+import os
+import struct
+import sys
+
+from . import hcapng
+
+INDEX_VERSION = b'HCapIndexV0\x00'
+CHECKPOINT_INTERVAL = 10 * 1000
+
+# capture ts, indexed up to, checkpoint and stream count
+_HEADER = struct.Struct('<qQII')
+# stream id, open time, close time, event count
+_STREAM = struct.Struct('<IqqI')
+
+def _write_array(f, a):
+    if sys.byteorder != 'little':
+        a = array.array(a.typecode, a)
+        a.byteswap()
+    f.write(a.tobytes())
+
+def _read_array(buf, pos, typecode, n):
+    a = array.array(typecode)
+    end = pos + n * a.itemsize
+    a.frombytes(buf[pos:end])
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a, end
+
+class StreamInfo:
+    __slots__ = ['stream_id', 'start', 'end', 'offsets']
+
+    def __init__(self, stream_id, start):
+        self.stream_id = stream_id
+        # times of the first and the closing event, end is
+        # None while the stream is open
+        self.start = start
+        self.end = None
+        self.offsets = array.array('Q')
+
+    def __repr__(self):
+        return '<StreamInfo stream_id={0} start={1} end={2} events={3}>'.format(
+            self.stream_id, self.start, self.end, len(self.offsets))
+
+class Index:
+    def __init__(self, ts):
+        self.ts = ts
+        # offset up to which the capture has been indexed
+        self.end = hcapng.HEADER_SIZE
+        self.streams = {}
+        self.checkpoint_times = array.array('q')
+        self.checkpoint_offsets = array.array('Q')
+
+    def matches(self, reader):
+        """ Whether the index belongs to the capture (or a prefix of it). """
+        return self.ts == reader.ts and self.end <= len(reader)
+
+    def update(self, reader):
+        """
+        Indexes the events added to the capture since the last update.
+        A trailing partial event is left for the next update.
+        Returns whether anything was added.
+        """
+        streams = self.streams
+        times = self.checkpoint_times
+        next_checkpoint = times[-1] + CHECKPOINT_INTERVAL if times else None
+        start = self.end
+
+        try:
+            for pos, evlen, evtime, evtype in reader.scan(self.end):
+                if next_checkpoint is None or evtime >= next_checkpoint:
+                    times.append(evtime)
+                    self.checkpoint_offsets.append(pos)
+                    next_checkpoint = evtime + CHECKPOINT_INTERVAL
+
+                stream_id = reader.stream_id_at(pos)
+                info = streams.get(stream_id, None)
+                if info is None:
+                    info = streams[stream_id] = StreamInfo(stream_id, evtime)
+                info.offsets.append(pos)
+                if evtype == hcapng.EV_CLOSE:
+                    info.end = evtime
+
+                self.end = pos + evlen
+        except hcapng.TruncatedException:
+            pass
+
+        return self.end != start
+
+    def offset_at(self, t):
+        """ Returns an event offset at or before the first event at time t. """
+        # all events before a checkpoint are older than it
+        i = bisect.bisect_right(self.checkpoint_times, t) - 1
+        if i < 0:
+            return hcapng.HEADER_SIZE
+        return self.checkpoint_offsets[i]
+
+    def stream_events(self, reader, stream_id):
+        """ Yields (time, event) of one stream, seeking from event to event. """
+        for offset in self.streams[stream_id].offsets:
+            yield reader.event_at(offset)
+
+    def window(self, reader, start, end):
+        """
+        Yields (time, event) for the events with start <= time < end.
+        Assumes event times do not decrease, as the proxies write them.
+        """
+        for evtime, event in reader.events(self.offset_at(start)):
+            if evtime >= end:
+                break
+            if evtime >= start:
+                yield (evtime, event)
+
+    def extract_stream(self, reader, stream_id, out):
+        """
+        Writes the events of one stream as a capture of their own,
+        copying them verbatim.
+        """
+        out.write(hcapng.EXPECTED_VERSION + struct.pack('<q', self.ts))
+        for offset in self.streams[stream_id].offsets:
+            out.write(reader.raw_event(offset))
+
+    def save(self, path):
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(INDEX_VERSION)
+            f.write(_HEADER.pack(self.ts, self.end, len(self.checkpoint_times),
+                                 len(self.streams)))
+            _write_array(f, self.checkpoint_times)
+            _write_array(f, self.checkpoint_offsets)
+            for stream_id, info in sorted(self.streams.items()):
+                end = -1 if info.end is None else info.end
+                f.write(_STREAM.pack(stream_id, info.start, end, len(info.offsets)))
+                _write_array(f, info.offsets)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Returns the index stored at path, None if there is no usable one. """
+        try:
+            with open(path, 'rb') as f:
+                buf = f.read()
+        except OSError:
+            return None
+
+        if not buf.startswith(INDEX_VERSION):
+            return None
+        try:
+            pos = len(INDEX_VERSION)
+            ts, end, n_checkpoints, n_streams = _HEADER.unpack_from(buf, pos)
+            pos += _HEADER.size
+
+            index = cls(ts)
+            index.end = end
+            index.checkpoint_times, pos = _read_array(buf, pos, 'q', n_checkpoints)
+            index.checkpoint_offsets, pos = _read_array(buf, pos, 'Q', n_checkpoints)
+            for i in range(n_streams):
+                stream_id, start, stream_end, n = _STREAM.unpack_from(buf, pos)
+                pos += _STREAM.size
+                info = index.streams[stream_id] = StreamInfo(stream_id, start)
+                info.end = None if stream_end < 0 else stream_end
+                info.offsets, pos = _read_array(buf, pos, 'Q', n)
+        except (struct.error, ValueError):
+            return None
+
+        if pos != len(buf):
+            return None
+        return index
+
+def sidecar_path(capture_path):
+    return capture_path + '.idx'
+
+def get_index(reader, capture_path, save=True):
+    """
+    Returns the index of the capture read by reader, loading the
+    sidecar file and bringing it up to date (or building it).
+    """
+    path = sidecar_path(capture_path)
+    index = Index.load(path)
+    if index is None or not index.matches(reader):
+        index = Index(reader.ts)
+    if index.update(reader) and save:
+        try:
+            index.save(path)
+        except OSError:
+            # e.g. a read only directory, the index is still usable
+            pass
+    return index
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 4):
+        print('Usage: {0} <hcapng file> [<stream id> <output file>]'.format(sys.argv[0]),
+              file=sys.stderr)
+        sys.exit(1)
+
+    with open(sys.argv[1], 'rb') as f, hcapng.Reader(f) as reader:
+        index = get_index(reader, sys.argv[1])
+        if len(sys.argv) == 2:
+            for stream_id, info in sorted(index.streams.items()):
+                print('stream {0:5}: {1:10} - {2:>10} ms, {3} events'.format(
+                    stream_id, info.start, '' if info.end is None else info.end,
+                    len(info.offsets)))
+        else:
+            with open(sys.argv[3], 'wb') as out:
+                index.extract_stream(reader, int(sys.argv[2]), out)
@@ -1,3 +1,4 @@
+import mmap
 import struct
 
 def _format_ipv4(ip):
@@ -10,19 +11,42 @@ def _format_ipv4(ip):
                                     (ip >> 16) & 0xff,
                                     (ip >> 24) & 0xff)
 
+def _parse_ipv4(ip):
+    """ Inverse of _format_ipv4. """
+    a, b, c, d = map(int, ip.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
 EV_NEW_CONNECTION, EV_CLOSE, EV_DATA = range(3)
 
 class HCapException(Exception):
     """ Base class for all exceptions thrown by hcapng.py """
     pass
 
+class TruncatedException(HCapException):
+    """ The capture ends in the middle of an event, e.g. while being written """
+    pass
+
+_NEW_CONNECTION = struct.Struct('<IIHIH')
+_DATA = struct.Struct('<IB')
+_CLOSE = struct.Struct('<I')
+
+def _check_size(fmt, start, end):
+    if end - start != fmt.size:
+        raise HCapException('Expected event of {0} bytes but got {1}'.format(
+            fmt.size, end - start))
+
 class EvNewConnection:
     __slots__ = ['stream_id', 'source', 'dest']
 
     @classmethod
     def decode(cls, buf):
+        return cls.decode_from(buf, 0, len(buf))
+
+    @classmethod
+    def decode_from(cls, buf, start, end):
+        _check_size(_NEW_CONNECTION, start, end)
         a = cls()
-        a.stream_id, saddr, source, daddr, dest = struct.unpack('<IIHIH', buf)
+        a.stream_id, saddr, source, daddr, dest = _NEW_CONNECTION.unpack_from(buf, start)
         a.source = (_format_ipv4(saddr), source)
         a.dest = (_format_ipv4(daddr), dest)
         return a
@@ -36,9 +60,16 @@ class EvData:
 
     @classmethod
     def decode(cls, buf):
+        return cls.decode_from(buf, 0, len(buf))
+
+    @classmethod
+    def decode_from(cls, buf, start, end):
+        """ data is a slice of buf, i.e. not a copy if buf is a memoryview """
+        if end - start < _DATA.size:
+            raise HCapException('Data event of only {0} bytes'.format(end - start))
         a = cls()
-        a.stream_id, a.who = struct.unpack('<IB', buf[:5])
-        a.data = buf[5:]
+        a.stream_id, a.who = _DATA.unpack_from(buf, start)
+        a.data = buf[start+_DATA.size:end]
         return a
 
     def __repr__(self):
@@ -50,8 +81,13 @@ class EvClose:
 
     @classmethod
     def decode(cls, buf):
+        return cls.decode_from(buf, 0, len(buf))
+
+    @classmethod
+    def decode_from(cls, buf, start, end):
+        _check_size(_CLOSE, start, end)
         a = cls()
-        a.stream_id = struct.unpack('<I', buf)[0]
+        a.stream_id = _CLOSE.unpack_from(buf, start)[0]
         return a
 
     def __repr__(self):
@@ -66,8 +102,10 @@ class EvHeader:
         return '<EvHeader ts={0}>'.format(self.ts)
 
 EXPECTED_VERSION = b'HCaptureV0\x00'
-def read_header(stream):
-    version = stream.read(len(EXPECTED_VERSION))
+def read_header(stream, version=None):
+    """ Reads the header, version is the magic if already read. """
+    if version is None:
+        version = stream.read(len(EXPECTED_VERSION))
     if version != EXPECTED_VERSION:
         raise HCapException('Expected to read {0!r} but got {1!r}'.format(
             EXPECTED_VERSION, version))
@@ -77,51 +115,277 @@ def read_header(stream):
 
 MAX_EVLEN = 16*1024
 PREFIX_LEN = 13
-def parse(stream):
-    timestamp = read_header(stream)
+HEADER_SIZE = len(EXPECTED_VERSION) + 8
+
+_PREFIX = struct.Struct('<IqB')
+_DECODERS = {
+    EV_NEW_CONNECTION: EvNewConnection.decode_from,
+    EV_DATA: EvData.decode_from,
+    EV_CLOSE: EvClose.decode_from
+}
+
+def _check_evlen(evlen):
+    # Sanity check, we don't want unbounded buffer sizes
+    if evlen > MAX_EVLEN:
+        raise HCapException('Event length {0} exceeds maximum of {1}'.format(
+            evlen, MAX_EVLEN))
+    if evlen < PREFIX_LEN:
+        raise HCapException('Event length {0} is shorter than its prefix'.format(evlen))
+
+def _decode_event(evtype, buf, start, end):
+    try:
+        decode = _DECODERS[evtype]
+    except KeyError:
+        raise HCapException('Got unknown event type 0x{0:02x}'.format(evtype))
+    return decode(buf, start, end)
+
+class Reader:
+    """
+    Reads a capture file through a memory mapping. The data of EvData
+    events is a memoryview into the mapping, nothing gets copied until
+    a consumer does so.
+    """
+    def __init__(self, f):
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        if self._view[:len(EXPECTED_VERSION)] != EXPECTED_VERSION:
+            version = bytes(self._view[:len(EXPECTED_VERSION)])
+            self.close()
+            raise HCapException('Expected to read {0!r} but got {1!r}'.format(
+                EXPECTED_VERSION, version))
+        self.ts = struct.unpack_from('<q', self._view, len(EXPECTED_VERSION))[0]
+        # offset of the event following the last one returned
+        self.offset = HEADER_SIZE
+
+    def __len__(self):
+        return len(self._view)
+
+    def _prefix_at(self, pos):
+        if len(self._view) - pos < PREFIX_LEN:
+            raise TruncatedException('Unexpected EOF!')
+        evlen, evtime, evtype = _PREFIX.unpack_from(self._view, pos)
+        _check_evlen(evlen)
+        if pos + evlen > len(self._view):
+            raise TruncatedException('Unexpected EOF!')
+        return evlen, evtime, evtype
+
+    def scan(self, offset=None):
+        """
+        Yields (offset, length, time, type) of the events starting at
+        offset without decoding them.
+        """
+        pos = HEADER_SIZE if offset is None else offset
+        size = len(self._view)
+        prefix_at = self._prefix_at
+
+        while pos < size:
+            evlen, evtime, evtype = prefix_at(pos)
+            yield (pos, evlen, evtime, evtype)
+            pos += evlen
+
+    def event_at(self, offset):
+        """ Returns (time, event) of the event at offset. """
+        evlen, evtime, evtype = self._prefix_at(offset)
+        self.offset = offset + evlen
+        return (evtime, _decode_event(evtype, self._view, offset + PREFIX_LEN, self.offset))
+
+    def stream_id_at(self, offset):
+        """ Returns the stream id of the event at offset, all events start with it. """
+        return struct.unpack_from('<I', self._view, offset + PREFIX_LEN)[0]
+
+    def raw_event(self, offset):
+        """ Returns the event at offset including its prefix, as stored. """
+        evlen = self._prefix_at(offset)[0]
+        return self._view[offset:offset+evlen]
+
+    def events(self, offset=None):
+        """
+        Yields (time, event) for the events starting at offset, which
+        must be the start of an event (e.g. a previous self.offset).
+        """
+        view = self._view
+        size = len(view)
+        pos = HEADER_SIZE if offset is None else offset
+
+        # same as scan, inlined as this is the hot loop
+        while pos < size:
+            if size - pos < PREFIX_LEN:
+                raise TruncatedException('Unexpected EOF!')
+            evlen, evtime, evtype = _PREFIX.unpack_from(view, pos)
+            _check_evlen(evlen)
+            end = pos + evlen
+            if end > size:
+                raise TruncatedException('Unexpected EOF!')
+
+            event = _decode_event(evtype, view, pos + PREFIX_LEN, end)
+            self.offset = pos = end
+            yield (evtime, event)
+
+    def parse(self, offset=None):
+        """ Same as events, but starts with the EvHeader like parse. """
+        yield (0, EvHeader(self.ts))
+        yield from self.events(offset)
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # event data is still referenced, the mapping goes
+            # away once the last view of it does
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def decode_events(buf):
+    """ Yields (time, event) for the events stored back to back in buf. """
+    view = memoryview(buf)
+    size = len(view)
+    pos = 0
+    while pos < size:
+        if size - pos < PREFIX_LEN:
+            raise TruncatedException('Unexpected EOF!')
+        evlen, evtime, evtype = _PREFIX.unpack_from(view, pos)
+        _check_evlen(evlen)
+        end = pos + evlen
+        if end > size:
+            raise TruncatedException('Unexpected EOF!')
+        yield (evtime, _decode_event(evtype, view, pos + PREFIX_LEN, end))
+        pos = end
+
+def _parse_stream(stream, offset, version):
+    timestamp = read_header(stream, version)
     yield (0, EvHeader(timestamp))
 
+    if offset is not None:
+        stream.seek(offset)
+
     while True:
         prefix_buf = stream.read(PREFIX_LEN)
         if len(prefix_buf) == 0:
             break
         elif len(prefix_buf) < PREFIX_LEN:
-            raise HCapException('Unexpected EOF!')
+            raise TruncatedException('Unexpected EOF!')
 
-        evlen, evtime, evtype = struct.unpack('<IqB', prefix_buf)
-
-        # Sanity check, we don't want unbounded buffer sizes
-        if evlen > MAX_EVLEN:
-            raise HCapException('Event length {0} exceeds maximum of {1}'.format(
-                evlen, MAX_EVLEN))
+        evlen, evtime, evtype = _PREFIX.unpack(prefix_buf)
+        _check_evlen(evlen)
 
         # read event data
         buf = stream.read(evlen - PREFIX_LEN)
+        if len(buf) < evlen - PREFIX_LEN:
+            raise TruncatedException('Unexpected EOF!')
+
+        yield (evtime, _decode_event(evtype, memoryview(buf), 0, len(buf)))
 
-        if evtype == EV_NEW_CONNECTION:
-            yield (evtime, EvNewConnection.decode(buf))
-        elif evtype == EV_DATA:
-            yield (evtime, EvData.decode(buf))
-        elif evtype == EV_CLOSE:
-            yield (evtime, EvClose.decode(buf))
+def parse(stream, offset=None):
+    """
+    Yields (time, event) for all events in stream, starting with an
+    EvHeader. If offset is given, events are read from there on.
+    The capture is read from the stream's current position on.
+    Regular files read from their start are memory mapped and read
+    through a Reader, which is closed once the events are consumed or
+    the generator is closed, anything else is read from the stream.
+    Block compressed (V1) captures are decompressed block by block.
+    """
+    version = stream.read(len(EXPECTED_VERSION))
+    if version == hcapblock.VERSION:
+        if offset is not None:
+            raise HCapException('Offsets are not supported for V1 captures')
+        yield from hcapblock.parse_stream(stream)
+        return
+
+    reader = None
+    try:
+        # the mapping starts at the start of the file, so does the
+        # capture unless part of the stream was read already
+        if stream.tell() == len(version):
+            reader = Reader(stream)
+    except (AttributeError, OSError, ValueError):
+        # pipes, in-memory streams and empty files can't be mapped
+        pass
+    if reader is None:
+        yield from _parse_stream(stream, offset, version)
+        return
+
+    with reader:
+        try:
+            yield from reader.parse(offset)
+        finally:
+            # as if the events had been read from the stream
+            stream.seek(reader.offset)
+
+class Writer:
+    """
+    Writes events in the format read by parse. Times are in
+    milliseconds relative to the header timestamp.
+    """
+    # payload room left in an EV_DATA event
+    MAX_DATA = MAX_EVLEN - PREFIX_LEN - 5
+
+    def __init__(self, stream, ts):
+        self._stream = stream
+        stream.write(EXPECTED_VERSION + struct.pack('<q', ts))
+
+    def _write(self, evtime, evtype, *parts):
+        evlen = PREFIX_LEN + sum(map(len, parts))
+        self._stream.write(struct.pack('<IqB', evlen, evtime, evtype))
+        for part in parts:
+            self._stream.write(part)
+
+    def new_connection(self, evtime, stream_id, source, dest):
+        self._write(evtime, EV_NEW_CONNECTION, struct.pack(
+            '<IIHIH', stream_id, _parse_ipv4(source[0]), source[1],
+            _parse_ipv4(dest[0]), dest[1]))
+
+    def data(self, evtime, stream_id, who, data):
+        """ Writes data, split into several events if necessary. """
+        prefix = struct.pack('<IB', stream_id, who)
+        data = memoryview(data)
+        for i in range(0, len(data), self.MAX_DATA):
+            self._write(evtime, EV_DATA, prefix, data[i:i+self.MAX_DATA])
+
+    def close_connection(self, evtime, stream_id):
+        self._write(evtime, EV_CLOSE, struct.pack('<I', stream_id))
+
+def write(events, out):
+    """
+    Writes (time, event) tuples as yielded by parse, starting with
+    an EvHeader, as a capture to out.
+    """
+    writer = None
+    for evtime, event in events:
+        if isinstance(event, EvData):
+            writer.data(evtime, event.stream_id, event.who, event.data)
+        elif isinstance(event, EvNewConnection):
+            writer.new_connection(evtime, event.stream_id, event.source, event.dest)
+        elif isinstance(event, EvClose):
+            writer.close_connection(evtime, event.stream_id)
         else:
-            raise HCapException('Got unknown event type 0x{0:02x}'.format(evtype))
+            writer = Writer(out, event.ts)
 
-HEADER_SIZE = len(EXPECTED_VERSION) + 8
 MAX_BUF = 64 * 1024
 class AsyncParser:
     """
     Parser than can be used for asynchronous parsing
     (i.e. using asyncore or similar)
     """
-    def __init__(self, max_buf=MAX_BUF):
+    def __init__(self, max_buf=MAX_BUF, header=True):
+        """ With header=False, the data fed starts with the first event. """
         self._buf = bytearray(max_buf)
         self._buf_start = 0
         self._buf_end = 0
         self._max_buf = max_buf
 
-        self._needed = HEADER_SIZE
-        self._parser = self._read_header
+        if header:
+            self._needed = HEADER_SIZE
+            self._parser = self._read_header
+        else:
+            self._needed = PREFIX_LEN
+            self._parser = self._read_prefix
 
     def _read(self, n):
         end = self._buf_start + n
@@ -130,25 +394,20 @@ class AsyncParser:
         return buf
 
     def _read_event(self):
-        buf = self._read(self._evlen - PREFIX_LEN)
-        evtype = self._evtype
-        evtime = self._evtime
-        
+        start = self._buf_start
+        end = self._buf_start = start + self._evlen - PREFIX_LEN
+
         # read header
         self._needed = PREFIX_LEN
         self._parser = self._read_prefix
 
-        if evtype == EV_NEW_CONNECTION:
-            return (evtime, EvNewConnection.decode(buf))
-        elif evtype == EV_DATA:
-            return (evtime, EvData.decode(buf))
-        elif evtype == EV_CLOSE:
-            return (evtime, EvClose.decode(buf))
-        else:
-            raise HCapException('Got unknown event type 0x{0:02x}'.format(evtype))
+        # decodes straight from the buffer, data is the only copy made
+        return (self._evtime, _decode_event(self._evtype, self._buf, start, end))
 
     def _read_prefix(self):
-        self._evlen, self._evtime, self._evtype = struct.unpack('<IqB', self._read(PREFIX_LEN))
+        self._evlen, self._evtime, self._evtype = _PREFIX.unpack_from(self._buf, self._buf_start)
+        self._buf_start += PREFIX_LEN
+        _check_evlen(self._evlen)
 
         # read event
         self._needed = self._evlen - PREFIX_LEN
@@ -156,18 +415,50 @@ class AsyncParser:
 
     def _read_header(self):
         version = self._read(len(EXPECTED_VERSION))
+        if version == hcapblock.VERSION:
+            self._needed = hcapblock.HEADER_SIZE - len(EXPECTED_VERSION)
+            self._parser = self._read_v1_header
+            return None
         if version != EXPECTED_VERSION:
             raise HCapException('Expected to read {0!r} but got {1!r}'.format(
                 EXPECTED_VERSION, version))
-        
+
         timestamp = struct.unpack('<q', self._read(8))[0]
 
         self._needed = PREFIX_LEN
         self._parser = self._read_prefix
 
         return (0, EvHeader(timestamp))
+
+    def _read_v1_header(self):
+        timestamp, codec = hcapblock._HEADER.unpack(self._read(hcapblock._HEADER.size))
+        self._blocks = hcapblock.BlockStream(codec)
+
+        # everything from here on goes through the block decoder
+        self._needed = 1
+        self._parser = self._read_blocks
+
+        return (0, EvHeader(timestamp))
+
+    def _read_blocks(self):
+        return list(self._blocks.feed(self._read(self._buf_end - self._buf_start)))
         
     def feed_buf(self, buf):
+        """
+        Yields the events completed by buf. Chunks larger than the
+        buffer are taken in pieces: after each piece at most one
+        partial event, i.e. less than MAX_EVLEN bytes, stays buffered.
+        """
+        step = max(self._max_buf - MAX_EVLEN, 1)
+        if len(buf) <= step:
+            return self._feed_piece(buf)
+        return self._feed_pieces(memoryview(buf), step)
+
+    def _feed_pieces(self, buf, step):
+        for i in range(0, len(buf), step):
+            yield from self._feed_piece(buf[i:i+step])
+
+    def _feed_piece(self, buf):
         end = self._buf_end + len(buf)
         if end > self._max_buf:
             raise HCapException('Buffer size exceeded')
@@ -179,7 +470,9 @@ class AsyncParser:
         # process data
         while end - self._buf_start >= self._needed:
             data = self._parser()
-            if data is not None:
+            if type(data) is list:
+                yield from data
+            elif data is not None:
                 yield data
 
         # copy to make more room
@@ -189,6 +482,9 @@ class AsyncParser:
             self._buf_start = 0
             self._buf_end = inbuff
 
+# V1 builds on the classes above
+from . import hcapblock
+
 if __name__ == '__main__':
     import sys
     from datetime import datetime
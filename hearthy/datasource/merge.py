@@ -0,0 +1,82 @@
+"""
+Merges several hcapng captures into one.
+
+The captures' events are put on a common time line (the header
+timestamp of each capture plus the event's offset) and merged in time
+order with a heap, reading every capture as it goes, so memory use
+does not depend on the size of the captures. Stream ids are numbered
+anew in the order the streams appear in the merged capture, as they
+would be by a single hcapture, so ids used by several captures no
+longer collide.
+"""
+
+import heapq
+import logging
+import operator
+
+from . import hcapng
+
+logger = logging.getLogger(__name__)
+
+def _absolute(index, base, events):
+    """ Yields (absolute time in ms, index, event) for one capture. """
+    try:
+        for ts, event in events:
+            yield (base + ts, index, event)
+    except hcapng.TruncatedException:
+        # e.g. still being written, merge what is there
+        logger.warning('Capture {0} is truncated'.format(index))
+
+def merge_events(captures):
+    """
+    Merges the (time, event) iterators of several captures, each
+    starting with its EvHeader as yielded by hcapng.parse.
+    Yields (time, event) for the merged capture, starting with an
+    EvHeader of the earliest header timestamp. The events' stream
+    ids are changed in place.
+    """
+    headers = []
+    inputs = []
+    for index, events in enumerate(captures):
+        events = iter(events)
+        ts, header = next(events)
+        if not isinstance(header, hcapng.EvHeader):
+            raise hcapng.HCapException('Capture {0} does not start with a header'.format(index))
+        headers.append(header.ts)
+        inputs.append(_absolute(index, header.ts * 1000, events))
+
+    base = min(headers) if headers else 0
+    yield (0, hcapng.EvHeader(base))
+    base *= 1000
+
+    # (capture index, stream id) -> merged stream id
+    ids = {}
+    next_id = 0
+    for t, index, event in heapq.merge(*inputs, key=operator.itemgetter(0, 1)):
+        key = (index, event.stream_id)
+        stream_id = ids.get(key, None)
+        if stream_id is None:
+            stream_id = ids[key] = next_id
+            next_id += 1
+        if isinstance(event, hcapng.EvClose):
+            # hcapture never reuses an id, forgetting it keeps ids bounded
+            del ids[key]
+        event.stream_id = stream_id
+        yield (t - base, event)
+
+def merge(files):
+    """ Merges the captures in the given open files, see merge_events. """
+    return merge_events([hcapng.parse(f) for f in files])
+
+if __name__ == '__main__':
+    import contextlib
+    import sys
+
+    if len(sys.argv) < 3:
+        print('Usage: {0} <output file> <capture>...'.format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        files = [stack.enter_context(open(path, 'rb')) for path in sys.argv[2:]]
+        with open(sys.argv[1], 'wb') as out:
+            hcapng.write(merge(files), out)
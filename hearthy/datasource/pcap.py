@@ -0,0 +1,488 @@
+"""
+Reads pcap and pcapng captures as hcapng events.
+
+Packets are read one at a time, IPv4 TCP connections to one of the
+known ports are reassembled and turned into the events hcapng.parse
+yields, so tcpdump captures can be used wherever an hcapng capture
+can. Like helper/hcapture.c, a connection is only followed if its
+handshake is in the capture, who is 0 for data sent by the client
+and 1 for data sent by the server, and times are in milliseconds
+relative to the header timestamp.
+
+Out of order segments are buffered (up to max_buffer bytes per
+direction, beyond that the connection is given up and closed) and
+retransmitted data is trimmed, so every byte is handed out once.
+"""
+
+import logging
+import struct
+
+from . import hcapng
+
+logger = logging.getLogger(__name__)
+
+# Hearthstone game servers and battle.net
+PORTS = (1119, 3724)
+MAX_BUFFER = 1024 * 1024
+# handshakes not completed within this many ms are forgotten
+HANDSHAKE_TIMEOUT = 30 * 1000
+BATCH_SIZE = 1024
+
+class PcapException(Exception):
+    """ Raised on malformed pcap or pcapng files """
+    pass
+
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1),
+    b'\xa1\xb2\xc3\xd4': ('>', 1),
+    # nanosecond resolution
+    b'\x4d\x3c\xb2\xa1': ('<', 1000),
+    b'\xa1\xb2\x3c\x4d': ('>', 1000)
+}
+_PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+
+_BT_IDB = 1
+_BT_PB = 2
+_BT_SPB = 3
+_BT_EPB = 6
+_OPT_TSRESOL = 9
+_OPT_TSOFFSET = 14
+
+def _read(f, n):
+    buf = f.read(n)
+    if len(buf) < n:
+        raise PcapException('Unexpected EOF!')
+    return buf
+
+def _pcap_packets(f, magic):
+    """ Yields (time in us, link type, data) of a classic pcap file. """
+    endian, div = _PCAP_MAGIC[magic]
+    major, minor, zone, sigfigs, snaplen, linktype = struct.unpack(
+        endian + 'HHiIII', _read(f, 20))
+    # the upper bits hold the FCS length
+    linktype &= 0xffff
+
+    record = struct.Struct(endian + 'IIII')
+    while True:
+        buf = f.read(16)
+        if not buf:
+            break
+        if len(buf) < 16:
+            raise PcapException('Unexpected EOF!')
+        sec, frac, caplen, origlen = record.unpack(buf)
+        yield (sec * 1000000 + frac // div, linktype, _read(f, caplen))
+
+class _Interface:
+    __slots__ = ['linktype', 'snaplen', 'mul', 'div', 'offset']
+
+    def __init__(self, linktype, snaplen):
+        self.linktype = linktype
+        self.snaplen = snaplen
+        # time in us = ts * mul // div + offset
+        self.mul, self.div = 1, 1
+        self.offset = 0
+
+    def parse_options(self, endian, buf, pos):
+        while pos + 4 <= len(buf):
+            code, length = struct.unpack_from(endian + 'HH', buf, pos)
+            pos += 4
+            if code == 0:
+                break
+            value = buf[pos:pos+length]
+            pos += (length + 3) & ~3
+            if code == _OPT_TSRESOL and length == 1:
+                if value[0] & 0x80:
+                    self.mul, self.div = 1000000, 1 << (value[0] & 0x7f)
+                else:
+                    exp = value[0] - 6
+                    self.mul, self.div = (10 ** -exp, 1) if exp < 0 else (1, 10 ** exp)
+            elif code == _OPT_TSOFFSET and length == 8:
+                self.offset = struct.unpack(endian + 'q', value)[0] * 1000000
+
+    def time(self, ts):
+        return ts * self.mul // self.div + self.offset
+
+def _pcapng_packets(f, magic):
+    """ Yields (time in us, link type, data) of a pcapng file. """
+    endian = None
+    interfaces = []
+    last_time = 0
+
+    btype = magic
+    while btype:
+        if len(btype) < 4:
+            raise PcapException('Unexpected EOF!')
+        head = _read(f, 4)
+        if btype == _PCAPNG_SHB:
+            body = _read(f, 4)
+            # the byte order magic decides the byte order of the section
+            endian = '<' if body == b'\x4d\x3c\x2b\x1a' else '>'
+            interfaces = []
+        elif endian is None:
+            raise PcapException('Block before the section header')
+        else:
+            body = b''
+
+        code = struct.unpack(endian + 'I', btype)[0]
+        length = struct.unpack(endian + 'I', head)[0]
+        if length < 12 + len(body) or length % 4:
+            raise PcapException('Bad block length {0}'.format(length))
+        body += _read(f, length - 12 - len(body))
+        if _read(f, 4) != head:
+            raise PcapException('Block lengths do not match')
+
+        if code == _BT_EPB or code == _BT_PB:
+            if code == _BT_EPB:
+                iface, high, low, caplen, origlen = struct.unpack_from(
+                    endian + 'IIIII', body)
+            else:
+                iface, drops, high, low, caplen, origlen = struct.unpack_from(
+                    endian + 'HHIIII', body)
+            try:
+                interface = interfaces[iface]
+            except IndexError:
+                raise PcapException('Packet of unknown interface {0}'.format(iface))
+            last_time = interface.time((high << 32) | low)
+            yield (last_time, interface.linktype, body[20:20+caplen])
+        elif code == _BT_SPB:
+            if not interfaces:
+                raise PcapException('Packet of unknown interface 0')
+            interface = interfaces[0]
+            origlen = struct.unpack_from(endian + 'I', body)[0]
+            caplen = min(origlen, interface.snaplen or origlen, len(body) - 4)
+            # simple packets have no time of their own
+            yield (last_time, interface.linktype, body[4:4+caplen])
+        elif code == _BT_IDB:
+            linktype, reserved, snaplen = struct.unpack_from(endian + 'HHI', body)
+            interface = _Interface(linktype, snaplen)
+            interface.parse_options(endian, body, 8)
+            interfaces.append(interface)
+
+        btype = f.read(4)
+
+def packets(f):
+    """
+    Yields (time in microseconds, link type, data) for every packet
+    of a pcap or pcapng file.
+    """
+    magic = f.read(4)
+    if magic in _PCAP_MAGIC:
+        return _pcap_packets(f, magic)
+    elif magic == _PCAPNG_SHB:
+        return _pcapng_packets(f, magic)
+    raise PcapException('Not a pcap or pcapng file (magic {0!r})'.format(magic))
+
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+def _ethernet(data):
+    pos = 12
+    ethertype = (data[pos] << 8) | data[pos+1]
+    while ethertype in _ETHERTYPE_VLAN:
+        pos += 4
+        ethertype = (data[pos] << 8) | data[pos+1]
+    if ethertype == _ETHERTYPE_IPV4:
+        return data[pos+2:]
+
+def _null(data):
+    # AF_INET in the byte order of the capturing host
+    if data[:4] in (b'\x02\x00\x00\x00', b'\x00\x00\x00\x02'):
+        return data[4:]
+
+def _raw(data):
+    return data
+
+def _sll(data):
+    if data[14:16] == b'\x08\x00':
+        return data[16:]
+
+def _sll2(data):
+    if data[:2] == b'\x08\x00':
+        return data[20:]
+
+# link type -> function returning the IPv4 packet of a frame, or None
+_LINK_TYPES = {
+    0: _null,
+    1: _ethernet,
+    12: _raw,
+    101: _raw,
+    108: _null,
+    113: _sll,
+    228: _raw,
+    276: _sll2
+}
+
+_IPV4 = struct.Struct('!BxHxxHxBxxII')
+_TCP = struct.Struct('!HHIIBB')
+
+_FIN = 0x01
+_SYN = 0x02
+_RST = 0x04
+_ACK = 0x10
+
+def _new_connection(stream_id, saddr, sport, daddr, dport):
+    ev = hcapng.EvNewConnection()
+    ev.stream_id = stream_id
+    ev.source = (hcapng._format_ipv4(saddr), sport)
+    ev.dest = (hcapng._format_ipv4(daddr), dport)
+    return ev
+
+def _data(stream_id, who, data):
+    ev = hcapng.EvData()
+    ev.stream_id = stream_id
+    ev.who = who
+    ev.data = data
+    return ev
+
+def _close(stream_id):
+    ev = hcapng.EvClose()
+    ev.stream_id = stream_id
+    return ev
+
+class _Half:
+    """ One direction of a connection. """
+    __slots__ = ['next', 'segments', 'buffered', 'fin', 'done']
+
+    def __init__(self, next_seq):
+        # sequence number of the next byte to be handed out
+        self.next = next_seq
+        # out of order (seq, data)
+        self.segments = []
+        self.buffered = 0
+        self.fin = None
+        self.done = False
+
+def _seq_diff(a, b):
+    """ a - b in sequence space, i.e. across wrap arounds. """
+    d = (a - b) & 0xffffffff
+    return d - 0x100000000 if d & 0x80000000 else d
+
+class _Connection:
+    __slots__ = ['stream_id', 'halves', 'last']
+
+    def __init__(self, stream_id, client_seq, server_seq, t):
+        self.stream_id = stream_id
+        self.halves = (_Half(client_seq), _Half(server_seq))
+        self.last = t
+
+class Reassembler:
+    """
+    Turns IPv4 packets into hcapng events. feed returns the (time,
+    event) tuples caused by a packet.
+    """
+    def __init__(self, ports=PORTS, max_buffer=MAX_BUFFER, idle_timeout=None):
+        self._ports = frozenset(ports)
+        self._max_buffer = max_buffer
+        self._idle_timeout = idle_timeout
+        # (client addr, client port, server addr, server port) -> _Connection
+        self._connections = {}
+        # same key -> (next client seq, time of the SYN)
+        self._handshakes = {}
+        self._next_expiry = None
+        self._stream_count = 0
+        self.ignored = 0
+
+    def __len__(self):
+        return len(self._connections)
+
+    def _deliver(self, t, conn, who, seq, data, events):
+        half = conn.halves[who]
+        d = _seq_diff(seq, half.next)
+        if d > 0:
+            # a gap, keep the segment until it is filled
+            half.segments.append((seq, data))
+            half.buffered += len(data)
+            return half.buffered <= self._max_buffer
+
+        if len(data) > -d:
+            # retransmissions may overlap what has been handed out
+            events.append((t, _data(conn.stream_id, who, data[-d:])))
+            half.next = (seq + len(data)) & 0xffffffff
+
+            while half.segments:
+                for i, (seq, data) in enumerate(half.segments):
+                    d = _seq_diff(seq, half.next)
+                    if d <= 0:
+                        break
+                else:
+                    break
+                del half.segments[i]
+                half.buffered -= len(data)
+                if len(data) > -d:
+                    events.append((t, _data(conn.stream_id, who, data[-d:])))
+                    half.next = (seq + len(data)) & 0xffffffff
+        return True
+
+    def _close(self, t, key, conn, events):
+        del self._connections[key]
+        events.append((t, _close(conn.stream_id)))
+
+    def _expire(self, t, events):
+        for key, (seq, start) in list(self._handshakes.items()):
+            if t - start > HANDSHAKE_TIMEOUT:
+                del self._handshakes[key]
+        if self._idle_timeout is not None:
+            for key, conn in list(self._connections.items()):
+                if t - conn.last > self._idle_timeout:
+                    self._close(t, key, conn, events)
+
+        interval = HANDSHAKE_TIMEOUT
+        if self._idle_timeout is not None:
+            interval = min(interval, self._idle_timeout)
+        self._next_expiry = t + interval
+
+    def feed(self, t, packet):
+        """ Processes the IPv4 packet captured at time t (in ms). """
+        events = []
+        if self._next_expiry is None or t >= self._next_expiry:
+            self._expire(t, events)
+
+        if len(packet) < 20:
+            return events
+        ver_ihl, total, frag, proto, saddr, daddr = _IPV4.unpack_from(packet)
+        if ver_ihl >> 4 != 4 or proto != 6:
+            return events
+        if frag & 0x3fff:
+            # fragments are rare for TCP and not reassembled
+            self.ignored += 1
+            return events
+        ihl = (ver_ihl & 0x0f) * 4
+        if total > len(packet) or ihl + 20 > total:
+            # cut off by the snap length or bogus
+            self.ignored += 1
+            return events
+
+        sport, dport, seq, ack, offset, flags = _TCP.unpack_from(packet, ihl)
+        if dport in self._ports:
+            key = (saddr, sport, daddr, dport)
+            who = 0
+        elif sport in self._ports:
+            key = (daddr, dport, saddr, sport)
+            who = 1
+        else:
+            return events
+
+        conn = self._connections.get(key, None)
+        if flags & _SYN:
+            if who == 0 and not flags & _ACK:
+                if conn is not None:
+                    if (seq + 1) & 0xffffffff == conn.halves[0].next:
+                        # retransmitted SYN
+                        return events
+                    # port reused without the close being captured
+                    self._close(t, key, conn, events)
+                self._handshakes[key] = ((seq + 1) & 0xffffffff, t)
+            elif who == 1 and conn is None:
+                handshake = self._handshakes.pop(key, None)
+                if handshake is not None:
+                    conn = _Connection(self._stream_count, handshake[0],
+                                       (seq + 1) & 0xffffffff, t)
+                    self._stream_count += 1
+                    self._connections[key] = conn
+                    events.append((t, _new_connection(conn.stream_id, *key)))
+            return events
+
+        if conn is None:
+            return events
+        conn.last = t
+
+        if flags & _RST:
+            self._close(t, key, conn, events)
+            return events
+
+        data = memoryview(packet)[ihl+(offset>>4)*4:total]
+        if data and not self._deliver(t, conn, who, seq, data, events):
+            logger.warning('Giving up stream {0}, more than {1} bytes out of order'.format(
+                conn.stream_id, self._max_buffer))
+            self._close(t, key, conn, events)
+            return events
+
+        half = conn.halves[who]
+        if flags & _FIN:
+            half.fin = (seq + len(data)) & 0xffffffff
+        if half.fin is not None and half.fin == half.next:
+            half.done = True
+            if conn.halves[1-who].done:
+                self._close(t, key, conn, events)
+        return events
+
+def parse_batches(f, ports=PORTS, batch_size=BATCH_SIZE, **kwargs):
+    """
+    Yields lists of up to batch_size (time, event) tuples, the first
+    one starting with the EvHeader. The header timestamp is the second
+    the first packet was captured in. Further arguments are passed on
+    to the Reassembler.
+    """
+    reassembler = Reassembler(ports, **kwargs)
+    feed = reassembler.feed
+    batch = None
+    base = None
+    decode = None
+    last_linktype = None
+
+    for ts, linktype, data in packets(f):
+        if base is None:
+            base = ts // 1000000
+            batch = [(0, hcapng.EvHeader(base))]
+            base *= 1000
+        if linktype != last_linktype:
+            decode = _LINK_TYPES.get(linktype, None)
+            if decode is None:
+                logger.warning('Skipping packets of unsupported link type {0}'.format(linktype))
+            last_linktype = linktype
+        if decode is None:
+            continue
+
+        try:
+            packet = decode(data)
+        except IndexError:
+            # frame shorter than its headers
+            continue
+        if packet is None:
+            continue
+
+        events = feed(ts // 1000 - base, packet)
+        if events:
+            batch.extend(events)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+    if base is None:
+        batch = [(0, hcapng.EvHeader(0))]
+    if batch:
+        yield batch
+
+def parse(f, ports=PORTS, **kwargs):
+    """ Yields (time, event) like hcapng.parse does for an hcapng file. """
+    for batch in parse_batches(f, ports, **kwargs):
+        yield from batch
+
+def to_hcapng(f, out, ports=PORTS, **kwargs):
+    """ Converts a pcap or pcapng capture into an hcapng one. """
+    hcapng.write(parse(f, ports, **kwargs), out)
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Read pcap/pcapng captures as hcapng events')
+    parser.add_argument('capture')
+    parser.add_argument('output', nargs='?', help='hcapng file to write')
+    parser.add_argument('-p', '--port', type=int, action='append',
+                        help='server port to follow (default: {0})'.format(
+                            ', '.join(map(str, PORTS))))
+    args = parser.parse_args()
+    ports = args.port or PORTS
+
+    try:
+        with open(args.capture, 'rb') as f:
+            if args.output:
+                with open(args.output, 'wb') as out:
+                    to_hcapng(f, out, ports)
+            else:
+                for ts, event in parse(f, ports):
+                    print('[{0:8}] {1!r}'.format(ts, event))
+    except PcapException as e:
+        print('Error: {0}'.format(e), file=sys.stderr)
+        sys.exit(1)
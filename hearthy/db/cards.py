@@ -1,10 +1,16 @@
+import os
+
 from hearthstone import cardxml
 
 from hearthy.exceptions import CardNotFound
 
+# a local copy of the card definitions, if any, is used first
+LOCAL_CARD_DEFS = 'hs-data/CardDefs.xml'
 
 def _build_card_map():
-    cards, xml_ = cardxml.load('hs-data/CardDefs.xml')
+    # otherwise those of the hearthstone_data package
+    path = LOCAL_CARD_DEFS if os.path.exists(LOCAL_CARD_DEFS) else None
+    cards, xml_ = cardxml.load(path)
     return {card_id: card.name for card_id, card in cards.items()}
 
 _id_to_card = _build_card_map()
@@ -3,28 +3,28 @@ import asyncore
 from hearthstone.enums import GameTag
 
 from hearthy.proxy import intercept
-from pegasus.game_pb2 import PowerHistory, Tag
+from hearthy.protocol.wirepatch import Patch
+from pegasus.game_pb2 import PowerHistory
 
 class SquirrelHandler(intercept.InterceptHandler):
+    # PowerHistory is patched on the wire, nothing needs decoding
+    interest = frozenset()
+
     def __init__(self, use_premium=False):
         super().__init__()
-        self._use_premium = use_premium
+        self._patch = Patch(PowerHistory)
+        self._patch.set_field('list.show_entity.name', 'EX1_tk28') # squirrel
+        if use_premium:
+            self._patch.set_tag('list.show_entity', GameTag.PREMIUM, 1)
 
     def on_packet(self, epid, packet):
-        if isinstance(packet, PowerHistory):
-            for entry in packet.list:
-                if entry.HasField('show_entity'):
-                    entry.show_entity.name = 'EX1_tk28' # squirrel
-
-                    if self._use_premium:
-                        for tag in entry.show_entity.tags:
-                            if tag.name == GameTag.PREMIUM:
-                                tag.value = 1
-                                break
-                        else:
-                            entry.show_entity.tags.add(name=GameTag.PREMIUM, value=1)
-
-        return intercept.INTERCEPT_ACCEPT
+        if packet.type == PowerHistory.ID:
+            patched = self._patch.apply(packet.data)
+            if patched is not None:
+                packet.data = patched
+                return intercept.INTERCEPT_ACCEPT
+
+        return intercept.INTERCEPT_ACCEPT_UNCHANGED
 
 if __name__ == '__main__':
     import argparse
@@ -1,7 +1,7 @@
 from hearthy import exceptions
 from hearthy.tracker import processor
 from hearthy.protocol.decoder import decode_packet
-from hearthy.protocol.utils import Splitter
+from hearthy.protocol.splitter import Splitter
 
 class Connection:
     def __init__(self, source, dest):
@@ -11,7 +11,7 @@ class Connection:
 
     def feed(self, who, buf):
         for atype, abuf in self._s[who].feed(buf):
-            decoded = decode_packet(atype, abuf)
+            decoded = decode_packet(atype, abuf, interest=self._t.interest)
             self._t.process(who, decoded)
 
     def __repr__(self):
@@ -23,7 +23,7 @@ if __name__ == '__main__':
     from hearthy.datasource import hcapng
 
     if len(sys.argv) < 2:
-        print('Usage: {0} <hcapng file>'.format(sys.argv[0]))
+        print('Usage: {0} <hcapng file> [stream id]'.format(sys.argv[0]))
         sys.exit(1)
 
     import logging
@@ -31,8 +31,15 @@ if __name__ == '__main__':
 
     d = {}
     with open(sys.argv[1], 'rb') as f:
-        parser = hcapng.parse(f)
-        begin = next(parser)
+        if len(sys.argv) > 2:
+            # only replay one stream, seeking to its events
+            from hearthy.datasource import hcapindex
+            reader = hcapng.Reader(f)
+            index = hcapindex.get_index(reader, sys.argv[1])
+            parser = index.stream_events(reader, int(sys.argv[2]))
+        else:
+            parser = hcapng.parse(f)
+            begin = next(parser)
         for ts, event in parser:
             if isinstance(event, hcapng.EvClose):
                 if event.stream_id in d:
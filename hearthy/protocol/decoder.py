@@ -4,20 +4,13 @@ Hearthstone Protocol Decoder.
 
 import struct
 from hearthy.exceptions import DecodeError, EncodeError
-from pegasus import game_pb2, bobnet_pb2
-
-def _iter_messages():
-    for module in (bobnet_pb2, game_pb2):
-        for name, message_desc in module.DESCRIPTOR.message_types_by_name.items():
-            try:
-                message_id = message_desc.enum_values_by_name['ID'].number
-            except KeyError:
-                pass
-            else:
-                yield message_id, getattr(module, name)
-messages_by_id = dict(_iter_messages())
+from hearthy.protocol.registry import messages_by_id
 
 def encode_packet(packet, buf, offset=0):
+    """
+    Writes the framed packet to buf at offset, a bytearray buf is
+    extended if the packet does not fit. Returns the end offset.
+    """
     try:
         packet_type = packet.ID
     except AttributeError:
@@ -30,7 +23,68 @@ def encode_packet(packet, buf, offset=0):
     buf[offset+8:end] = encoded
     return end
 
-def decode_packet(packet_type, buf):
+def interest(*packet_types):
+    """
+    Builds the set of packet types a consumer wants decoded, to be
+    passed to decode_packet. Accepts packet ids or message classes.
+    """
+    ret = set()
+    for packet_type in packet_types:
+        packet_type = getattr(packet_type, 'ID', packet_type)
+        if packet_type not in messages_by_id:
+            raise DecodeError('No message with ID {0}'.format(packet_type))
+        ret.add(packet_type)
+    return frozenset(ret)
+
+class RawPacket:
+    """
+    Packet that has not been decoded yet. Decoding happens on demand
+    in decode() and the result is cached.
+    """
+    __slots__ = ['type', 'data', '_decoded']
+
+    def __init__(self, packet_type, buf):
+        self.type = packet_type
+        self.data = bytes(buf)
+        self._decoded = None
+
+    @property
+    def ID(self):
+        return self.type
+
+    @property
+    def name(self):
+        try:
+            return messages_by_id.name(self.type)
+        except KeyError:
+            return 'Unknown'
+
+    def __len__(self):
+        return len(self.data)
+
+    def decode(self):
+        if self._decoded is None:
+            self._decoded = decode_packet(self.type, self.data)
+        return self._decoded
+
+    def SerializeToString(self):
+        # a decoded copy may have been modified
+        if self._decoded is None:
+            return self.data
+        return self._decoded.SerializeToString()
+
+    def __repr__(self):
+        return '<RawPacket type={0}:{1} len={2}>'.format(
+            self.type, self.name, len(self.data))
+
+def decode_packet(packet_type, buf, interest=None):
+    """
+    Decodes a packet. If interest is given, packets whose type is not
+    in it are returned as RawPacket without parsing them.
+    """
+    if interest is not None and packet_type not in interest:
+        return RawPacket(packet_type, buf)
+
     try:
         message_type = messages_by_id[packet_type]
     except KeyError:
@@ -39,9 +93,58 @@ def decode_packet(packet_type, buf):
     message.MergeFromString(bytes(buf))
     return message
 
+class BatchDecoder:
+    """
+    Decodes packets for read-only consumers, handing them to a visitor.
+
+    With reuse=True, instead of allocating a message per packet, every
+    packet type gets one message that is cleared and refilled for each
+    packet of that type. Clearing is not free either: with current
+    protobuf releases it costs more time than a fresh message, so
+    messages are only reused on request.
+    """
+    def __init__(self, interest=None, reuse=False):
+        self._interest = interest
+        self._reuse = reuse
+        self._messages = {}
+
+    def decode_many(self, frames, visitor):
+        """
+        Calls visitor(packet_type, message) for every (packet_type, buf)
+        in frames, in order. The message is only valid during the call,
+        unless the visitor returns True to keep it for itself.
+        Packets outside interest are visited as RawPacket.
+        """
+        interest = self._interest
+        messages = self._messages
+
+        for packet_type, buf in frames:
+            if interest is not None and packet_type not in interest:
+                visitor(packet_type, RawPacket(packet_type, buf))
+                continue
+
+            message = messages.get(packet_type, None)
+            if message is None:
+                try:
+                    message = messages_by_id[packet_type]()
+                except KeyError:
+                    raise DecodeError('No message with ID {0}'.format(packet_type))
+            else:
+                message.Clear()
+                # Don't leave a half filled message behind if parsing fails
+                del messages[packet_type]
+
+            message.MergeFromString(bytes(buf))
+            if not visitor(packet_type, message) and self._reuse:
+                messages[packet_type] = message
+
+def decode_many(frames, visitor, interest=None, reuse=False):
+    """ Shorthand for BatchDecoder(interest, reuse).decode_many(frames, visitor) """
+    BatchDecoder(interest, reuse).decode_many(frames, visitor)
+
 if __name__ == '__main__':
     import sys
-    from .utils import Splitter
+    from .splitter import Splitter
 
     if len(sys.argv) < 2:
         print('Usage: {0} <raw dump file>'.format(sys.argv[0]), file=sys.stderr)
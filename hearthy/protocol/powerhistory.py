@@ -0,0 +1,170 @@
+"""
+Reads serialized PowerHistory messages straight from the protobuf wire
+format, without building a message object per entry.
+
+scan() yields one compact record per history entry:
+
+    (TAG_CHANGE, entity, tag, value)
+    (FULL_ENTITY, entity, card_id, tags)
+    (SHOW_ENTITY, entity, card_id, tags)
+    (HIDE_ENTITY, entity, None, tags)
+    (CREATE_GAME, 0, None, message)
+
+tags is a flat array('i') of alternating tag ids and values. Hidden
+entities carry their new zone as the only tag. create_game is rare
+enough to be handed out as a regular PowerHistoryCreateGame message.
+Other entries (power start/end, meta data) are skipped.
+"""
+
+import sys
+from array import array
+
+from hearthstone.enums import GameTag
+
+from hearthy.exceptions import DecodeError
+from hearthy.protocol.wire import (
+    WT_VARINT, WT_BYTES, read_varint as _varint, to_int32 as _int32,
+    skip_field as _skip
+    )
+from pegasus.game_pb2 import (
+    PowerHistory, PowerHistoryData, PowerHistoryEntity, PowerHistoryHide,
+    PowerHistoryTagChange, Tag
+    )
+
+TAG_CHANGE, FULL_ENTITY, SHOW_ENTITY, HIDE_ENTITY, CREATE_GAME = range(5)
+
+def _key(message, field, wire_type):
+    # Field numbers come from the generated descriptors so we follow
+    # whatever hs-proto revision was compiled.
+    return (message.DESCRIPTOR.fields_by_name[field].number << 3) | wire_type
+
+_LIST = _key(PowerHistory, 'list', WT_BYTES)
+
+_FULL_ENTITY = _key(PowerHistoryData, 'full_entity', WT_BYTES)
+_SHOW_ENTITY = _key(PowerHistoryData, 'show_entity', WT_BYTES)
+_HIDE_ENTITY = _key(PowerHistoryData, 'hide_entity', WT_BYTES)
+_TAG_CHANGE = _key(PowerHistoryData, 'tag_change', WT_BYTES)
+_CREATE_GAME = _key(PowerHistoryData, 'create_game', WT_BYTES)
+
+_ENTITY_ID = _key(PowerHistoryEntity, 'entity', WT_VARINT)
+_ENTITY_NAME = _key(PowerHistoryEntity, 'name', WT_BYTES)
+_ENTITY_TAGS = _key(PowerHistoryEntity, 'tags', WT_BYTES)
+
+_HIDE_ID = _key(PowerHistoryHide, 'entity', WT_VARINT)
+_HIDE_ZONE = _key(PowerHistoryHide, 'zone', WT_VARINT)
+
+_CHANGE_ID = _key(PowerHistoryTagChange, 'entity', WT_VARINT)
+_CHANGE_TAG = _key(PowerHistoryTagChange, 'tag', WT_VARINT)
+_CHANGE_VALUE = _key(PowerHistoryTagChange, 'value', WT_VARINT)
+
+_TAG_NAME = _key(Tag, 'name', WT_VARINT)
+_TAG_VALUE = _key(Tag, 'value', WT_VARINT)
+
+_CreateGame = type(PowerHistoryData().create_game)
+
+def _read_tag(buf, pos, end, tags):
+    name = value = 0
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == _TAG_NAME:
+            name, pos = _varint(buf, pos)
+        elif key == _TAG_VALUE:
+            value, pos = _varint(buf, pos)
+        else:
+            pos = _skip(buf, pos, key)
+    tags.append(_int32(name))
+    tags.append(_int32(value))
+
+def _read_entity(buf, pos, end):
+    eid = 0
+    name = ''
+    tags = array('i')
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == _ENTITY_TAGS:
+            n, pos = _varint(buf, pos)
+            _read_tag(buf, pos, pos + n, tags)
+            pos += n
+        elif key == _ENTITY_ID:
+            eid, pos = _varint(buf, pos)
+        elif key == _ENTITY_NAME:
+            n, pos = _varint(buf, pos)
+            name = sys.intern(buf[pos:pos+n].decode('utf-8'))
+            pos += n
+        else:
+            pos = _skip(buf, pos, key)
+    return _int32(eid), name, tags
+
+def _read_tag_change(buf, pos, end):
+    eid = tag = value = 0
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == _CHANGE_VALUE:
+            value, pos = _varint(buf, pos)
+        elif key == _CHANGE_TAG:
+            tag, pos = _varint(buf, pos)
+        elif key == _CHANGE_ID:
+            eid, pos = _varint(buf, pos)
+        else:
+            pos = _skip(buf, pos, key)
+    return (TAG_CHANGE, _int32(eid), _int32(tag), _int32(value))
+
+def _read_hide(buf, pos, end):
+    eid = zone = 0
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key == _HIDE_ID:
+            eid, pos = _varint(buf, pos)
+        elif key == _HIDE_ZONE:
+            zone, pos = _varint(buf, pos)
+        else:
+            pos = _skip(buf, pos, key)
+    return (HIDE_ENTITY, _int32(eid), None, array('i', (GameTag.ZONE, _int32(zone))))
+
+def _scan_data(buf, pos, end):
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        if key & 7 != WT_BYTES:
+            pos = _skip(buf, pos, key)
+            continue
+
+        n, pos = _varint(buf, pos)
+        stop = pos + n
+
+        if key == _TAG_CHANGE:
+            yield _read_tag_change(buf, pos, stop)
+        elif key == _FULL_ENTITY:
+            yield (FULL_ENTITY,) + _read_entity(buf, pos, stop)
+        elif key == _SHOW_ENTITY:
+            yield (SHOW_ENTITY,) + _read_entity(buf, pos, stop)
+        elif key == _HIDE_ENTITY:
+            yield _read_hide(buf, pos, stop)
+        elif key == _CREATE_GAME:
+            yield (CREATE_GAME, 0, None, _CreateGame.FromString(buf[pos:stop]))
+
+        pos = stop
+
+def scan(buf):
+    """
+    Yields a record for every entry of the serialized
+    PowerHistory message in buf.
+    """
+    buf = bytes(buf)
+    end = len(buf)
+    pos = 0
+
+    try:
+        while pos < end:
+            key, pos = _varint(buf, pos)
+            if key == _LIST:
+                n, pos = _varint(buf, pos)
+                stop = pos + n
+                yield from _scan_data(buf, pos, stop)
+                pos = stop
+            else:
+                pos = _skip(buf, pos, key)
+    except IndexError:
+        raise DecodeError('Truncated PowerHistory message')
+
+    if pos != end:
+        raise DecodeError('Truncated PowerHistory message')
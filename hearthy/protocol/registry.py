@@ -0,0 +1,146 @@
+"""
+Maps packet ids to protobuf message classes.
+
+Importing the generated pb2 modules and walking their descriptors is
+the bulk of our startup time, so it only happens once: the resulting
+id -> (module, name) map is kept in a small cache file, keyed by the
+size and mtime of the pb2 modules. Afterwards a lookup only imports
+the module defining the requested message.
+"""
+
+import importlib
+import importlib.util
+import json
+import os
+
+# Later modules win if ids collide
+MODULES = ('pegasus.bobnet_pb2', 'pegasus.game_pb2')
+
+def default_cache_path():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'hearthy', 'message_ids.json')
+
+def _module_versions(modules):
+    """ Identifies the installed pb2 modules without importing them. """
+    versions = {}
+    for name in modules:
+        try:
+            spec = importlib.util.find_spec(name)
+        except ImportError:
+            spec = None
+        if spec is None or spec.origin is None:
+            versions[name] = None
+            continue
+        try:
+            st = os.stat(spec.origin)
+        except OSError:
+            versions[name] = None
+        else:
+            versions[name] = [st.st_size, st.st_mtime_ns]
+    return versions
+
+def _scan_module(module):
+    for name, message_desc in module.DESCRIPTOR.message_types_by_name.items():
+        try:
+            message_id = message_desc.enum_values_by_name['ID'].number
+        except KeyError:
+            pass
+        else:
+            yield message_id, name
+
+class MessageRegistry:
+    """
+    Read only mapping of packet id to message class, filled lazily.
+    """
+    def __init__(self, modules=MODULES, cache_path=None):
+        self._modules = modules
+        self._cache_path = default_cache_path() if cache_path is None else cache_path
+        # id -> (module name, message name)
+        self._names = None
+        self._classes = {}
+
+    def _load_cache(self, versions):
+        try:
+            with open(self._cache_path, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if cache.get('modules') != versions:
+            return None
+        return {int(k): tuple(v) for k, v in cache['ids'].items()}
+
+    def _save_cache(self, versions, names):
+        cache = {
+            'modules': versions,
+            'ids': {str(k): list(v) for k, v in names.items()}
+        }
+        tmp = '{0}.{1}.tmp'.format(self._cache_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp, self._cache_path)
+        except OSError:
+            # not being able to cache is no reason to fail
+            pass
+
+    def _build(self):
+        names = {}
+        for module_name in self._modules:
+            module = importlib.import_module(module_name)
+            for message_id, name in _scan_module(module):
+                names[message_id] = (module_name, name)
+        return names
+
+    def _get_names(self):
+        names = self._names
+        if names is None:
+            versions = _module_versions(self._modules)
+            names = self._load_cache(versions)
+            if names is None:
+                names = self._build()
+                if None not in versions.values():
+                    self._save_cache(versions, names)
+            self._names = names
+        return names
+
+    def __getitem__(self, message_id):
+        cls = self._classes.get(message_id, None)
+        if cls is None:
+            module_name, name = self._get_names()[message_id]
+            cls = getattr(importlib.import_module(module_name), name)
+            self._classes[message_id] = cls
+        return cls
+
+    def get(self, message_id, default=None):
+        try:
+            return self[message_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, message_id):
+        return message_id in self._classes or message_id in self._get_names()
+
+    def name(self, message_id):
+        """ Returns the message name without importing its module. """
+        return self._get_names()[message_id][1]
+
+    def __iter__(self):
+        return iter(self._get_names())
+
+    def __len__(self):
+        return len(self._get_names())
+
+    def keys(self):
+        return self._get_names().keys()
+
+    def items(self):
+        for message_id in self._get_names():
+            yield message_id, self[message_id]
+
+    def __repr__(self):
+        return '<MessageRegistry loaded={0} imported={1}>'.format(
+            self._names is not None, len(self._classes))
+
+messages_by_id = MessageRegistry()
@@ -0,0 +1,104 @@
+"""
+Splits a byte stream into `<II` (type, length) framed packets.
+
+Complete frames are handed out as memoryviews into the chunk they arrived
+in, so a chunk holding many frames is split without copying it. Only a
+frame straddling chunk boundaries is assembled in a segment of its own,
+which grows on demand up to max_frame bytes.
+"""
+
+import struct
+
+from hearthy import exceptions
+
+HEADER = struct.Struct('<II')
+HEADER_LEN = HEADER.size
+
+# Upper bound for a single frame including its header. PowerHistory
+# bursts at game start easily exceed the old 16K limit.
+MAX_FRAME = 4 * 1024 * 1024
+
+class Splitter:
+    def __init__(self, max_frame=MAX_FRAME):
+        self._max_frame = max_frame
+        self._pending = bytearray()
+
+    @property
+    def pending(self):
+        """ Number of buffered bytes not yet returned as a frame. """
+        return len(self._pending)
+
+    def clear(self):
+        self._pending = bytearray()
+
+    def _check_len(self, alen):
+        if alen + HEADER_LEN > self._max_frame:
+            raise exceptions.BufferFullException(
+                'Frame of {0} bytes exceeds maximum of {1}'.format(
+                    alen + HEADER_LEN, self._max_frame))
+
+    def feed(self, buf, header=False):
+        """
+        Yields (atype, data) for every frame completed by buf, with
+        header=True data starts with the frame's header.
+
+        data is a memoryview which is only guaranteed to be valid as long
+        as buf is not modified; use bytes(data) to keep it around.
+        Breaking out of the loop is fine: whatever has not been yielded
+        yet stays buffered for the next call.
+        """
+        view = memoryview(buf)
+        pending = self._pending
+        # offset of the data handed out within a frame
+        skip = 0 if header else HEADER_LEN
+
+        if len(pending) >= HEADER_LEN:
+            atype, alen = HEADER.unpack_from(pending)
+            if len(pending) >= HEADER_LEN + alen:
+                # A loop break left whole frames behind, split them
+                # together with the new data.
+                pending += view
+                view = memoryview(pending)
+                pending = self._pending = bytearray()
+
+        end = len(view)
+        pos = 0
+
+        try:
+            if pending:
+                # Finish the frame started by a previous chunk
+                if len(pending) < HEADER_LEN:
+                    pos = min(HEADER_LEN - len(pending), end)
+                    pending += view[:pos]
+                    if len(pending) < HEADER_LEN:
+                        return
+
+                atype, alen = HEADER.unpack_from(pending)
+                self._check_len(alen)
+                take = min(HEADER_LEN + alen - len(pending), end - pos)
+                pending += view[pos:pos+take]
+                pos += take
+                if len(pending) < HEADER_LEN + alen:
+                    return
+
+                # The segment now belongs to the consumer
+                self._pending = bytearray()
+                yield (atype, memoryview(pending)[skip:])
+
+            unpack_from = HEADER.unpack_from
+            while end - pos >= HEADER_LEN:
+                atype, alen = unpack_from(view, pos)
+                self._check_len(alen)
+                start = pos + skip
+                stop = pos + HEADER_LEN + alen
+                if stop > end:
+                    break
+                pos = stop
+                yield (atype, view[start:stop])
+        finally:
+            if pos < end:
+                self._pending += view[pos:end]
+
+    def __repr__(self):
+        return '<Splitter pending={0} max_frame={1}>'.format(
+            len(self._pending), self._max_frame)
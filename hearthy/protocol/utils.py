@@ -1,9 +1,9 @@
 import sys
-import struct
 
 from hearthstone.enums import *
 
-from hearthy import exceptions
+# Splitter used to live here, keep it importable from utils
+from hearthy.protocol.splitter import Splitter
 
 # custom tags that aren't in defined in GameTag
 TAG_CUSTOM_NAME = -1
@@ -15,9 +15,6 @@ custom_tags_by_id = {
     if name.startswith('TAG_') and isinstance(value, int)
 }
 
-# 16K ought to be enough for anybody :)
-MAX_BUF = 16 * 1024
-
 def hexdump(src, length=16, sep='.', file=sys.stdout):
     FILTER = ''.join([(len(repr(chr(x))) == 3) and chr(x) or sep for x in range(256)])
     lines = []
@@ -58,35 +55,3 @@ def format_tag_value(tag, value):
         return '{0}:{1}'.format(value, enum(value))
     else:
         return str(value)
-
-class Splitter:
-    def __init__(self, max_bufsize=MAX_BUF):
-        self._buf = bytearray(max_bufsize)
-        self._offset = 0
-        self._needed = 8
-
-        # Note atype == -1 <-> we are parsing the header
-        self._atype = -1
-
-    def feed(self, buf):
-        newoffset = self._offset + len(buf)
-        if newoffset > MAX_BUF:
-            raise exceptions.BufferFullException()
-        self._buf[self._offset:newoffset] = buf
-
-        while newoffset >= self._needed:
-            if self._atype == -1:
-                atype, alen = struct.unpack('<II', self._buf[:8])
-                self._needed = alen + 8
-                self._atype = atype
-            else:
-                yield (self._atype, self._buf[8:self._needed])
-                newoffset -= self._needed
-                self._buf[:newoffset] = self._buf[self._needed:self._needed+newoffset]
-                self._needed = 8
-                self._atype = -1
-
-        self._offset = newoffset
-
-    def __repr__(self):
-        return '<Splitter offset={0._offset} needed={0._needed}>'.format(self)
@@ -0,0 +1,55 @@
+"""
+Helpers for reading and writing the protobuf wire format by hand.
+"""
+
+from hearthy.exceptions import DecodeError
+
+WT_VARINT, WT_FIXED64, WT_BYTES, WT_FIXED32 = 0, 1, 2, 5
+
+def read_varint(buf, pos):
+    """ Returns (value, new position) of the varint at buf[pos]. """
+    b = buf[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+
+    result = b & 0x7f
+    shift = 7
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def encode_varint(value):
+    # negative values are sign extended to 64 bits
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def to_int32(value):
+    """ Converts a decoded varint back to a signed int32. """
+    if value > 0x7fffffff:
+        value -= 1 << 64
+    return value
+
+def skip_field(buf, pos, key):
+    """ Returns the position after the value of the field with given key. """
+    wire_type = key & 7
+    if wire_type == WT_VARINT:
+        return read_varint(buf, pos)[1]
+    elif wire_type == WT_BYTES:
+        n, pos = read_varint(buf, pos)
+        return pos + n
+    elif wire_type == WT_FIXED64:
+        return pos + 8
+    elif wire_type == WT_FIXED32:
+        return pos + 4
+    raise DecodeError('Unsupported wire type {0} at offset {1}'.format(wire_type, pos))
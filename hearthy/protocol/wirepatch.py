@@ -0,0 +1,250 @@
+"""
+Rewrites fields of serialized protobuf messages without decoding them.
+
+A Patch is built once from rules against a message type:
+
+    patch = Patch(PowerHistory)
+    patch.set_field('list.show_entity.name', 'EX1_tk28')
+    patch.set_tag('list.show_entity', GameTag.PREMIUM, 1)
+
+and then applied to the wire bytes of every packet of that type.
+Repeated message fields on the path are matched element by element and
+sub messages which are not present (e.g. other members of a oneof) are
+left alone. Only the sub messages containing a change are re-emitted
+with new length prefixes; everything else is copied through verbatim.
+"""
+
+import struct
+
+from google.protobuf.descriptor import FieldDescriptor as FD
+
+from hearthy.exceptions import EncodeError
+from hearthy.protocol.wire import (
+    WT_VARINT, WT_FIXED64, WT_BYTES, WT_FIXED32, read_varint, encode_varint,
+    skip_field, to_int32
+    )
+
+_VARINT_TYPES = (FD.TYPE_INT32, FD.TYPE_INT64, FD.TYPE_UINT32, FD.TYPE_UINT64,
+                 FD.TYPE_BOOL, FD.TYPE_ENUM)
+
+def _is_repeated(field):
+    try:
+        return field.is_repeated
+    except AttributeError:
+        # protobuf < 5.29
+        return field.label == FD.LABEL_REPEATED
+
+def _encode_field(field, value):
+    """ Returns key and value of a scalar field in wire format. """
+    t = field.type
+    if t in _VARINT_TYPES:
+        wire_type, data = WT_VARINT, encode_varint(int(value))
+    elif t == FD.TYPE_SINT32 or t == FD.TYPE_SINT64:
+        value = int(value)
+        wire_type, data = WT_VARINT, encode_varint((value << 1) ^ (value >> 63))
+    elif t == FD.TYPE_STRING or t == FD.TYPE_BYTES:
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        wire_type, data = WT_BYTES, encode_varint(len(value)) + bytes(value)
+    elif t == FD.TYPE_FIXED32 or t == FD.TYPE_SFIXED32 or t == FD.TYPE_FLOAT:
+        fmt = {FD.TYPE_FIXED32: '<I', FD.TYPE_SFIXED32: '<i', FD.TYPE_FLOAT: '<f'}[t]
+        wire_type, data = WT_FIXED32, struct.pack(fmt, value)
+    elif t == FD.TYPE_FIXED64 or t == FD.TYPE_SFIXED64 or t == FD.TYPE_DOUBLE:
+        fmt = {FD.TYPE_FIXED64: '<Q', FD.TYPE_SFIXED64: '<q', FD.TYPE_DOUBLE: '<d'}[t]
+        wire_type, data = WT_FIXED64, struct.pack(fmt, value)
+    else:
+        raise EncodeError('Cannot set field {0} of type {1}'.format(field.full_name, t))
+    return encode_varint((field.number << 3) | wire_type) + data
+
+class _Node:
+    __slots__ = ['children', 'values', 'tags']
+
+    def __init__(self):
+        # field number -> _Node of sub message
+        self.children = {}
+        # field number -> encoded field replacing it
+        self.values = {}
+        # field number of the tag list -> _TagRule
+        self.tags = {}
+
+class _TagRule:
+    __slots__ = ['name_key', 'value_key', 'values']
+
+    def __init__(self, tag_field):
+        desc = tag_field.message_type
+        try:
+            name, value = desc.fields_by_name['name'], desc.fields_by_name['value']
+        except KeyError:
+            raise EncodeError('{0} is not a list of tags'.format(tag_field.full_name))
+        self.name_key = (name.number << 3) | WT_VARINT
+        self.value_key = (value.number << 3) | WT_VARINT
+        # tag -> value
+        self.values = {}
+
+    def encode(self, tag, value):
+        return (encode_varint(self.name_key) + encode_varint(tag) +
+                encode_varint(self.value_key) + encode_varint(value))
+
+    def read(self, buf, pos, end):
+        """ Returns (tag, value) of the serialized Tag at buf[pos:end] """
+        name = value = None
+        while pos < end:
+            key, pos = read_varint(buf, pos)
+            if key == self.name_key:
+                name, pos = read_varint(buf, pos)
+            elif key == self.value_key:
+                value, pos = read_varint(buf, pos)
+            else:
+                pos = skip_field(buf, pos, key)
+        if name is not None:
+            name = to_int32(name)
+        if value is not None:
+            value = to_int32(value)
+        return name, value
+
+def _apply(node, buf, start, end):
+    """
+    Returns the patched message in buf[start:end] or None
+    if it was not modified.
+    """
+    parts = []
+    last = start
+    seen = set()
+
+    pos = start
+    while pos < end:
+        field_start = pos
+        key, pos = read_varint(buf, pos)
+        number = key >> 3
+
+        if number in node.values:
+            pos = skip_field(buf, pos, key)
+            seen.add(number)
+            encoded = node.values[number]
+            if buf[field_start:pos] != encoded:
+                parts.append(buf[last:field_start])
+                parts.append(encoded)
+                last = pos
+        elif key & 7 != WT_BYTES:
+            pos = skip_field(buf, pos, key)
+        else:
+            n, pos = read_varint(buf, pos)
+            sub_end = pos + n
+
+            child = node.children.get(number, None)
+            if child is not None:
+                sub = _apply(child, buf, pos, sub_end)
+                if sub is not None:
+                    parts.append(buf[last:field_start])
+                    parts.append(encode_varint(key))
+                    parts.append(encode_varint(len(sub)))
+                    parts.append(sub)
+                    last = sub_end
+
+            rule = node.tags.get(number, None)
+            if rule is not None:
+                tag, value = rule.read(buf, pos, sub_end)
+                new_value = rule.values.get(tag, None)
+                if new_value is not None:
+                    seen.add((number, tag))
+                    if value != new_value:
+                        sub = rule.encode(tag, new_value)
+                        parts.append(buf[last:field_start])
+                        parts.append(encode_varint(key))
+                        parts.append(encode_varint(len(sub)))
+                        parts.append(sub)
+                        last = sub_end
+
+            pos = sub_end
+
+    if pos != end:
+        raise EncodeError('Truncated message')
+
+    # fields and tags that were not there yet get appended
+    for number, encoded in node.values.items():
+        if number not in seen:
+            parts.append(buf[last:end])
+            parts.append(encoded)
+            last = end
+    for number, rule in node.tags.items():
+        for tag, value in rule.values.items():
+            if (number, tag) not in seen:
+                sub = rule.encode(tag, value)
+                parts.append(buf[last:end])
+                parts.append(encode_varint((number << 3) | WT_BYTES))
+                parts.append(encode_varint(len(sub)))
+                parts.append(sub)
+                last = end
+
+    if not parts:
+        return None
+
+    parts.append(buf[last:end])
+    return b''.join(parts)
+
+class Patch:
+    """
+    Set of field rewrites for serialized messages of one type.
+    """
+    def __init__(self, message_type):
+        self._descriptor = message_type.DESCRIPTOR
+        self._root = _Node()
+
+    def _resolve(self, path):
+        """
+        Returns (node, field) for a dotted path, creating the nodes
+        of all sub messages leading to the last field.
+        """
+        names = path.split('.') if isinstance(path, str) else list(path)
+        desc = self._descriptor
+        node = self._root
+
+        for i, name in enumerate(names):
+            try:
+                field = desc.fields_by_name[name]
+            except KeyError:
+                raise EncodeError('{0} has no field {1!r}'.format(desc.full_name, name))
+            if i == len(names) - 1:
+                return node, field
+            if field.type != FD.TYPE_MESSAGE:
+                raise EncodeError('{0} is not a message'.format(field.full_name))
+            node = node.children.setdefault(field.number, _Node())
+            desc = field.message_type
+
+        raise EncodeError('Empty path')
+
+    def set_field(self, path, value):
+        """
+        Sets the scalar field at path to value in every
+        message the path matches.
+        """
+        node, field = self._resolve(path)
+        if _is_repeated(field) or field.type == FD.TYPE_MESSAGE:
+            raise EncodeError('{0} is not a singular scalar field'.format(field.full_name))
+        node.values[field.number] = _encode_field(field, value)
+        return self
+
+    def set_tag(self, path, tag, value, tags_field='tags'):
+        """
+        Sets tag to value in the tag list of every entity the
+        path matches, adding the tag if it is missing.
+        """
+        if isinstance(path, str):
+            path = path.split('.') if path else []
+        node, field = self._resolve(list(path) + [tags_field])
+        rule = node.tags.get(field.number, None)
+        if rule is None:
+            rule = node.tags[field.number] = _TagRule(field)
+        rule.values[int(tag)] = int(value)
+        return self
+
+    def apply(self, buf):
+        """
+        Returns the patched message, or None if buf needs no changes.
+        """
+        if not isinstance(buf, bytes):
+            buf = bytes(buf)
+        try:
+            return _apply(self._root, buf, 0, len(buf))
+        except IndexError:
+            raise EncodeError('Truncated message')
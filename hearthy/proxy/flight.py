@@ -0,0 +1,199 @@
+"""
+In-memory flight recorder for the proxies.
+
+Keeps the most recent frames of every proxied connection in memory,
+bounded both by age and by a fixed total size, and dumps them to an
+hcapng capture on demand: by calling dump, or by sending the process
+a signal once install_signal has been called.
+
+It offers the interface of recorder.Recorder, so it is passed to the
+proxies in the same way. Received data is split into frames, so old
+data is dropped a whole frame at a time and a dumped connection
+always starts at a frame boundary. Data that does not split into
+frames is kept in the chunks it was received in.
+"""
+
+import collections
+import datetime
+import heapq
+import itertools
+import logging
+import signal
+import threading
+import time
+
+from hearthy.datasource import hcapng
+from hearthy.protocol.splitter import HEADER, MAX_FRAME, Splitter
+from hearthy.proxy.recorder import _address, _ms
+
+logger = logging.getLogger(__name__)
+
+PATTERN = 'flight-{time:%Y%m%d-%H%M%S}.hcapng'
+MAX_BYTES = 64 * 1024 * 1024
+MAX_AGE = 5 * 60
+# rough size of the objects holding a frame, counted against max_bytes
+ENTRY_OVERHEAD = 100
+
+class _Connection:
+    __slots__ = ['stream_id', 'source', 'dest', 'start', 'end', 'frames', 'splitters',
+                 'pending']
+
+    def __init__(self, stream_id, source, dest, start, max_frame):
+        self.stream_id = stream_id
+        self.source = source
+        self.dest = dest
+        self.start = start
+        self.end = None
+        # (time, who, frame), oldest first
+        self.frames = collections.deque()
+        # set to None for a direction that does not split into frames
+        self.splitters = [Splitter(max_frame), Splitter(max_frame)]
+        # bytes of a partial frame each splitter holds
+        self.pending = [0, 0]
+
+class FlightRecorder:
+    """
+    Keeps up to max_bytes of frames (plus ENTRY_OVERHEAD each) which
+    are at most max_age seconds old. Partial frames still being split
+    count against max_bytes as well.
+    """
+    def __init__(self, max_bytes=MAX_BYTES, max_age=MAX_AGE, pattern=PATTERN):
+        self._max_bytes = max_bytes
+        self._max_age = max_age * 1000
+        self._pattern = pattern
+        self._lock = threading.Lock()
+        self._connections = {}
+        # (time, connection), oldest first, an entry per frame of the
+        # connection, so the oldest frame of all is popped right away
+        self._order = collections.deque()
+        self._size = 0
+        self._stream_ids = itertools.count()
+
+    @property
+    def size(self):
+        """ Memory currently accounted for, at most max_bytes. """
+        return self._size
+
+    def new_connection(self, source, dest):
+        stream_id = next(self._stream_ids)
+        # a partial frame alone never exceeds the ceiling
+        conn = _Connection(stream_id, _address(source), _address(dest), _ms(),
+                           min(MAX_FRAME, max(self._max_bytes, HEADER.size)))
+        with self._lock:
+            self._connections[stream_id] = conn
+        return stream_id
+
+    def _frames(self, conn, who, data):
+        splitter = conn.splitters[who]
+        if splitter is None:
+            return [bytes(data)]
+        try:
+            return [HEADER.pack(atype, len(buf)) + buf for atype, buf in splitter.feed(data)]
+        except Exception as e:
+            logger.warning('Stream {0} does not split into frames ({1}), keeping chunks'.format(
+                conn.stream_id, e))
+            conn.splitters[who] = None
+            return [bytes(data)]
+
+    def data(self, stream_id, who, data):
+        with self._lock:
+            # taken under the lock to keep _order sorted by time
+            t = _ms()
+            conn = self._connections.get(stream_id, None)
+            if conn is None or conn.end is not None:
+                return
+            for frame in self._frames(conn, who, data):
+                conn.frames.append((t, who, frame))
+                self._order.append((t, conn))
+                self._size += len(frame) + ENTRY_OVERHEAD
+
+            splitter = conn.splitters[who]
+            pending = 0 if splitter is None else splitter.pending
+            self._size += pending - conn.pending[who]
+            conn.pending[who] = pending
+            self._evict(t)
+
+    def close_connection(self, stream_id):
+        with self._lock:
+            conn = self._connections.get(stream_id, None)
+            if conn is not None:
+                conn.end = _ms()
+                conn.splitters = None
+                self._size -= sum(conn.pending)
+                conn.pending = [0, 0]
+                if not conn.frames:
+                    del self._connections[stream_id]
+
+    def _pop(self):
+        t, conn = self._order.popleft()
+        t, who, frame = conn.frames.popleft()
+        self._size -= len(frame) + ENTRY_OVERHEAD
+        if not conn.frames and conn.end is not None:
+            del self._connections[conn.stream_id]
+
+    def _evict(self, t):
+        order = self._order
+        cutoff = t - self._max_age
+        while order and order[0][0] < cutoff:
+            self._pop()
+        # what is left over the ceiling are partial frames
+        while self._size > self._max_bytes and order:
+            self._pop()
+
+    def dump(self, path=None, wait=False):
+        """
+        Writes the frames buffered at the time of the call to an hcapng
+        file in a background thread, so forwarding only waits while
+        they are being listed. Returns the path written to.
+        """
+        now = _ms()
+        wall = time.time()
+        if path is None:
+            path = self._pattern.format(time=datetime.datetime.fromtimestamp(wall))
+        thread = threading.Thread(target=self._dump, args=(path, now, wall), daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return path
+
+    def _dump(self, path, now, wall):
+        cutoff = now - self._max_age
+        with self._lock:
+            snapshot = [(conn, conn.end, list(conn.frames))
+                        for conn in self._connections.values()]
+
+        streams = []
+        oldest = now
+        for conn, end, frames in snapshot:
+            t = max(conn.start, cutoff)
+            if frames:
+                t = min(t, frames[0][0])
+            oldest = min(oldest, t)
+
+            events = [(t, conn.stream_id, None, (conn.source, conn.dest))]
+            events.extend((t, conn.stream_id, who, frame) for t, who, frame in frames)
+            if end is not None and end <= now:
+                events.append((end, conn.stream_id, None, None))
+            streams.append(events)
+
+        # header timestamp of the second the oldest event happened in
+        ts = int(wall - (now - oldest) / 1000)
+        ref = now - int((wall - ts) * 1000)
+        try:
+            with open(path, 'wb') as f:
+                writer = hcapng.Writer(f, ts)
+                for t, stream_id, who, what in heapq.merge(*streams, key=lambda e: e[0]):
+                    if who is not None:
+                        writer.data(t - ref, stream_id, who, what)
+                    elif what is not None:
+                        writer.new_connection(t - ref, stream_id, *what)
+                    else:
+                        writer.close_connection(t - ref, stream_id)
+        except OSError:
+            logger.exception('Failed to dump to {0}'.format(path))
+            return
+        logger.info('Dumped {0} connections to {1}'.format(len(streams), path))
+
+    def install_signal(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """ Dumps with the default file name whenever signum is received. """
+        signal.signal(signum, lambda signum, frame: self.dump())
@@ -1,38 +1,18 @@
-import struct
-from hearthy.proxy.pipe import SimpleBuf, SimplePipe
+from hearthy import exceptions
+from hearthy.proxy.pipe import SimplePipe
 from hearthy.protocol import decoder
+from hearthy.protocol.splitter import HEADER, Splitter
 from pegasus.game_pb2 import Handshake
 
 MODE_INTERCEPT, MODE_PASSIVE, MODE_LURKING = range(3)
-INTERCEPT_REJECT, INTERCEPT_ACCEPT = range(2)
-
-class SplitterBuf(SimpleBuf):
-    """
-    In principle same functionality as hearthy.protocol.utils.Splitter.
-    This version has the benefit of correctly handling loop breaks.
-    """
-    def pull_segment(self):
-        segment = self.peek_segment()
-        if segment is not None:
-            self._start += 8 + len(segment[1])
-        return segment
-
-    def peek_segment(self):
-        used = self.used
-        if used < 8:
-            return
-        
-        atype, alen = struct.unpack('<II', self.peek(8))
-
-        if used < alen + 8:
-            return
-
-        return (atype, self.peek(alen, offset=8))
+# INTERCEPT_ACCEPT re-encodes the (possibly modified) packet,
+# INTERCEPT_ACCEPT_UNCHANGED forwards the bytes as they were received.
+INTERCEPT_REJECT, INTERCEPT_ACCEPT, INTERCEPT_ACCEPT_UNCHANGED = range(3)
 
 class InterceptPipe(SimplePipe):
     def __init__(self, a, b, handler):
         super().__init__(a, b)
-        self._splitters = [SplitterBuf(), SplitterBuf()]
+        self._splitters = [Splitter(), Splitter()]
         self._mode = MODE_LURKING
         self._encode_buf = bytearray(16 * 1024)
         self._handler = handler
@@ -41,19 +21,23 @@ class InterceptPipe(SimplePipe):
         opid = 1 - epid
         splitter = self._splitters[epid]
 
-        if splitter.free < n_bytes:
+        # Check if we have a full segment, anything after it
+        # stays in the splitter once we stop iterating.
+        frames = splitter.feed(buf.last(n_bytes))
+        try:
+            segment = next(frames, None)
+        except exceptions.BufferFullException:
             print('WARNING: not enough buffer space, going into passive mode')
             self._mode = MODE_PASSIVE
             return
+        finally:
+            frames.close()
 
-        # Check if we have a full segment
-        splitter.append(buf.last(n_bytes))
-        segment = splitter.pull_segment()
         if segment is None:
             return
 
         # Calculate how much of the n_bytes don't belong to the first segment
-        remaining = splitter.used
+        remaining = splitter.pending
         assert remaining < n_bytes, "We missed the pull that completed the first segment!"
 
         # Clear splitter
@@ -81,28 +65,30 @@ class InterceptPipe(SimplePipe):
         handler = self._handler
 
         # steal data
-        if n_bytes > 0:
-            splitter.append(buf.last(n_bytes))
-            buf._end -= n_bytes
+        if n_bytes == 0:
+            return
+        data = buf.last(n_bytes)
+        buf._end -= n_bytes
 
         # decode and forward data
-        while True:
-            segment = splitter.pull_segment()
-            if segment is None:
-                break
-
-            decoded = decoder.decode_packet(*segment)
+        for atype, frame in splitter.feed(data, header=True):
+            abuf = frame[HEADER.size:]
+            decoded = decoder.decode_packet(atype, abuf, interest=handler.interest)
             action = handler.on_packet(epid, decoded)
 
             if action == INTERCEPT_REJECT:
                 # nothing to do in this case
                 pass
+            elif action == INTERCEPT_ACCEPT_UNCHANGED:
+                # the frame as received, header included
+                buf.reserve(len(frame))
+                buf.append(frame)
             elif action == INTERCEPT_ACCEPT:
+                # encode_packet grows the buffer as needed
                 offset = decoder.encode_packet(decoded, self._encode_buf)
+                buf.reserve(offset)
+                buf.append(memoryview(self._encode_buf)[:offset])
 
-                # forward packet (hopefully everything fits into the buffer)
-                buf.append(self._encode_buf[:offset])
-        
     def _on_pull(self, epid, buf, n_bytes):
         if n_bytes == 0:
             return
@@ -120,9 +106,13 @@ class InterceptProxyHandler:
 
     def connect(self, ep0, ep1):
         handler = self._handler_factory(*self._args, **self._kwargs)
-        InterceptPipe(ep0, ep1, handler=handler)
+        return InterceptPipe(ep0, ep1, handler=handler)
 
 class InterceptHandler:
+    # Packet types passed to on_packet decoded, others arrive as
+    # decoder.RawPacket. None decodes everything.
+    interest = None
+
     def __init__(self):
         self._interceptor = None
 
@@ -135,7 +125,11 @@ class InterceptHandler:
         self._interceptor = value
 
     def on_packet(self, epid, packet):
-        return INTERCEPT_ACCEPT
+        """
+        Return INTERCEPT_ACCEPT if packet has been modified,
+        INTERCEPT_ACCEPT_UNCHANGED to forward it as is.
+        """
+        return INTERCEPT_ACCEPT_UNCHANGED
 
     def on_start_intercept(self, first):
         pass
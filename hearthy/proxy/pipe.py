@@ -33,6 +33,20 @@ class SimpleBuf:
             self._start = 0
             self._end = end
 
+    def reserve(self, n):
+        """
+        Grows the buffer so that at least n bytes are free.
+        """
+        if n <= self.free:
+            return
+        used = self.used
+        buf = bytearray(max(2 * self._max, used + n))
+        buf[:used] = self._buf[self._start:self._end]
+        self._buf = buf
+        self._max = len(buf)
+        self._start = 0
+        self._end = used
+
     def clear(self):
         self._start = self._end = 0
 
@@ -196,6 +210,16 @@ class SimplePipe:
         a.cb = self._on_endpoint_event
         b.cb = self._on_endpoint_event
 
+        self._recorder = None
+        self._stream_id = None
+
+    def record(self, recorder, source, dest):
+        """
+        Records the traffic of the pipe as it is received, before any
+        subclass gets to see it. Endpoint a is taken to be the client.
+        """
+        self._recorder = recorder
+        self._stream_id = recorder.new_connection(source, dest)
 
     def _on_pull(self, epid, buf, n_bytes):
         """
@@ -228,10 +252,16 @@ class SimplePipe:
             op.want_pull(not ep.closed and self._bufs[epid].free > 0)
         elif ev_type == 'may_pull':
             n = ep.pull(self._bufs[opid])
+            if self._recorder is not None and n:
+                self._recorder.data(self._stream_id, epid, self._bufs[opid].last(n))
             self._on_pull(epid, self._bufs[opid], n)
             ep.want_pull(self._bufs[opid].free > 0)
             op.want_push(not ep.closed and self._bufs[opid].used > 0)
         elif ev_type == 'closed':
+            if self._recorder is not None:
+                self._recorder.close_connection(self._stream_id)
+                self._recorder = None
+
             # This should be called twice - exactly once for each endpoint.
             #
             # When we receive a close event we still try to send
@@ -2,27 +2,65 @@
 Basic tcp proxy server using asyncore.
 Relies on SO_ORIGINAL_DST which only works on linux/ipv4.
 """
+import logging
+
 from hearthy.proxy import pipe
 
+logger = logging.getLogger(__name__)
+
 class BasicProxyHandler:
     @classmethod
     def connect(self, ep0, ep1):
-        pipe.SimplePipe(ep0, ep1)
+        return pipe.SimplePipe(ep0, ep1)
 
 class Proxy:
-    def __init__(self, listen, handler):
+    """
+    If a recorder (see hearthy.proxy.recorder and .flight) is given,
+    every connection is recorded. This needs the handler's connect to
+    return the pipe it created.
+    """
+    def __init__(self, listen, handler, recorder=None):
         provider = pipe.TcpEndpointProvider(listen)
         provider.cb = self._on_connection
         self._handler = handler
+        self._recorder = recorder
 
     def _on_connection(self, provider, ev_type, ev_data):
         """ Called when a connection to the proxy has been established. """
         addr_orig, ep = ev_data
 
         remote = pipe.TcpEndpoint.from_connect(addr_orig)
-        self._handler.connect(ep, remote)
+        p = self._handler.connect(ep, remote)
+        if self._recorder is not None:
+            if p is None:
+                logger.warning('Handler returned no pipe, not recording')
+            else:
+                p.record(self._recorder, ep.addr, addr_orig)
 
 if __name__ == '__main__':
+    import argparse
     import asyncore
-    p = Proxy(('0.0.0.0', 5412), handler=BasicProxyHandler)
-    asyncore.loop()
+    from hearthy.proxy.flight import FlightRecorder
+    from hearthy.proxy.recorder import Recorder
+
+    parser = argparse.ArgumentParser(description='Transparent proxy')
+    # a proxy takes a single recorder
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('-r', '--record', metavar='PATTERN',
+                      help="record to files, e.g. 'captures/proxy-{n}.hcapng' (hourly)")
+    mode.add_argument('-f', '--flight', action='store_true',
+                      help='keep recent traffic in memory, dumped on SIGUSR1')
+    args = parser.parse_args()
+
+    recorder = None
+    if args.record:
+        recorder = Recorder(args.record, max_age=3600)
+    elif args.flight:
+        recorder = FlightRecorder()
+        recorder.install_signal()
+    p = Proxy(('0.0.0.0', 5412), handler=BasicProxyHandler, recorder=recorder)
+    try:
+        asyncore.loop()
+    finally:
+        if isinstance(recorder, Recorder):
+            recorder.close()
@@ -0,0 +1,170 @@
+"""
+Records proxied connections as hcapng captures.
+
+The proxies call new_connection, data and close_connection from
+their forwarding path. These only timestamp the event and append it
+to a bounded queue, a background thread does the writing. When the
+queue is full the event is dropped and counted in dropped rather
+than holding up forwarding, so a capture with drops is missing data.
+
+The writer thread takes whatever has been queued in one go and
+writes it through a large file buffer, flushed every flush_interval
+seconds. It starts a new file once the current one is max_size bytes
+or max_age seconds old. Connections still open are announced again
+at the start of the new file, so every file can be parsed on its own.
+"""
+
+import collections
+import datetime
+import itertools
+import logging
+import os
+import threading
+import time
+
+from hearthy.datasource import hcapng
+
+logger = logging.getLogger(__name__)
+
+PATTERN = 'capture-{time:%Y%m%d-%H%M%S}-{n}.hcapng'
+QUEUE_SIZE = 4096
+WRITE_BUFFER = 1024 * 1024
+FLUSH_INTERVAL = 1.0
+# how long the writer sleeps when there is nothing to write
+POLL_INTERVAL = 0.01
+
+_EV_NEW, _EV_DATA, _EV_CLOSE = range(3)
+
+def _ms():
+    return int(time.monotonic() * 1000)
+
+def _address(addr):
+    """ Returns (ip, port) of a socket address if it can be recorded. """
+    try:
+        hcapng._parse_ipv4(addr[0])
+        return (addr[0], addr[1])
+    except (TypeError, ValueError, IndexError):
+        # e.g. IPv6, hcapng only knows IPv4
+        return ('0.0.0.0', addr[1] if isinstance(addr, tuple) and len(addr) > 1 else 0)
+
+class Recorder:
+    """
+    Records connections into files named after pattern, formatted
+    with the file number n and the time it was started.
+    A max_size or max_age of None disables that kind of rotation.
+    """
+    def __init__(self, pattern=PATTERN, max_size=None, max_age=None,
+                 queue_size=QUEUE_SIZE, flush_interval=FLUSH_INTERVAL):
+        self._pattern = pattern
+        self._max_size = max_size
+        self._max_age = max_age
+        self._flush_interval = flush_interval
+        # appends and pops of a deque need no lock
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._stopping = False
+        self._stream_ids = itertools.count()
+        self.dropped = 0
+        self.files = []
+        self.error = None
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        if len(self._queue) < self._queue_size:
+            self._queue.append(item)
+        else:
+            self.dropped += 1
+
+    def new_connection(self, source, dest):
+        """ Records a new connection, returns its stream id. """
+        stream_id = next(self._stream_ids)
+        self._put((_EV_NEW, _ms(), stream_id, _address(source), _address(dest)))
+        return stream_id
+
+    def data(self, stream_id, who, data):
+        """
+        Records data sent by the client (who=0) or the server (who=1).
+        data must not be modified afterwards, it is written as is.
+        """
+        self._put((_EV_DATA, _ms(), stream_id, who, data))
+
+    def close_connection(self, stream_id):
+        self._put((_EV_CLOSE, _ms(), stream_id, None, None))
+
+    def close(self):
+        """ Writes out everything queued so far and stops recording. """
+        self._stopping = True
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self, connections):
+        path = self._pattern.format(n=len(self.files), time=datetime.datetime.now())
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(path, 'wb', buffering=WRITE_BUFFER)
+        now = _ms()
+        # events still queued were timestamped before the file was
+        # opened, the file starts with the oldest of them
+        start = min(now, self._queue[0][1]) if self._queue else now
+        writer = hcapng.Writer(f, int(time.time() - (now - start) / 1000))
+        for stream_id, (source, dest) in connections.items():
+            writer.new_connection(0, stream_id, source, dest)
+        self.files.append(path)
+        logger.info('Recording to {0}'.format(path))
+        return f, writer, start
+
+    def _run(self):
+        connections = {}
+        pending = self._queue
+        f = None
+        try:
+            f, writer, start = self._open(connections)
+            next_flush = time.monotonic() + self._flush_interval
+            while True:
+                if not pending:
+                    if self._stopping:
+                        break
+                    time.sleep(POLL_INTERVAL)
+
+                while pending:
+                    evtype, t, stream_id, a, b = pending.popleft()
+                    if evtype == _EV_DATA:
+                        writer.data(t - start, stream_id, a, b)
+                    elif evtype == _EV_NEW:
+                        connections[stream_id] = (a, b)
+                        writer.new_connection(t - start, stream_id, a, b)
+                    else:
+                        connections.pop(stream_id, None)
+                        writer.close_connection(t - start, stream_id)
+
+                    if self._max_size is not None and f.tell() >= self._max_size:
+                        f.close()
+                        f = None
+                        f, writer, start = self._open(connections)
+
+                now = time.monotonic()
+                if now >= next_flush:
+                    f.flush()
+                    next_flush = now + self._flush_interval
+                if self._max_age is not None and _ms() - start >= self._max_age * 1000:
+                    f.close()
+                    f = None
+                    f, writer, start = self._open(connections)
+        except Exception as e:
+            # e.g. the disk is full, everything from now on is dropped
+            logger.exception('Recording failed')
+            self.error = e
+            self._queue_size = 0
+            self.dropped += len(pending)
+            pending.clear()
+        finally:
+            if f is not None:
+                f.close()
@@ -0,0 +1,245 @@
+"""
+Exports the tag history of captures as NumPy columns.
+
+Every tag set by a PowerHistory becomes one row:
+
+    time    int64   capture time in ms since the epoch
+    stream  uint32  stream id within its capture
+    game    uint32  game number, unique over all exported captures
+    turn    int32   turn of the game when the row was recorded
+    entity  int32
+    tag     int32
+    value   int32
+    kind    uint8   powerhistory.TAG_CHANGE, FULL_ENTITY, ...
+    card    int32   index into cards for rows of full/shown
+                    entities, -1 otherwise
+
+cards holds the card ids and games the (capture, stream id, start
+time) of every game. The arrays are stored uncompressed in an .npz
+file so load() can memory map them:
+
+    cols = columnar.load('history.npz')
+    played = (cols.kind == TAG_CHANGE) & (cols.tag == GameTag.ZONE) & \\
+             (cols.value == Zone.PLAY)
+    counts = np.bincount(columnar.entity_cards(cols)[played] + 1)[1:]
+"""
+
+import os
+import zipfile
+from array import array
+
+import numpy as np
+from hearthstone.enums import GameTag
+
+from hearthy.datasource import hcapng
+from hearthy.protocol import powerhistory
+from hearthy.protocol.splitter import Splitter
+from pegasus.game_pb2 import PowerHistory
+
+COLUMNS = (
+    ('time', 'q', np.int64),
+    ('stream', 'I', np.uint32),
+    ('game', 'I', np.uint32),
+    ('turn', 'i', np.int32),
+    ('entity', 'i', np.int32),
+    ('tag', 'i', np.int32),
+    ('value', 'i', np.int32),
+    ('kind', 'B', np.uint8),
+    ('card', 'i', np.int32)
+)
+
+class _Game:
+    __slots__ = ['number', 'splitters', 'game_entity', 'turn']
+
+    def __init__(self, number):
+        self.number = number
+        self.splitters = [Splitter(), Splitter()]
+        self.game_entity = None
+        self.turn = 0
+
+class Exporter:
+    """ Collects the rows of any number of captures. """
+    def __init__(self):
+        self._cols = {name: array(typecode) for name, typecode, dtype in COLUMNS}
+        self._cards = {}
+        self.games = []
+
+    def _card(self, card_id):
+        index = self._cards.get(card_id, None)
+        if index is None:
+            index = self._cards[card_id] = len(self._cards)
+        return index
+
+    def _add(self, time, stream_id, game, entity, kind, card, tags):
+        cols = self._cols
+        n = len(tags) // 2
+        cols['time'].extend([time] * n)
+        cols['stream'].extend([stream_id] * n)
+        cols['game'].extend([game.number] * n)
+        cols['turn'].extend([game.turn] * n)
+        cols['entity'].extend([entity] * n)
+        cols['tag'].extend(tags[::2])
+        cols['value'].extend(tags[1::2])
+        cols['kind'].extend([kind] * n)
+        cols['card'].extend([card] * n)
+
+    def _power_history(self, time, stream_id, game, buf):
+        for kind, eid, a, b in powerhistory.scan(buf):
+            if kind == powerhistory.TAG_CHANGE:
+                if a == GameTag.TURN and eid == game.game_entity:
+                    game.turn = b
+                self._add(time, stream_id, game, eid, kind, -1, (a, b))
+            elif kind == powerhistory.CREATE_GAME:
+                game.game_entity = b.game_entity.id
+                for entity in [b.game_entity] + [p.entity for p in b.players]:
+                    tags = array('i')
+                    for tag in entity.tags:
+                        tags.append(tag.name)
+                        tags.append(tag.value)
+                        if tag.name == GameTag.TURN and entity is b.game_entity:
+                            game.turn = tag.value
+                    self._add(time, stream_id, game, entity.id, kind, -1, tags)
+            else:
+                card = self._card(a) if a else -1
+                self._add(time, stream_id, game, eid, kind, card, b)
+
+    def add_capture(self, f, name=None):
+        """ Adds the rows of the capture in file f. """
+        games = {}
+        base = 0
+        for ts, event in hcapng.parse(f):
+            if isinstance(event, hcapng.EvHeader):
+                base = event.ts * 1000
+            elif isinstance(event, hcapng.EvNewConnection):
+                games[event.stream_id] = _Game(len(self.games))
+                self.games.append((name, event.stream_id, base + ts))
+            elif isinstance(event, hcapng.EvClose):
+                games.pop(event.stream_id, None)
+            elif isinstance(event, hcapng.EvData):
+                game = games.get(event.stream_id, None)
+                if game is None:
+                    continue
+                try:
+                    for atype, buf in game.splitters[event.who].feed(event.data):
+                        if atype == PowerHistory.ID:
+                            self._power_history(base + ts, event.stream_id, game, buf)
+                except Exception:
+                    # as in hcap_generate_logs, a broken stream is dropped
+                    del games[event.stream_id]
+
+    def columns(self):
+        """ Returns the collected data as a dict of arrays. """
+        ret = {name: np.frombuffer(self._cols[name], dtype=dtype).copy()
+               for name, typecode, dtype in COLUMNS}
+        cards = sorted(self._cards, key=self._cards.get)
+        ret['cards'] = np.array(cards, dtype=str) if cards else np.zeros(0, dtype='U1')
+        ret['game_capture'] = np.array([g[0] or '' for g in self.games], dtype=str)
+        ret['game_stream'] = np.array([g[1] for g in self.games], dtype=np.uint32)
+        ret['game_start'] = np.array([g[2] for g in self.games], dtype=np.int64)
+        return ret
+
+    def save(self, path):
+        # uncompressed, or the columns could not be mapped on load
+        np.savez(path, **self.columns())
+
+class Columns:
+    """ Attribute access to the arrays of an export. """
+    def __init__(self, arrays):
+        self.__dict__.update(arrays)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return '<Columns rows={0} games={1} cards={2}>'.format(
+            len(self), len(self.game_start), len(self.cards))
+
+def _map_member(path, info):
+    """ Maps an uncompressed .npy member of a zip file. """
+    with open(path, 'rb') as f:
+        # the local header may differ from the central directory one
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if dtype.hasobject:
+        raise ValueError('Cannot map object arrays')
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran else 'C')
+
+def load(path, mmap=True):
+    """
+    Loads an export. With mmap the columns are mapped from the file
+    instead of being read, which np.load does not do for .npz files.
+    """
+    if not mmap:
+        with np.load(path) as data:
+            return Columns({name: data[name] for name in data.files})
+
+    arrays = {}
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type == zipfile.ZIP_STORED:
+                arrays[name] = _map_member(path, info)
+            else:
+                with zf.open(info) as f:
+                    arrays[name] = np.lib.format.read_array(f)
+    return Columns(arrays)
+
+def entity_cards(cols):
+    """
+    Returns the card index of every row's entity as last revealed in
+    its game, -1 if it never was.
+    """
+    known = np.flatnonzero(cols.card >= 0)
+    if not len(known):
+        return np.full(len(cols), -1, dtype=np.int32)
+
+    keys = (cols.game.astype(np.int64) << 32) | cols.entity.astype(np.uint32)
+    # last reveal per (game, entity) wins
+    known_keys, last = np.unique(keys[known][::-1], return_index=True)
+    known_cards = cols.card[known][::-1][last]
+
+    pos = np.minimum(np.searchsorted(known_keys, keys), len(known_keys) - 1)
+    return np.where(known_keys[pos] == keys, known_cards[pos], -1)
+
+def _capture_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for fn in sorted(files):
+                    if not fn.endswith('.idx'):
+                        yield os.path.join(root, fn)
+        else:
+            yield path
+
+if __name__ == '__main__':
+    import sys
+    import logging
+
+    if len(sys.argv) < 3:
+        print('Usage: {0} <output .npz> <capture or directory>...'.format(sys.argv[0]),
+              file=sys.stderr)
+        sys.exit(1)
+
+    exporter = Exporter()
+    for path in _capture_files(sys.argv[2:]):
+        try:
+            with open(path, 'rb') as f:
+                exporter.add_capture(f, path)
+        except hcapng.HCapException as e:
+            logging.warning('Skipping {0}: {1}'.format(path, e))
+    exporter.save(sys.argv[1])
+
+    cols = load(sys.argv[1])
+    print('{0} rows, {1} games, {2} cards'.format(len(cols), len(cols.game_start), len(cols.cards)))
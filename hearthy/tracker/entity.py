@@ -8,9 +8,7 @@ from hearthy.exceptions import CardNotFound
 from hearthy.db import cards
 
 class EntityBase:
-    def __init__(self, eid, tag_list):
-        self._eid = eid
-        self._tags = dict(tag_list)
+    __slots__ = ()
 
     @property
     def id(self):
@@ -48,26 +46,52 @@ class EntityBase:
         return '[{0}: {1!r} of {2} in {3}]'.format(self.id, cardname, whom, where)
 
 class Entity(EntityBase):
-    pass
+    """
+    An entity of a World. Its tags live in the world's tag store,
+    the entity is only a view of them.
+    """
+    __slots__ = ['_store', '_eid']
+
+    def __init__(self, store, eid):
+        self._store = store
+        self._eid = eid
+
+    def __getitem__(self, tag):
+        return self._store.get(self._eid, tag)
+
+    def __contains__(self, tag):
+        return self._store.get(self._eid, tag) is not None
+
+    @property
+    def _tags(self):
+        """ A copy of all tags of the entity. """
+        return self._store.tags(self._eid)
 
 class MutableEntity(EntityBase):
+    """ An entity created by a transaction, not part of the world yet. """
+    __slots__ = ['_eid', '_tags']
+
+    def __init__(self, eid, tag_list):
+        self._eid = eid
+        self._tags = dict(tag_list)
+
     def __setitem__(self, tag, value):
         self._tags[tag] = value
 
-    def freeze(self):
-        self.__class__ = Entity
-        return self
+    def freeze(self, store):
+        """ Moves the tags into store, returns the entity of the world. """
+        store.add(self._eid, self._tags)
+        return Entity(store, self._eid)
 
 class MutableView(EntityBase):
+    """ Changes of a transaction to an entity of the world. """
+    __slots__ = ['_e', '_eid', '_tags']
+
     def __init__(self, entity):
         self._e = entity
         self._eid = entity.id
         self._tags = dict()
 
-    @property
-    def id(self):
-        return self._eid
-
     def __getitem__(self, tag):
         value = self._tags.get(tag, None)
         if value is None:
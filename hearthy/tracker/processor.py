@@ -1,27 +1,109 @@
 import logging
+from hearthstone.enums import GameTag
 from hearthy.tracker.world import World
 from hearthy.protocol.utils import (
     TAG_CUSTOM_NAME, TAG_POWER_NAME, format_tag_name, format_tag_value
     )
-from hearthy.tracker.entity import Entity
+from hearthy.tracker.entity import Entity, MutableEntity
+from hearthy.protocol.decoder import RawPacket, interest
+from hearthy.protocol import powerhistory
 from pegasus.game_pb2 import PowerHistory
 
 logger = logging.getLogger(__name__)
 
 class Processor:
-    def __init__(self):
-        self._world = World()
+    # Packets the processor looks at, anything else may be left undecoded
+    INTEREST = interest(PowerHistory)
+
+    def __init__(self, wire=False, journal=False, batch=False, tracer=None, indexes=()):
+        """
+        With wire=True PowerHistory packets are best left undecoded:
+        they are read straight from the wire format instead.
+        With journal=True the world can be seeked with World.at.
+
+        With batch=True, meant for replaying captures, the packets of
+        a turn are applied to the world in one transaction when the
+        turn ends, rather than one transaction per packet. Callbacks
+        and watchers of the world thus see one change per tag and
+        turn. flush applies what is left once all packets are in.
+
+        Changes are passed to tracer if given, a trace.Tracer, which
+        costs far less than logging them.
+
+        indexes are the tags the world keeps an index of, see World.
+        """
+        self._world = World(journal=journal, indexes=indexes)
+        self._world.tracer = tracer
+        self.tracer = tracer
         self.logger = logger
+        self.interest = frozenset() if wire else self.INTEREST
+
+        # packets of the open transaction in batch mode
+        self._batch = [] if batch else None
+        self._transaction = None
+        self._turn_changed = False
+        # set while a batch is redone, its changes were traced and
+        # logged the first time round
+        self._quiet = False
 
-    def process(self, who, what):
-        with self._world.transaction() as t:
+    def process(self, who, what, ts=None):
+        if self._batch is not None:
+            self._process_batched(who, what, ts)
+            return
+        with self._world.transaction(ts) as t:
+            self._process(who, what, t)
+
+    def _process_batched(self, who, what, ts):
+        t = self._transaction
+        if t is None:
+            t = self._transaction = self._world.transaction(ts)
+        t.ts = ts
+        self._batch.append((who, what, ts))
+        try:
             self._process(who, what, t)
+        except Exception:
+            # Part of this packet is in the transaction now. Redo the
+            # batch a packet at a time, the world ends up as with
+            # process and the exception is raised again.
+            packets = self._batch
+            self._batch = []
+            self._transaction = None
+            tracer = self.tracer
+            self.tracer = None
+            self._quiet = True
+            try:
+                for who, what, ts in packets:
+                    with self._world.transaction(ts) as t:
+                        self._process(who, what, t)
+            finally:
+                self.tracer = tracer
+                self._quiet = False
+                self._turn_changed = False
+            return
+
+        if self._turn_changed:
+            self.flush()
+
+    def flush(self):
+        """ In batch mode, applies the packets processed so far. """
+        t = self._transaction
+        if t is not None:
+            self._batch = []
+            self._transaction = None
+            self._turn_changed = False
+            self._world._apply(t)
 
     def _process(self, who, what, t):
         if isinstance(what, PowerHistory):
             for power in what.list:
                 self._process_power(power, t)
-        else:
+        elif isinstance(what, RawPacket):
+            if what.type == PowerHistory.ID:
+                for record in powerhistory.scan(what.data):
+                    self._process_record(record, t)
+            elif not self._quiet:
+                self.logger.info('Ignoring packet of type {0}'.format(what.name))
+        elif not self._quiet:
             self.logger.info('Ignoring packet of type {0}'.format(what.__class__.__name__))
 
     def _process_create_game(self, what, t):
@@ -33,7 +115,7 @@ class Processor:
 
         logging.debug('Got game entity:\n{0}'.format(what.game_entity))
         taglist.append((TAG_CUSTOM_NAME, 'TheGame'))
-        t.add(Entity(eid, taglist))
+        self._add_mutable(MutableEntity(eid, taglist), TAG_CUSTOM_NAME, t)
 
         for player in what.players:
             eid, taglist = (player.entity.id,
@@ -42,44 +124,80 @@ class Processor:
             # TODO: are we interested in the battlenet id?
             logging.debug('Found Player {0}:\n{1}'.format(player.id, player))
             taglist.append((TAG_CUSTOM_NAME, 'Player{0}'.format(player.id)))
-            t.add(Entity(eid, taglist))
+            self._add_mutable(MutableEntity(eid, taglist), TAG_CUSTOM_NAME, t)
 
-    def _process_power(self, power, t):
-        if power.HasField('full_entity'):
-            e = power.full_entity
-            taglist = [(e.name, e.value) for e in e.tags]
-            taglist.append((TAG_POWER_NAME, e.name))
-            new_entity = Entity(e.entity, taglist)
-            t.add(new_entity)
+    def _add_mutable(self, entity, name_tag, t):
+        """ Adds a new entity named by its name_tag. """
+        t.add(entity)
+        if GameTag.TURN in entity._tags:
+            self._turn_changed = True
 
-            # logging
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.full_entity(entity.id, name_tag, entity[name_tag])
+            for tag, value in entity._tags.items():
+                if tag != name_tag:
+                    tracer.entity_tag(entity.id, tag, None, value)
+
+    def _add_entity(self, eid, name, taglist, t):
+        taglist.append((TAG_POWER_NAME, name))
+        new_entity = MutableEntity(eid, taglist)
+        self._add_mutable(new_entity, TAG_POWER_NAME, t)
+
+        # logging
+        if not self._quiet and logger.isEnabledFor(logging.INFO):
             logger.info('Adding new entity: {0}'.format(new_entity))
+        if not self._quiet and logger.isEnabledFor(logging.DEBUG):
             logger.debug('With tags: \n' + '\n'.join(
                 '\ttag {0}:{1} {2}'.format(tag_id, format_tag_name(tag_id),
                                           format_tag_value(tag_id, tag_val))
                 for tag_id, tag_val in taglist))
-        if power.HasField('show_entity'):
-            e = power.show_entity
-            mut = t.get_mutable(e.entity)
-            mut[TAG_POWER_NAME] = e.name
 
-            for tag in e.tags:
-                mut[tag.name] = tag.value
+    def _show_entity(self, eid, name, taglist, t):
+        mut = t.get_mutable(eid)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.show_entity(eid, TAG_POWER_NAME, mut[TAG_POWER_NAME], name)
+        mut[TAG_POWER_NAME] = name
 
+        for tag, value in taglist:
+            if tracer is not None:
+                tracer.entity_tag(eid, tag, mut[tag], value)
+            mut[tag] = value
+        if GameTag.TURN in mut._tags:
+            self._turn_changed = True
+
+        if not self._quiet and logger.isEnabledFor(logging.INFO):
             logger.info('Revealing entity: {0}'.format(mut))
-        if power.HasField('hide_entity'):
-            pass
-        if power.HasField('tag_change'):
-            change = power.tag_change
-            e = t.get_mutable(change.entity)
 
+    def _tag_change(self, eid, tag, value, t):
+        e = t.get_mutable(eid)
+        if tag == GameTag.TURN:
+            self._turn_changed = True
+
+        if self.tracer is not None:
+            self.tracer.tag_change(eid, tag, e[tag], value)
+        if not self._quiet and logger.isEnabledFor(logging.INFO):
             logger.info('Tag change for {0}: {1} from {2} to {3}'.format(
                 Entity.__str__(e),
-                format_tag_name(change.tag),
-                format_tag_value(change.tag, e[change.tag]) if e[change.tag] is not None else '(unset)',
-                format_tag_value(change.tag, change.value)))
+                format_tag_name(tag),
+                format_tag_value(tag, e[tag]) if e[tag] is not None else '(unset)',
+                format_tag_value(tag, value)))
+
+        e[tag] = value
 
-            e[change.tag] = change.value
+    def _process_power(self, power, t):
+        if power.HasField('full_entity'):
+            e = power.full_entity
+            self._add_entity(e.entity, e.name, [(tag.name, tag.value) for tag in e.tags], t)
+        if power.HasField('show_entity'):
+            e = power.show_entity
+            self._show_entity(e.entity, e.name, [(tag.name, tag.value) for tag in e.tags], t)
+        if power.HasField('hide_entity'):
+            pass
+        if power.HasField('tag_change'):
+            change = power.tag_change
+            self._tag_change(change.entity, change.tag, change.value, t)
         if power.HasField('create_game'):
             self._process_create_game(power.create_game, t)
         if power.HasField('power_start'):
@@ -88,3 +206,15 @@ class Processor:
             pass
         if power.HasField('meta_data'):
             pass
+
+    def _process_record(self, record, t):
+        """ Same as _process_power for records of powerhistory.scan """
+        kind, eid, a, b = record
+        if kind == powerhistory.TAG_CHANGE:
+            self._tag_change(eid, a, b, t)
+        elif kind == powerhistory.FULL_ENTITY:
+            self._add_entity(eid, a, list(zip(b[::2], b[1::2])), t)
+        elif kind == powerhistory.SHOW_ENTITY:
+            self._show_entity(eid, a, zip(b[::2], b[1::2]), t)
+        elif kind == powerhistory.CREATE_GAME:
+            self._process_create_game(b, t)
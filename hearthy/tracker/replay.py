@@ -0,0 +1,211 @@
+"""
+Replays hcapng captures through the tracker on several processes.
+
+The streams of a capture are independent, each has its own pair of
+splitters and its own World, so they are distributed over worker
+processes by stream id. With an index every stream is a task of its
+own and workers seek straight to its events, otherwise a worker scans
+the event prefixes and only decodes the events of its shard of the
+streams. Workers send back a StreamResult per stream, which
+merge_events combines into one timeline.
+"""
+
+import heapq
+import multiprocessing
+import sys
+import traceback
+
+from hearthy.datasource import hcapng, hcapindex
+from hearthy.protocol.decoder import decode_packet
+from hearthy.protocol.splitter import Splitter
+from hearthy.tracker.processor import Processor
+
+class StreamResult:
+    """
+    Outcome of replaying one stream. events holds (time, what)
+    tuples like hcap_generate_logs: ('create', source, dest),
+    ('packet', who, packet type, packet name) if packets were
+    requested, ('exception', formatted traceback) and ('close',).
+    """
+    __slots__ = ['stream_id', 'source', 'dest', 'start', 'end',
+                 'packets', 'world', 'events', 'error']
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.source = self.dest = None
+        self.start = self.end = None
+        self.packets = 0
+        # eid -> {tag: value} of the final world
+        self.world = {}
+        self.events = []
+        self.error = None
+
+    def __repr__(self):
+        return '<StreamResult stream_id={0} packets={1} entities={2}{3}>'.format(
+            self.stream_id, self.packets, len(self.world),
+            ' error' if self.error else '')
+
+class _StreamReplay:
+    def __init__(self, stream_id, wire, packets, batch):
+        self.result = StreamResult(stream_id)
+        self._splitters = [Splitter(), Splitter()]
+        self._processor = Processor(wire=wire, batch=batch)
+        self._packets = packets
+
+    def feed(self, ts, event):
+        result = self.result
+        if result.start is None:
+            result.start = ts
+
+        if isinstance(event, hcapng.EvNewConnection):
+            result.source, result.dest = event.source, event.dest
+            result.events.append((ts, ('create', event.source, event.dest)))
+        elif isinstance(event, hcapng.EvClose):
+            result.end = ts
+            result.events.append((ts, ('close',)))
+        elif isinstance(event, hcapng.EvData) and result.error is None:
+            processor = self._processor
+            try:
+                for atype, buf in self._splitters[event.who].feed(event.data):
+                    packet = decode_packet(atype, buf, processor.interest)
+                    result.packets += 1
+                    if self._packets:
+                        result.events.append((ts, ('packet', event.who, atype,
+                                                   type(packet).__name__)))
+                    processor.process(event.who, packet)
+            except Exception:
+                # like hcap_generate_logs, a broken stream is given up
+                result.error = ''.join(traceback.format_exception(*sys.exc_info()))
+                result.events.append((ts, ('exception', result.error)))
+
+    def finish(self):
+        result = self.result
+        self._processor.flush()
+        result.world = {e.id: dict(e._tags) for e in self._processor._world}
+        return result
+
+def _replay_task(task):
+    """
+    Worker side: replays either the streams given with their event
+    offsets, or every stream with stream_id % n_shards == shard.
+    """
+    path, streams, shard, n_shards, wire, packets, batch = task
+    replays = {}
+
+    def get(stream_id):
+        r = replays.get(stream_id, None)
+        if r is None:
+            r = replays[stream_id] = _StreamReplay(stream_id, wire, packets, batch)
+        return r
+
+    with open(path, 'rb') as f, hcapng.Reader(f) as reader:
+        if streams is not None:
+            for stream_id, offsets in streams:
+                r = get(stream_id)
+                for offset in offsets:
+                    r.feed(*reader.event_at(offset))
+        else:
+            try:
+                for pos, evlen, evtime, evtype in reader.scan():
+                    stream_id = reader.stream_id_at(pos)
+                    if stream_id % n_shards == shard:
+                        get(stream_id).feed(*reader.event_at(pos))
+            except hcapng.TruncatedException:
+                # capture still being written
+                pass
+
+        return path, [r.finish() for r in replays.values()]
+
+def _tasks(path, n_tasks, index, wire, packets, batch):
+    if index is None:
+        return [(path, None, shard, n_tasks, wire, packets, batch)
+                for shard in range(n_tasks)]
+    return [(path, [(stream_id, info.offsets)], 0, 1, wire, packets, batch)
+            for stream_id, info in index.streams.items()]
+
+def replay_many(paths, processes=None, use_index=False, wire=True, packets=False,
+                batch=True):
+    """
+    Replays all captures on a pool of processes. Yields (path, results)
+    as captures complete, results being sorted by stream id.
+    With use_index the captures' sidecar indexes are built or updated
+    first and every stream is replayed as a task of its own.
+    With batch the tracker applies a turn at a time, see Processor.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    tasks = []
+    pending = {}
+    for path in paths:
+        index = None
+        if use_index:
+            with open(path, 'rb') as f, hcapng.Reader(f) as reader:
+                index = hcapindex.get_index(reader, path)
+        path_tasks = _tasks(path, processes, index, wire, packets, batch)
+        pending[path] = [len(path_tasks), []]
+        tasks.extend(path_tasks)
+
+    def complete(path, results):
+        entry = pending[path]
+        entry[0] -= 1
+        entry[1].extend(results)
+        if entry[0] == 0:
+            del pending[path]
+            return sorted(entry[1], key=lambda r: r.stream_id)
+
+    # captures without any stream
+    for path, entry in list(pending.items()):
+        if entry[0] == 0:
+            del pending[path]
+            yield path, []
+
+    if processes == 1:
+        for task in tasks:
+            results = complete(*_replay_task(task))
+            if results is not None:
+                yield task[0], results
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for path, results in pool.imap_unordered(_replay_task, tasks):
+            results = complete(path, results)
+            if results is not None:
+                yield path, results
+
+def replay(path, processes=None, use_index=False, wire=True, packets=False, batch=True):
+    """ Replays one capture, returns its StreamResults sorted by stream id. """
+    for path, results in replay_many([path], processes, use_index, wire, packets, batch):
+        return results
+
+def merge_events(results):
+    """ Yields (time, stream_id, what) of all results in time order. """
+    def stream_events(result):
+        for ts, what in result.events:
+            yield ts, result.stream_id, what
+    return heapq.merge(*map(stream_events, results), key=lambda x: (x[0], x[1]))
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Replay captures through the tracker')
+    parser.add_argument('captures', nargs='+')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='worker processes (default: number of cores)')
+    parser.add_argument('--index', action='store_true',
+                        help='use (and build) sidecar indexes')
+    parser.add_argument('--protobuf', action='store_true',
+                        help='decode PowerHistory with protobuf instead of the wire reader')
+    parser.add_argument('--no-batch', action='store_true',
+                        help='apply every packet on its own instead of a turn at a time')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for path, results in replay_many(args.captures, args.processes, args.index,
+                                     not args.protobuf, batch=not args.no_batch):
+        print(path)
+        for r in results:
+            print('  stream {0:5}: {1:6} packets {2:5} entities{3}'.format(
+                r.stream_id, r.packets, len(r.world), '  ERROR' if r.error else ''))
+    print('{0:.3f}s'.format(time.perf_counter() - start), file=sys.stderr)
@@ -0,0 +1,210 @@
+"""
+Tag storage for the entities of a World.
+
+TagStore keeps the tags of all entities of a game in a few shared
+structures instead of a dict per entity: a tag starts out in a sparse
+{entity id: value} dict and, once PROMOTE entities have it, moves to
+a dense int32 column indexed by entity id. The handful of tags every
+entity has (zone, controller, card type, ...) thus cost four bytes per
+entity. String tags such as the card id under TAG_POWER_NAME get a
+column of indexes into a table of interned names shared by all
+stores, so a card id is stored once however many entities and games
+use it. Values fitting neither kind of column stay sparse.
+
+DictTagStore is the former one dict per entity layout, kept for
+comparison (see hearthy.benchmark.world).
+"""
+
+import copy
+import sys
+import threading
+from array import array
+
+# marks an unset entry of a column, no tag takes this value
+UNSET = -0x80000000
+_MAX = 0x7fffffff
+# a tag set on this many entities gets a column
+PROMOTE = 8
+
+# names of all stores, looked up without the lock
+_names = []
+_name_ids = {}
+_names_lock = threading.Lock()
+
+def _name_id(name):
+    i = _name_ids.get(name, None)
+    if i is None:
+        with _names_lock:
+            i = _name_ids.get(name, None)
+            if i is None:
+                i = len(_names)
+                _names.append(sys.intern(name))
+                _name_ids[_names[i]] = i
+    return i
+
+class TagStore:
+    def __init__(self):
+        # tag -> array('i') indexed by entity id, of values
+        self._columns = {}
+        # and of name ids
+        self._name_columns = {}
+        # tag -> {eid: value}
+        self._sparse = {}
+        # ids of the columns and sparse dicts not shared with a
+        # snapshot, None until the first snapshot
+        self._owned = None
+
+    def get(self, eid, tag, default=None):
+        col = self._columns.get(tag, None)
+        if col is not None and eid < len(col):
+            value = col[eid]
+            if value != UNSET:
+                return value
+        col = self._name_columns.get(tag, None)
+        if col is not None and eid < len(col):
+            value = col[eid]
+            if value != UNSET:
+                return _names[value]
+        sparse = self._sparse.get(tag, None)
+        if sparse is not None:
+            return sparse.get(eid, default)
+        return default
+
+    def _writable(self, table, tag):
+        """ Returns table[tag], copied first if shared with a snapshot. """
+        obj = table[tag]
+        owned = self._owned
+        if owned is not None and id(obj) not in owned:
+            obj = table[tag] = copy.copy(obj)
+            owned.add(id(obj))
+        return obj
+
+    def _own(self, obj):
+        if self._owned is not None:
+            self._owned.add(id(obj))
+
+    def _clear(self, table, tag, eid):
+        col = table.get(tag, None)
+        if col is not None and eid < len(col) and col[eid] != UNSET:
+            self._writable(table, tag)[eid] = UNSET
+
+    def set(self, eid, tag, value):
+        if type(value) is int and UNSET < value <= _MAX:
+            table, other = self._columns, self._name_columns
+        elif type(value) is str:
+            table, other = self._name_columns, self._columns
+        else:
+            table = other = None
+
+        # a tag is kept in only one place for an entity
+        if other is not None:
+            self._clear(other, tag, eid)
+        elif table is None:
+            self._clear(self._columns, tag, eid)
+            self._clear(self._name_columns, tag, eid)
+        sparse = self._sparse.get(tag, None)
+        if table is not None and tag in table:
+            col = self._writable(table, tag)
+            if eid >= len(col):
+                col.extend(array('i', [UNSET]) * (eid + 1 - len(col)))
+            col[eid] = value if table is self._columns else _name_id(value)
+            if sparse is not None and eid in sparse:
+                del self._writable(self._sparse, tag)[eid]
+            return
+
+        if sparse is None:
+            sparse = self._sparse[tag] = {}
+            self._own(sparse)
+        else:
+            sparse = self._writable(self._sparse, tag)
+        sparse[eid] = sys.intern(value) if type(value) is str else value
+        if (len(sparse) >= PROMOTE and tag not in self._columns
+                and tag not in self._name_columns):
+            self._promote(tag, sparse)
+
+    def _promote(self, tag, sparse):
+        ints = [eid for eid, value in sparse.items()
+                if type(value) is int and UNSET < value <= _MAX]
+        strs = [eid for eid, value in sparse.items() if type(value) is str]
+        if not ints and not strs:
+            return
+
+        size = max(sparse) + 1
+        if len(ints) >= len(strs):
+            col = self._columns[tag] = array('i', [UNSET]) * size
+            for eid in ints:
+                col[eid] = sparse.pop(eid)
+        else:
+            col = self._name_columns[tag] = array('i', [UNSET]) * size
+            for eid in strs:
+                col[eid] = _name_id(sparse.pop(eid))
+        self._own(col)
+        if not sparse:
+            del self._sparse[tag]
+
+    def snapshot(self):
+        """
+        Returns a copy of the store. The copies share their columns and
+        sparse dicts, either one copies those it writes to first.
+        """
+        ret = TagStore()
+        ret._columns = dict(self._columns)
+        ret._name_columns = dict(self._name_columns)
+        ret._sparse = dict(self._sparse)
+        ret._owned = set()
+        self._owned = set()
+        return ret
+
+    def update(self, eid, tags):
+        """ Sets the tags of the dict or (tag, value) iterable tags. """
+        if isinstance(tags, dict):
+            tags = tags.items()
+        for tag, value in tags:
+            self.set(eid, tag, value)
+
+    add = update
+
+    def tags(self, eid):
+        """ Returns a dict of all tags of an entity. """
+        ret = {}
+        for tag, col in self._columns.items():
+            if eid < len(col) and col[eid] != UNSET:
+                ret[tag] = col[eid]
+        for tag, col in self._name_columns.items():
+            if eid < len(col) and col[eid] != UNSET:
+                ret[tag] = _names[col[eid]]
+        for tag, sparse in self._sparse.items():
+            value = sparse.get(eid, None)
+            if value is not None:
+                ret[tag] = value
+        return ret
+
+    def __repr__(self):
+        return '<TagStore columns={0} sparse={1}>'.format(
+            len(self._columns) + len(self._name_columns),
+            sum(map(len, self._sparse.values())))
+
+class DictTagStore:
+    """ One dict per entity. """
+    def __init__(self):
+        self._e = {}
+
+    def get(self, eid, tag, default=None):
+        return self._e[eid].get(tag, default)
+
+    def set(self, eid, tag, value):
+        self._e[eid][tag] = value
+
+    def update(self, eid, tags):
+        self._e[eid].update(tags)
+
+    def add(self, eid, tags):
+        self._e[eid] = dict(tags)
+
+    def tags(self, eid):
+        return dict(self._e[eid])
+
+    def snapshot(self):
+        ret = DictTagStore()
+        ret._e = {eid: dict(tags) for eid, tags in self._e.items()}
+        return ret
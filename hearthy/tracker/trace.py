@@ -0,0 +1,241 @@
+"""
+Binary tracer for the tracker.
+
+Instead of formatting a log line for every change, the Processor and
+its World hand the tracer fixed-size records of (time, kind, entity,
+tag, old value, new value), packed as they come. RingTracer keeps the
+most recent records in memory, FileTracer writes all of them to a
+file. Nothing is rendered as text until the trace is looked at:
+
+    python -m hearthy.tracker.trace <trace file>
+
+String values (card ids, names) are written as ids into a table of
+names, the table is stored in NAME records of 16 bytes of the name
+each. A FileTracer writes them the first time a name is used, a
+RingTracer keeps them aside and writes them ahead of the records
+when dumped.
+"""
+
+import collections
+import struct
+import time
+
+MAGIC = b'HTraceV0\x00'
+
+# time in ns, kind, flags, entity, tag, old and new value
+RECORD = struct.Struct('<qHHiiqq')
+# time, NAME, 0, name id, offset in the name, a chunk of it
+NAME_RECORD = struct.Struct('<qHHii16s')
+NAME_CHUNK = 16
+
+RING_SIZE = 64 * 1024
+
+# kinds of records
+TAG_CHANGE, FULL_ENTITY, SHOW_ENTITY, ENTITY_TAG, TURN, NAME = range(1, 7)
+
+# flags: old value unset, old and new value are name ids
+OLD_UNSET, OLD_NAME, NEW_NAME = 1, 2, 4
+
+_now = time.time_ns
+
+# range of the old and new values
+_INT64_MIN, _INT64_MAX = -2**63, 2**63 - 1
+
+Record = collections.namedtuple('Record', ['time', 'kind', 'entity', 'tag', 'old', 'new'])
+
+class TraceException(Exception):
+    pass
+
+class Tracer:
+    """ Common part of the tracers, subclasses store the records. """
+    def __init__(self):
+        # name -> id
+        self._names = {}
+
+    def _name_id(self, name):
+        i = self._names.get(name, None)
+        if i is None:
+            i = self._names[name] = len(self._names)
+            self._new_name(i, name)
+        return i
+
+    def _record(self, kind, eid, tag, old, new):
+        # bools are ints, anything else or beyond 64 bits is recorded
+        # as its text
+        flags = 0
+        if old is None:
+            flags = OLD_UNSET
+            old = 0
+        elif not (isinstance(old, int) and _INT64_MIN <= old <= _INT64_MAX):
+            flags = OLD_NAME
+            old = self._name_id(str(old))
+        if not (isinstance(new, int) and _INT64_MIN <= new <= _INT64_MAX):
+            flags |= NEW_NAME
+            new = self._name_id(str(new))
+        self._write(_now(), kind, flags, eid, tag, old, new)
+
+    def tag_change(self, eid, tag, old, new):
+        self._record(TAG_CHANGE, eid, tag, old, new)
+
+    def full_entity(self, eid, tag, name):
+        """ tag is the tag the card id name is stored under. """
+        self._record(FULL_ENTITY, eid, tag, None, name)
+
+    def show_entity(self, eid, tag, old, name):
+        self._record(SHOW_ENTITY, eid, tag, old, name)
+
+    def entity_tag(self, eid, tag, old, new):
+        """ A tag of a full or shown entity. """
+        self._record(ENTITY_TAG, eid, tag, old, new)
+
+    def turn(self, eid, tag, old, new):
+        self._record(TURN, eid, tag, old, new)
+
+    def _name_records(self, i, name):
+        data = name.encode('utf-8')
+        now = time.time_ns()
+        # an empty name still gets a record
+        for offset in range(0, max(len(data), 1), NAME_CHUNK):
+            yield NAME_RECORD.pack(now, NAME, 0, i, offset, data[offset:offset + NAME_CHUNK])
+
+class RingTracer(Tracer):
+    """ Keeps the last capacity records in memory. """
+    def __init__(self, capacity=RING_SIZE):
+        super().__init__()
+        self._capacity = capacity
+        self._buf = bytearray(capacity * RECORD.size)
+        # number of records written so far
+        self.count = 0
+
+    def _new_name(self, i, name):
+        # kept in _names, written out by dump
+        pass
+
+    def _write(self, *fields):
+        RECORD.pack_into(self._buf, (self.count % self._capacity) * RECORD.size, *fields)
+        self.count += 1
+
+    def dump(self, f):
+        """ Writes the names and records in memory as a trace file. """
+        f.write(MAGIC)
+        for name, i in self._names.items():
+            for record in self._name_records(i, name):
+                f.write(record)
+
+        size = RECORD.size
+        n = min(self.count, self._capacity)
+        start = (self.count - n) % self._capacity
+        buf = memoryview(self._buf)
+        # oldest first: from start to the end of the buffer, then the rest
+        f.write(buf[start * size:min(start + n, self._capacity) * size])
+        if start + n > self._capacity:
+            f.write(buf[:(start + n - self._capacity) * size])
+
+class FileTracer(Tracer):
+    """ Writes all records to a trace file at path. """
+    def __init__(self, path):
+        super().__init__()
+        self._f = open(path, 'wb')
+        self._f.write(MAGIC)
+
+    def _new_name(self, i, name):
+        for record in self._name_records(i, name):
+            self._f.write(record)
+
+    def _write(self, *fields):
+        self._f.write(RECORD.pack(*fields))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read(f):
+    """ Yields the Records of a trace file, with names resolved. """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise TraceException('Not a trace file')
+
+    names = {}
+    size = RECORD.size
+    while True:
+        buf = f.read(size)
+        if len(buf) < size:
+            # a partial record is what is being written at the moment
+            return
+        t, kind, flags, eid, tag, old, new = RECORD.unpack(buf)
+        if kind == NAME:
+            t, kind, flags, i, offset, chunk = NAME_RECORD.unpack(buf)
+            names[i] = names.get(i, b'')[:offset] + chunk.rstrip(b'\x00')
+            continue
+
+        if flags & OLD_UNSET:
+            old = None
+        elif flags & OLD_NAME:
+            old = names.get(old, b'?').decode('utf-8', 'replace')
+        if flags & NEW_NAME:
+            new = names.get(new, b'?').decode('utf-8', 'replace')
+        yield Record(t, kind, eid, tag, old, new)
+
+def format_records(records):
+    """ Yields a line of text per record, as the tracker used to log. """
+    import datetime
+    from hearthy.db import cards
+    from hearthy.exceptions import CardNotFound
+    from hearthy.protocol.utils import format_tag_name, format_tag_value
+
+    # card id of every entity seen so far
+    card_ids = {}
+
+    def entity(eid):
+        card_id = card_ids.get(eid, None)
+        if card_id is None:
+            return '[{0}]'.format(eid)
+        try:
+            return '[{0}: {1!r}]'.format(eid, cards.get_by_id(card_id))
+        except CardNotFound:
+            return '[{0}: {1!r}]'.format(eid, card_id)
+
+    def value(tag, v):
+        if v is None:
+            return '(unset)'
+        try:
+            return format_tag_value(tag, v)
+        except Exception:
+            return repr(v)
+
+    for r in records:
+        when = datetime.datetime.fromtimestamp(r.time / 1e9).strftime('%H:%M:%S.%f')
+        if r.kind == FULL_ENTITY:
+            card_ids[r.entity] = r.new
+            what = 'Adding new entity: {0}'.format(entity(r.entity))
+        elif r.kind == SHOW_ENTITY:
+            card_ids[r.entity] = r.new
+            what = 'Revealing entity: {0}'.format(entity(r.entity))
+        elif r.kind == ENTITY_TAG:
+            what = '\ttag {0}:{1} {2} -> {3}'.format(
+                r.tag, format_tag_name(r.tag), value(r.tag, r.old), value(r.tag, r.new))
+        elif r.kind == TURN:
+            what = '== Turn {0} =='.format(r.new)
+        else:
+            what = 'Tag change for {0}: {1} from {2} to {3}'.format(
+                entity(r.entity), format_tag_name(r.tag),
+                value(r.tag, r.old), value(r.tag, r.new))
+        yield '{0} {1}'.format(when, what)
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2:
+        print('Usage: {0} <trace file>'.format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+
+    with open(sys.argv[1], 'rb') as f:
+        try:
+            for line in format_records(read(f)):
+                print(line)
+        except BrokenPipeError:
+            pass
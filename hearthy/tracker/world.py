@@ -1,24 +1,31 @@
+import bisect
+import itertools
 import logging
 from hearthstone.enums import GameTag
 from hearthy import exceptions
-from hearthy.protocol.utils import format_tag_value
+from hearthy.protocol.utils import TAG_POWER_NAME, format_tag_value
 from hearthy.tracker.entity import Entity, MutableEntity, MutableView
+from hearthy.tracker.tagstore import TagStore
 
 logger = logging.getLogger(__name__)
 
+# a keyframe is taken at least every this many transactions
+KEYFRAME_INTERVAL = 256
+
+# tags worth indexing to find entities by, see World.add_index
+DEFAULT_INDEXES = (GameTag.ZONE, GameTag.CONTROLLER, GameTag.CARDTYPE,
+                   TAG_POWER_NAME, GameTag.ZONE_POSITION)
+
 class WorldTransaction:
-    def __init__(self, world):
+    def __init__(self, world, ts=None):
         self._world = world
         self._e = {}
+        self.ts = ts
 
     def add(self, entity):
-        if isinstance(entity, Entity):
-            assert entity.id not in self
-
-            # New entities may be modified until transaction
-            # completes
-            entity.__class__ = MutableEntity
-
+        # New entities may be modified until transaction completes
+        assert isinstance(entity, MutableEntity)
+        assert entity.id not in self
         self._e[entity.id] = entity
 
     def __contains__(self, eid):
@@ -44,14 +51,84 @@ class WorldTransaction:
             # TODO: overkill checking all three?
             self._world._apply(self)
 
+def _turn(turn, tags):
+    """
+    The turn of a transaction setting TURN on several entities is the
+    highest, whatever order they are applied in.
+    """
+    value = tags[GameTag.TURN]
+    return value if turn is None or value > turn else turn
+
+class _Keyframe:
+    __slots__ = ['position', 'turn', 'store', 'eids']
+
+    def __init__(self, position, turn, store, eids):
+        # number of journal entries applied
+        self.position = position
+        self.turn = turn
+        self.store = store
+        self.eids = eids
+
+class Watcher:
+    """
+    A subscription to changes of a world, see World.watch.
+    """
+    __slots__ = ['callback', 'entity', 'tag', 'predicate']
+
+    def __init__(self, callback, entity, tag, predicate):
+        self.callback = callback
+        self.entity = entity
+        self.tag = tag
+        self.predicate = predicate
+
+    def __repr__(self):
+        return '<Watcher entity={0} tag={1}{2}>'.format(
+            self.entity, self.tag, ' with predicate' if self.predicate else '')
+
 class World:
     """
-    Container for all in-game entities.
+    Container for all in-game entities. Their tags are kept in store,
+    a TagStore unless given.
+
+    With journal=True the world keeps the changes of every transaction
+    and a keyframe, a copy-on-write snapshot of the store, whenever the
+    turn changes and every KEYFRAME_INTERVAL transactions. at() then
+    rebuilds the world at any earlier point from the keyframe before
+    it, replaying at most KEYFRAME_INTERVAL transactions.
+
+    The tags given in indexes are indexed, see add_index.
+
+    Changes are passed to the watchers registered with watch after
+    every transaction.
     """
-    def __init__(self):
+    def __init__(self, store=None, journal=False, indexes=()):
+        self._store = TagStore() if store is None else store
         self._e = {}
+        # tag -> {value: set of eids}
+        self._indexes = {}
+        for tag in indexes:
+            self.add_index(tag)
+        # watchers of any change, and those of a given entity,
+        # tag or (entity, tag)
         self._watchers = []
+        self._entity_watchers = {}
+        self._tag_watchers = {}
+        self._entity_tag_watchers = {}
         self.cb = None
+        # a trace.Tracer told about turns
+        self.tracer = None
+        self.turn = None
+
+        # [(eid, tags)] per transaction and the time it was applied at
+        self._journal = None
+        self._times = []
+        self._keyframes = []
+        self._keyframe_positions = []
+        # turn -> keyframe taken when it started
+        self._turns = {}
+        if journal:
+            self._journal = []
+            self._add_keyframe()
 
     def __contains__(self, eid):
         return eid in self._e
@@ -66,20 +143,248 @@ class World:
         for entity in self._e.values():
             yield entity
 
-    def transaction(self):
-        return WorldTransaction(self)
+    def add_index(self, tag):
+        """
+        Indexes the entities by the value of tag, so that find and
+        select take time in the number of entities found rather than
+        the number of entities of the world.
+        """
+        if tag in self._indexes:
+            return
+        index = self._indexes[tag] = {}
+        for eid in self._e:
+            value = self._store.get(eid, tag)
+            if value is not None:
+                index.setdefault(value, set()).add(eid)
+
+    def _reindex(self, eid, tags, new):
+        """ Updates the indexes for tags being set on an entity. """
+        store = self._store
+        for tag, index in self._indexes.items():
+            if tag not in tags:
+                continue
+            value = tags[tag]
+            if not new:
+                old = store.get(eid, tag)
+                if old == value:
+                    continue
+                if old is not None:
+                    eids = index[old]
+                    eids.discard(eid)
+                    if not eids:
+                        del index[old]
+            if value is not None:
+                index.setdefault(value, set()).add(eid)
+
+    def find(self, conditions):
+        """
+        Returns the entities whose tags have the values given by the
+        {tag: value} dict conditions, ordered by id. A value of None
+        matches entities without the tag.
+        """
+        eids = None
+        rest = []
+        for tag, value in conditions.items():
+            index = self._indexes.get(tag, None)
+            if index is None or value is None:
+                rest.append((tag, value))
+                continue
+            found = index.get(value, None)
+            if not found:
+                return []
+            eids = found if eids is None else eids & found
+
+        if eids is None:
+            # nothing indexed
+            eids = self._e
+        store = self._store
+        return [self._e[eid] for eid in sorted(eids)
+                if all(store.get(eid, tag) == value for tag, value in rest)]
+
+    def select(self, **conditions):
+        """
+        Like find with the tags given by their GameTag name in lower
+        case, or card_id for the card id:
+        world.select(zone=Zone.HAND, controller=1)
+        """
+        tags = {}
+        for name, value in conditions.items():
+            if name == 'card_id':
+                tags[TAG_POWER_NAME] = value
+            elif name.upper() in GameTag.__members__:
+                tags[GameTag[name.upper()]] = value
+            else:
+                raise TypeError('Unknown tag {0!r}'.format(name))
+        return self.find(tags)
+
+    def _watcher_table(self, watcher):
+        if watcher.entity is not None and watcher.tag is not None:
+            return self._entity_tag_watchers, (watcher.entity, watcher.tag)
+        elif watcher.entity is not None:
+            return self._entity_watchers, watcher.entity
+        elif watcher.tag is not None:
+            return self._tag_watchers, watcher.tag
+        return None, None
+
+    def watch(self, callback, entity=None, tag=None, predicate=None):
+        """
+        Calls callback(world, changes) after each transaction changing
+        the given entity id and/or tag, or any entity and tag if not
+        given. changes is the list of (eid, tag, old value, new value)
+        the watcher is interested in, old is None for tags which were
+        unset. If given, only changes for which predicate(eid, tag,
+        old, new) is true are passed.
+        Returns the Watcher to pass to unwatch.
+        """
+        watcher = Watcher(callback, entity, tag, predicate)
+        table, key = self._watcher_table(watcher)
+        if table is None:
+            self._watchers.append(watcher)
+        else:
+            table.setdefault(key, []).append(watcher)
+        return watcher
+
+    def unwatch(self, watcher):
+        table, key = self._watcher_table(watcher)
+        if table is None:
+            self._watchers.remove(watcher)
+        else:
+            watchers = table[key]
+            watchers.remove(watcher)
+            if not watchers:
+                del table[key]
+
+    def _match_watchers(self, eid, tags, new, pending):
+        """ Adds the changes of an entity to the {watcher: changes} dict pending. """
+        store = self._store
+        entity_watchers = self._entity_watchers.get(eid, ())
+        tag_watchers = self._tag_watchers
+        entity_tag_watchers = self._entity_tag_watchers
+        for tag, value in tags.items():
+            watchers = list(itertools.chain(
+                self._watchers, entity_watchers, tag_watchers.get(tag, ()),
+                entity_tag_watchers.get((eid, tag), ()) if entity_tag_watchers else ()))
+            if not watchers:
+                continue
+            old = None if new else store.get(eid, tag)
+            if old == value:
+                # set back to where it was within the transaction
+                continue
+            for watcher in watchers:
+                if watcher.predicate is None or watcher.predicate(eid, tag, old, value):
+                    changes = pending.get(watcher, None)
+                    if changes is None:
+                        changes = pending[watcher] = []
+                    changes.append((eid, tag, old, value))
+
+    @property
+    def turns(self):
+        """ The turns at() can seek to. """
+        return sorted(self._turns)
+
+    def transaction(self, ts=None):
+        """ ts is the time of the changes, needed for at(time=...) """
+        return WorldTransaction(self, ts)
 
     def _apply(self, transaction):
         cb = self.cb
         if cb is not None:
             cb(self, 'pre_apply', transaction)
 
+        turn = None
+        pending = None
+        if (self._watchers or self._entity_watchers or self._tag_watchers
+                or self._entity_tag_watchers):
+            pending = {}
         for entity in transaction._e.values():
             if GameTag.TURN in entity._tags:
-                logger.info('== Turn {0} =='.format(entity._tags[GameTag.TURN]))
+                value = entity._tags[GameTag.TURN]
+                if self.tracer is not None:
+                    old = entity._e[GameTag.TURN] if isinstance(entity, MutableView) else None
+                    self.tracer.turn(entity.id, GameTag.TURN, old, value)
+                logger.info('== Turn %s ==', value)
+                turn = _turn(turn, entity._tags)
 
             if isinstance(entity, MutableView):
-                entity._e._tags.update(entity._tags)
+                if pending is not None:
+                    self._match_watchers(entity.id, entity._tags, False, pending)
+                if self._indexes:
+                    self._reindex(entity.id, entity._tags, False)
+                self._store.update(entity.id, entity._tags)
             else:
                 assert entity.id not in self
-                self._e[entity.id] = entity.freeze()
+                if pending is not None:
+                    self._match_watchers(entity.id, entity._tags, True, pending)
+                if self._indexes:
+                    self._reindex(entity.id, entity._tags, True)
+                self._e[entity.id] = entity.freeze(self._store)
+        if turn is not None:
+            self.turn = turn
+
+        journal = self._journal
+        if journal is not None and transaction._e:
+            # the tags dicts are not changed after the transaction
+            journal.append([(eid, entity._tags) for eid, entity in transaction._e.items()])
+            ts = transaction.ts
+            if ts is None:
+                ts = self._times[-1] if self._times else 0
+            self._times.append(ts)
+            if (turn is not None or
+                    len(journal) - self._keyframe_positions[-1] >= KEYFRAME_INTERVAL):
+                self._add_keyframe()
+
+        if pending:
+            for watcher, changes in pending.items():
+                try:
+                    watcher.callback(self, changes)
+                except Exception:
+                    # the world has changed already, let the others know
+                    logger.exception('Watcher {0!r} failed'.format(watcher))
+
+    def _add_keyframe(self):
+        position = len(self._journal)
+        self._keyframes.append(_Keyframe(position, self.turn, self._store.snapshot(),
+                                         tuple(self._e)))
+        self._keyframe_positions.append(position)
+        if self.turn is not None and self.turn not in self._turns:
+            self._turns[self.turn] = self._keyframes[-1]
+
+    def at(self, turn=None, time=None):
+        """
+        Returns a new world of the state at the start of turn, or after
+        the last transaction with a ts up to time. Needs a journal.
+        """
+        if self._journal is None:
+            raise ValueError('World has no journal')
+        if (turn is None) == (time is None):
+            raise TypeError('Give either turn or time')
+
+        if turn is not None:
+            keyframe = self._turns.get(turn, None)
+            if keyframe is None:
+                raise ValueError('Turn {0} was not reached'.format(turn))
+            position = keyframe.position
+        else:
+            position = bisect.bisect_right(self._times, time)
+            i = bisect.bisect_right(self._keyframe_positions, position) - 1
+            keyframe = self._keyframes[i]
+
+        store = keyframe.store.snapshot()
+        world = World(store)
+        world.turn = keyframe.turn
+        world._e = {eid: Entity(store, eid) for eid in keyframe.eids}
+        for changes in self._journal[keyframe.position:position]:
+            turn = None
+            for eid, tags in changes:
+                if eid in world._e:
+                    store.update(eid, tags)
+                else:
+                    store.add(eid, tags)
+                    world._e[eid] = Entity(store, eid)
+                if GameTag.TURN in tags:
+                    turn = _turn(turn, tags)
+            if turn is not None:
+                world.turn = turn
+        for tag in self._indexes:
+            world.add_index(tag)
+        return world
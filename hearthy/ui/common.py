@@ -4,24 +4,25 @@ import sys
 import traceback
 
 from hearthy.datasource import hcapng
-from hearthy.protocol.utils import Splitter
+from hearthy.protocol.splitter import Splitter
 from hearthy.protocol.decoder import decode_packet
 
 MAX_QUEUE = 1000
 
 class Connection:
-    __slots__ = ['p', '_s']
+    __slots__ = ['p', '_s', '_interest']
     """
     Represent a connection between two endpoints source and dest.
-    Decodes packet in the connection
+    Decodes packet in the connection, only those in interest if given.
     """
-    def __init__(self, source, dest):
+    def __init__(self, source, dest, interest=None):
         self.p = [source, dest]
         self._s = [Splitter(), Splitter()]
+        self._interest = interest
 
     def feed(self, who, buf):
         for atype, abuf in self._s[who].feed(buf):
-            decoded = decode_packet(atype, abuf)
+            decoded = decode_packet(atype, abuf, self._interest)
             yield decoded
 
     def __repr__(self):
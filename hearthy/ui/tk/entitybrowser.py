@@ -41,10 +41,20 @@ class EntityFilter(ttk.Frame):
 
         self.cb = None
 
+    def _get_value(self, tag_id):
+        value = self.value.get()
+        enum = utils._gametag_to_enum.get(tag_id, None)
+        if enum is not None:
+            value = getattr(enum, value.upper(), value)
+
+        try:
+            return int(value)
+        except ValueError:
+            print('Err: {0!r} is not numeric'.format(value))
+
     def get_filter_string(self):
         tag = self.tag.get()
         test = self.test.get()
-        value = self.value.get()
 
         tag_id = int(getattr(GameTag, tag))
 
@@ -53,14 +63,8 @@ class EntityFilter(ttk.Frame):
         elif test == 'Not Exists':
             return '(x[{0}] is None)'.format(tag_id)
 
-        enum = utils._gametag_to_enum.get(tag_id, None)
-        if enum is not None:
-            value = getattr(enum, value.upper(), value)
-
-        try:
-            value = int(value)
-        except ValueError:
-            print('Err: {0!r} is not numeric'.format(value))
+        value = self._get_value(tag_id)
+        if value is None:
             return
 
         if test == 'Equals':
@@ -68,6 +72,14 @@ class EntityFilter(ttk.Frame):
         elif test == 'Not Equals':
             return '(x[{0}] != {1})'.format(tag_id, value)
 
+    def get_condition(self):
+        """ Returns (tag, value) if the filter is a test for equality. """
+        if self.test.get() == 'Equals':
+            tag_id = int(getattr(GameTag, self.tag.get()))
+            value = self._get_value(tag_id)
+            if value is not None:
+                return (tag_id, value)
+
     def _on_remove(self):
         if self.cb is not None:
             self.cb(self, 'remove')
@@ -89,6 +101,8 @@ class EntityTree:
         self._build_widgets(container)
         self._world = None
         self._filter_fun = lambda x:True
+        # {tag: value} the filter requires, to look up in the world
+        self._conditions = {}
 
     def _build_widgets(self, container):
         tree = ttk.Treeview(container, columns=('Info','Value'))
@@ -154,8 +168,9 @@ class EntityTree:
             self._tree.item(str(eview.id),
                             value=(str(eview), ''))
 
-    def set_filter(self, fun):
+    def set_filter(self, fun, conditions=None):
         self._filter_fun = fun
+        self._conditions = conditions or {}
         if self._world is not None:
             self.set_world(self._world)
 
@@ -165,8 +180,9 @@ class EntityTree:
         for item in dellist:
             self._tree.delete(item)
 
-        # rebuild tree
-        for entity in world:
+        # rebuild tree, with the world's indexes if there are conditions
+        entities = world.find(self._conditions) if self._conditions else world
+        for entity in entities:
             if self._filter_fun(entity):
                 self._add_entity(entity)
 
@@ -230,7 +246,8 @@ class EntityBrowser:
             f = eval('lambda x: ' + full)
         else:
             f = lambda x:True
-        self._tree.set_filter(f)
+        conditions = dict(filter(None, [ef.get_condition() for ef in self._filters]))
+        self._tree.set_filter(f, conditions)
 
     def _remove_filter(self, ef, event):
         self._filters.remove(ef)
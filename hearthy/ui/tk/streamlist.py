@@ -1,6 +1,7 @@
 import tkinter
 from tkinter import ttk
 from hearthy.tracker.processor import Processor
+from hearthy.tracker.world import DEFAULT_INDEXES
 
 from datetime import datetime
 
@@ -62,21 +63,41 @@ class StreamList:
             for eb in self._entity_browsers.get(world, []):
                 eb.apply_transaction(*args)
 
-    def open_entity_browser(self):
-        sid = self.get_selected()
-        if sid is None:
-            return
-
+    def _get_tracker(self, sid):
         tracker = self._trackers.get(sid, None)
         if tracker is None:
             stream = self._streams[sid]
-            tracker = self._trackers[sid] = Processor()
-            
+            tracker = self._trackers[sid] = Processor(journal=True, indexes=DEFAULT_INDEXES)
+
             assert tracker._world.cb is None
             tracker._world.cb = self._world_cb
 
             for packet in stream.packets:
-                tracker.process(packet[1], packet[0])
+                tracker.process(packet[1], packet[0], packet[2])
+        return tracker
+
+    def get_turns(self):
+        """ The turns the selected stream's world can be opened at. """
+        sid = self.get_selected()
+        if sid is None:
+            return []
+        return self._get_tracker(sid)._world.turns
+
+    def open_entity_browser(self, turn=None):
+        """
+        Opens a browser of the selected stream's world, following it
+        as it changes, or of the world at the start of turn.
+        """
+        sid = self.get_selected()
+        if sid is None:
+            return
+
+        tracker = self._get_tracker(sid)
+        if turn is not None:
+            # a past world does not change, no need to follow it
+            eb = EntityBrowser()
+            eb.set_world(tracker._world.at(turn=turn))
+            return
 
         world = tracker._world
         l = self._entity_browsers.get(world, None)
@@ -156,7 +177,7 @@ class StreamList:
 
         tracker = self._trackers.get(stream_id, None)
         if tracker is not None:
-            tracker.process(who, packet)
+            tracker.process(who, packet, ts)
 
     def on_close(self, stream_id, ts):
         stream = self._streams.get(stream_id, None)
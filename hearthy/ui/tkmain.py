@@ -3,7 +3,11 @@ from tkinter import ttk
 
 from hearthy.ui.tk.streamlist import StreamList
 from hearthy.ui.common import AsyncLogGenerator
-from hearthy.datasource import hcapng
+from hearthy.datasource import follow
+
+POLL_MS = 20
+# the entity browser follows the world as it changes
+LIVE = 'live'
 
 class Application(ttk.Frame):
     def __init__(self, master=None):
@@ -15,18 +19,31 @@ class Application(ttk.Frame):
     def _build_widgets(self):
         self._b_packets = ttk.Button(self, text='View Packets', command=self._on_log_view)
         self._b_entities = ttk.Button(self, text='Entity Browser', command=self._on_entity_browser)
+        # turn the entity browser opens at, filled in from the selected stream
+        self._turn = ttk.Combobox(self, state='readonly', width=8,
+                                  values=[LIVE], postcommand=self._on_turns)
+        self._turn.set(LIVE)
         self._streams_frame = ttk.LabelFrame(self, text='Stream List')
 
-        self._streams_frame.grid(columnspan=2, row=0, column=0, sticky='nsew')
+        self._streams_frame.grid(columnspan=3, row=0, column=0, sticky='nsew')
         self._b_packets.grid(row=1, column=0, sticky='nsew')
         self._b_entities.grid(row=1, column=1, sticky='nsew')
+        self._turn.grid(row=1, column=2, sticky='nsew')
 
         self.grid_columnconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
 
+    def _on_turns(self):
+        self._turn['values'] = [LIVE] + self._streams.get_turns()
+
     def _on_entity_browser(self):
-        self._streams.open_entity_browser()
+        turn = None if self._turn.get() == LIVE else int(self._turn.get())
+        if turn is not None and turn not in self._streams.get_turns():
+            # picked for another stream
+            self._turn.set(LIVE)
+            turn = None
+        self._streams.open_entity_browser(turn)
 
     def _on_log_view(self):
         self._streams.open_stream_view()
@@ -49,7 +66,7 @@ class Application(ttk.Frame):
 
 if __name__ == '__main__':
     import sys
-    import os
+    import queue
     import logging
 
     logging.basicConfig(level=logging.DEBUG)
@@ -62,30 +79,29 @@ if __name__ == '__main__':
     root.geometry('800x300')
     root.wm_title('MainWindow')
 
-    parser = hcapng.AsyncParser()
     log_generator = AsyncLogGenerator()
-    
+
     app = Application(master=root)
-    
-    fd = os.open(sys.argv[1], os.O_NONBLOCK | os.O_RDONLY)
-
-    def read_cb(fd, mask):
-        buf = os.read(fd, 1024)
-        
-        if len(buf) == 0:
-            # end of file (hopefully)
-            root.tk.deletefilehandler(fd)
-            return
-        
-        try:
-            for ts, event in parser.feed_buf(buf):
+
+    # the capture may still be written to, keep following it
+    follower = follow.FollowThread(sys.argv[1])
+
+    def poll_cb():
+        # bound the work per callback to keep the ui responsive
+        for i in range(16):
+            try:
+                batch = follower.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            for ts, event in batch:
                 for packet_event in log_generator.process_event(ts, event):
                     app.process_event(*packet_event)
-        except:
-            root.tk.deletefilehandler(fd)
-            raise
+        root.after(POLL_MS, poll_cb)
 
-    root.tk.createfilehandler(fd, tkinter.READABLE, read_cb)
+    follower.start()
+    root.after(POLL_MS, poll_cb)
     root.mainloop()
 
-    os.close(fd)
+    follower.stop()
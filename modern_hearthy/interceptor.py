@@ -5,10 +5,13 @@ Modern network interceptor with async support
 import asyncio
 import socket
 import struct
-from typing import Optional, Callable, Dict, Any, Tuple
+from typing import Optional, Callable, Dict, Any, Tuple, Union
 import logging
 
 from .types import PacketType, PacketData, PacketDirection, InterceptAction
+from hearthy.protocol.wirepatch import Patch
+from hearthy.proxy.recorder import Recorder
+from hearthy.proxy.flight import FlightRecorder
 from .protocol.splitter import ModernSplitter
 from .protocol.decoder import decoder
 from .battlegrounds.detector import BattlegroundsDetector
@@ -16,22 +19,38 @@ from .exceptions import InterceptError
 
 logger = logging.getLogger(__name__)
 
+# The splitter handles any number of packets per read in linear time
+READ_SIZE = 64 * 1024
+
 class ModernInterceptor:
     """Modern network interceptor for Hearthstone"""
     
     def __init__(self, 
                  port: int = 1119,
                  host: str = "127.0.0.1",
-                 battlegrounds_callback: Optional[Callable] = None) -> None:
+                 battlegrounds_callback: Optional[Callable] = None,
+                 recorder: Optional[Union[Recorder, FlightRecorder]] = None) -> None:
         self.port = port
         self.host = host
         self.battlegrounds_detector = BattlegroundsDetector(battlegrounds_callback)
         self.packet_handlers: Dict[PacketType, Callable] = {}
+        self.packet_patches: Dict[PacketType, Patch] = {}
         self.running = False
+        # records every connection as received if set, either to
+        # files or into a flight recorder
+        self.recorder = recorder
         
     def add_packet_handler(self, packet_type: PacketType, handler: Callable) -> None:
         """Add a handler for a specific packet type"""
         self.packet_handlers[packet_type] = handler
+
+    def add_packet_patch(self, packet_type: PacketType, patch: Patch) -> None:
+        """Rewrite packets of a type on the wire
+
+        The patch is applied whenever a handler returns MODIFY, or to
+        every packet of that type if it has no handler.
+        """
+        self.packet_patches[packet_type] = patch
     
     async def start(self) -> None:
         """Start the interceptor"""
@@ -69,44 +88,63 @@ class ModernInterceptor:
         # Create splitters for both directions
         client_splitter = ModernSplitter()
         server_splitter = ModernSplitter()
+
+        stream_id = None
+        if self.recorder is not None:
+            stream_id = self.recorder.new_connection(
+                client_addr, server_writer.get_extra_info('peername'))
         
         try:
             # Handle bidirectional communication
             await asyncio.gather(
-                self._proxy_data(reader, server_writer, client_splitter, PacketDirection.CLIENT_TO_SERVER),
-                self._proxy_data(server_reader, writer, server_splitter, PacketDirection.SERVER_TO_CLIENT)
+                self._proxy_data(reader, server_writer, client_splitter, PacketDirection.CLIENT_TO_SERVER, stream_id),
+                self._proxy_data(server_reader, writer, server_splitter, PacketDirection.SERVER_TO_CLIENT, stream_id)
             )
         except Exception as e:
             logger.error(f"Connection error: {e}")
         finally:
             writer.close()
             server_writer.close()
+            if stream_id is not None:
+                self.recorder.close_connection(stream_id)
             logger.info(f"Connection closed for {client_addr}")
     
     async def _proxy_data(self, 
                          reader: asyncio.StreamReader, 
                          writer: asyncio.StreamWriter,
                          splitter: ModernSplitter,
-                         direction: PacketDirection) -> None:
+                         direction: PacketDirection,
+                         stream_id: Optional[int] = None) -> None:
         """Proxy data between client and server while intercepting packets"""
         
         while self.running:
             try:
-                data = await reader.read(8192)
+                data = await reader.read(READ_SIZE)
                 if not data:
                     break
+
+                if stream_id is not None:
+                    # never blocks, the recorder drops data when it falls behind
+                    self.recorder.data(stream_id, int(direction), data)
                 
                 # Process packets through splitter
                 for packet_type, packet_data in splitter.feed(data):
                     action = await self._process_packet(packet_type, packet_data, direction)
                     
+                    if action == InterceptAction.MODIFY:
+                        patch = self.packet_patches.get(packet_type)
+                        if patch is None:
+                            logger.warning(f"No patch registered for packet type {packet_type}")
+                        else:
+                            patched = patch.apply(packet_data)
+                            if patched is not None:
+                                packet_data = patched
+                        action = InterceptAction.ACCEPT
+
                     if action == InterceptAction.ACCEPT:
-                        # Forward original packet
+                        # Forward (possibly patched) packet
                         header = struct.pack('<II', packet_type, len(packet_data))
                         writer.write(header + packet_data)
-                    elif action == InterceptAction.MODIFY:
-                        # This would handle packet modification
-                        pass
                     # REJECT means don't forward the packet
                 
                 await writer.drain()
@@ -132,7 +170,9 @@ class ModernInterceptor:
                 handler = self.packet_handlers.get(packet_type)
                 if handler:
                     return handler(decoded.data, direction)
-            
+
+            if packet_type in self.packet_patches:
+                return InterceptAction.MODIFY
             return InterceptAction.ACCEPT
             
         except Exception as e:
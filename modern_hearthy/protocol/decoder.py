@@ -3,9 +3,10 @@ Modern protocol decoder with type hints
 """
 
 import struct
-from typing import Dict, Type, Optional, Any, Union
+from typing import Dict, Type, Optional, Any, Union, Tuple, Iterable, Callable
 from dataclasses import dataclass
 
+from hearthy.protocol.registry import messages_by_id, MessageRegistry
 from ..types import PacketType, PacketData
 from ..exceptions import DecodeError, EncodeError
 
@@ -19,30 +20,26 @@ class DecodedPacket:
 class ModernDecoder:
     """Modern packet decoder with type safety"""
     
-    def __init__(self) -> None:
-        self._message_types: Dict[PacketType, Type] = {}
-        self._initialize_message_types()
+    def __init__(self, registry: MessageRegistry = messages_by_id) -> None:
+        # Shared lazy registry, message modules are imported on first use
+        self._message_types = registry
+        self._available = True
     
-    def _initialize_message_types(self) -> None:
-        """Initialize message type mappings"""
+    def _get_message_type(self, packet_type: PacketType) -> Optional[Type]:
+        """Look up the message class for a packet type"""
+        if not self._available:
+            return None
         try:
-            # Try to import protobuf definitions if available
-            from pegasus import game_pb2, bobnet_pb2
-            
-            for module in (bobnet_pb2, game_pb2):
-                for name, message_desc in module.DESCRIPTOR.message_types_by_name.items():
-                    try:
-                        message_id = message_desc.enum_values_by_name['ID'].number
-                        self._message_types[message_id] = getattr(module, name)
-                    except KeyError:
-                        continue
+            return self._message_types.get(packet_type)
         except ImportError:
             print("Warning: Protobuf definitions not available. Limited functionality.")
+            self._available = False
+            return None
     
     def decode_packet(self, packet_type: PacketType, data: PacketData) -> Optional[DecodedPacket]:
         """Decode a packet with type safety"""
         try:
-            message_class = self._message_types.get(packet_type)
+            message_class = self._get_message_type(packet_type)
             if not message_class:
                 return None
             
@@ -56,7 +53,38 @@ class ModernDecoder:
             )
         except Exception as e:
             raise DecodeError(f"Failed to decode packet type {packet_type}: {e}")
-    
+
+    def decode_many(self,
+                    frames: Iterable[Tuple[PacketType, PacketData]],
+                    visitor: Callable[[PacketType, Any], Optional[bool]],
+                    reuse: bool = False) -> None:
+        """Decode frames, handing each message to visitor
+
+        The message handed to visitor is only valid during the call
+        unless visitor returns True to take ownership of it. Unknown
+        packet types are skipped. With reuse=True every packet type
+        gets one message that is cleared and refilled, which is slower
+        than a fresh message with current protobuf releases.
+        """
+        messages: Dict[PacketType, Any] = {}
+        for packet_type, data in frames:
+            message = messages.pop(packet_type, None)
+            if message is None:
+                message_class = self._get_message_type(packet_type)
+                if not message_class:
+                    continue
+                message = message_class()
+            else:
+                message.Clear()
+
+            try:
+                message.MergeFromString(bytes(data))
+            except Exception as e:
+                raise DecodeError(f"Failed to decode packet type {packet_type}: {e}")
+
+            if not visitor(packet_type, message) and reuse:
+                messages[packet_type] = message
+
     def encode_packet(self, packet: Any) -> Tuple[PacketType, PacketData]:
         """Encode a packet with type safety"""
         try:
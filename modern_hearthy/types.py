@@ -27,7 +27,7 @@ class InterceptAction(IntEnum):
     """Actions that can be taken on intercepted packets"""
     ACCEPT = 0
     REJECT = 1
-    MODIFY = 2
+    MODIFY = 2  # forward with the patch registered for the packet type
 
 # Type aliases
 PacketData = bytes
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from hearthstone.enums import GameTag
+from pegasus.game_pb2 import PowerHistory
+
+def _tags(entity, tags):
+    for tag, value in tags:
+        t = entity.tags.add()
+        t.name = tag
+        t.value = value
+
+def _entity_tags(rnd):
+    return [(GameTag.ZONE, rnd.randrange(1, 8)), (GameTag.CONTROLLER, rnd.randrange(1, 3)),
+            (GameTag.CARDTYPE, rnd.randrange(1, 8)), (GameTag.ZONE_POSITION, rnd.randrange(10))]
+
+def make_game(seed=0, turns=12):
+    """
+    Returns the (who, PowerHistory) packets of a made up game and
+    {turn: index of the packet starting it}.
+    """
+    rnd = random.Random(seed)
+    packets = []
+    turn_starts = {}
+
+    p = PowerHistory()
+    game = p.list.add().create_game
+    game.game_entity.id = 1
+    _tags(game.game_entity, [(GameTag.ZONE, 1)])
+    for i in (1, 2):
+        player = game.players.add()
+        player.id = i
+        player.game_account_id.hi = 0
+        player.game_account_id.lo = i
+        player.card_back = 0
+        player.entity.id = i + 1
+        _tags(player.entity, [(GameTag.CONTROLLER, i)])
+    packets.append((1, p))
+
+    eids = list(range(4, 34))
+    p = PowerHistory()
+    for eid in eids:
+        e = p.list.add().full_entity
+        e.entity = eid
+        e.name = 'CARD_{0:02}'.format(rnd.randrange(40))
+        _tags(e, _entity_tags(rnd))
+    packets.append((1, p))
+
+    for turn in range(1, turns + 1):
+        p = PowerHistory()
+        change = p.list.add().tag_change
+        change.entity, change.tag, change.value = 1, GameTag.TURN, turn
+        turn_starts[turn] = len(packets)
+        packets.append((1, p))
+
+        for i in range(rnd.randrange(2, 8)):
+            p = PowerHistory()
+            for j in range(rnd.randrange(1, 6)):
+                power = p.list.add()
+                r = rnd.random()
+                if r < 0.1:
+                    e = power.full_entity
+                    e.entity = len(eids) + 4
+                    eids.append(e.entity)
+                    e.name = 'CARD_{0:02}'.format(rnd.randrange(40))
+                    _tags(e, _entity_tags(rnd))
+                elif r < 0.2:
+                    e = power.show_entity
+                    e.entity = rnd.choice(eids)
+                    e.name = 'CARD_{0:02}'.format(rnd.randrange(40))
+                    _tags(e, _entity_tags(rnd)[:rnd.randrange(1, 4)])
+                else:
+                    change = power.tag_change
+                    change.entity = rnd.choice(eids)
+                    change.tag = rnd.choice([GameTag.ZONE, GameTag.DAMAGE, GameTag.ZONE_POSITION,
+                                             GameTag.EXHAUSTED])
+                    change.value = rnd.randrange(10)
+            packets.append((rnd.randrange(2), p))
+    return packets, turn_starts
+
+@pytest.fixture(params=range(3))
+def game(request):
+    return make_game(request.param)
@@ -0,0 +1,86 @@
+import collections
+import io
+import random
+
+import pytest
+
+from hearthstone.enums import GameTag
+from pegasus.game_pb2 import PowerHistory
+from hearthy.protocol import decoder
+from hearthy.tracker import trace
+from hearthy.tracker.processor import Processor
+
+def dump(world):
+    return {e.id: dict(e._tags) for e in world}
+
+def bad_packet(tag):
+    """ Changes tag of an entity, then fails on one that does not exist. """
+    p = PowerHistory()
+    for eid in (1, 99999):
+        change = p.list.add().tag_change
+        change.entity, change.tag, change.value = eid, tag, 100
+    return p
+
+def with_errors(packets, n=3, seed=0):
+    rnd = random.Random(seed)
+    packets = list(packets)
+    for i in range(n):
+        tag = GameTag.TURN if i == 0 else GameTag.DAMAGE
+        packets.insert(rnd.randrange(3, len(packets)), (1, bad_packet(tag)))
+    return packets
+
+def on_wire(packets):
+    return [(who, decoder.decode_packet(PowerHistory.ID, packet.SerializeToString(),
+                                        interest=frozenset()))
+            for who, packet in packets]
+
+def run(packets, batch, wire=False, tracer=None):
+    p = Processor(wire=wire, journal=True, batch=batch, tracer=tracer)
+    world = p._world
+    changes = {}
+    def watcher(world, new_changes):
+        for eid, tag, old, new in new_changes:
+            changes[(eid, tag)] = new
+    world.watch(watcher)
+
+    errors = []
+    for ts, (who, packet) in enumerate(packets):
+        try:
+            p.process(who, packet, ts)
+        except Exception as e:
+            errors.append((ts, type(e)))
+            # a redone batch must not end the next one early
+            assert not (batch and p._turn_changed)
+    p.flush()
+    return {'world': dump(world), 'turn': world.turn, 'errors': errors, 'changes': changes,
+            'turns': {turn: dump(world.at(turn=turn)) for turn in world.turns}}
+
+@pytest.mark.parametrize('wire', [False, True])
+def test_batch(game, wire):
+    packets, turn_starts = game
+    if wire:
+        packets = on_wire(packets)
+    assert run(packets, True, wire) == run(packets, False, wire)
+
+@pytest.mark.parametrize('wire', [False, True])
+def test_batch_errors(game, wire):
+    packets = with_errors(game[0])
+    if wire:
+        packets = on_wire(packets)
+    expected = run(packets, False, wire)
+    assert len(expected['errors']) == 3
+    assert run(packets, True, wire) == expected
+
+def trace_of(packets, batch):
+    tracer = trace.RingTracer()
+    run(packets, batch, tracer=tracer)
+    f = io.BytesIO()
+    tracer.dump(f)
+    f.seek(0)
+    # records without their time
+    return collections.Counter(r[1:] for r in trace.read(f))
+
+def test_batch_trace(game):
+    packets = with_errors(game[0])
+    # a redone batch is traced once
+    assert trace_of(packets, True) == trace_of(packets, False)
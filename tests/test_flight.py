@@ -0,0 +1,82 @@
+import struct
+
+import pytest
+
+from hearthy.datasource import hcapng
+from hearthy.proxy import flight
+
+SOURCE, DEST = ('10.0.0.1', 50000), ('10.0.0.2', 3724)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0]
+    monkeypatch.setattr(flight, '_ms', lambda: now[0])
+    return now
+
+def frame(i, size=100):
+    return struct.pack('<II', i, size) + bytes(size)
+
+def accounted(recorder):
+    """ The size recorder should report, from what it holds. """
+    connections = recorder._connections.values()
+    return (sum(len(f) + flight.ENTRY_OVERHEAD
+                for conn in connections for t, who, f in conn.frames) +
+            sum(sum(conn.pending) for conn in connections))
+
+def test_size_ceiling(clock):
+    recorder = flight.FlightRecorder(max_bytes=10 * (108 + flight.ENTRY_OVERHEAD))
+    streams = [recorder.new_connection(SOURCE, DEST) for i in range(3)]
+    for i in range(30):
+        clock[0] = i
+        recorder.data(streams[i % 3], 0, frame(i))
+        assert recorder.size == accounted(recorder) <= recorder._max_bytes
+    # the oldest frames of all connections went first
+    kept = sorted(struct.unpack_from('<I', f)[0] for conn in recorder._connections.values()
+                  for t, who, f in conn.frames)
+    assert kept == list(range(20, 30))
+
+def test_max_age(clock):
+    recorder = flight.FlightRecorder(max_age=1)
+    a = recorder.new_connection(SOURCE, DEST)
+    b = recorder.new_connection(SOURCE, DEST)
+    recorder.data(a, 0, frame(0))
+    clock[0] = 500
+    recorder.data(b, 0, frame(1))
+    clock[0] = 1200
+    recorder.data(b, 1, frame(2))
+    assert [len(recorder._connections[s].frames) for s in (a, b)] == [0, 2]
+    assert recorder.size == accounted(recorder)
+
+def test_partial_frames_counted(clock):
+    recorder = flight.FlightRecorder(max_bytes=1000)
+    stream_id = recorder.new_connection(SOURCE, DEST)
+    data = frame(0, 500)
+    recorder.data(stream_id, 0, data[:300])
+    assert recorder.size == 300
+    recorder.data(stream_id, 0, data[300:])
+    assert recorder.size == len(data) + flight.ENTRY_OVERHEAD
+
+    # a frame beyond the ceiling is not buffered up to MAX_FRAME
+    recorder.data(stream_id, 1, struct.pack('<II', 1, 5000) + bytes(300))
+    assert recorder.size == accounted(recorder) <= 1000
+
+    recorder.data(stream_id, 0, data[:10])
+    recorder.close_connection(stream_id)
+    assert recorder.size == accounted(recorder)
+
+def test_dump(clock, tmp_path):
+    recorder = flight.FlightRecorder()
+    stream_id = recorder.new_connection(SOURCE, DEST)
+    clock[0] = 10
+    recorder.data(stream_id, 0, frame(0, 5) + frame(1, 5)[:3])
+    clock[0] = 20
+    recorder.data(stream_id, 1, frame(2, 5))
+    recorder.close_connection(stream_id)
+
+    path = str(tmp_path / 'flight.hcapng')
+    recorder.dump(path, wait=True)
+    with open(path, 'rb') as f:
+        events = [e for t, e in hcapng.parse(f)][1:]
+    assert [type(e) for e in events] == [hcapng.EvNewConnection, hcapng.EvData,
+                                         hcapng.EvData, hcapng.EvClose]
+    assert [bytes(e.data) for e in events[1:3]] == [frame(0, 5), frame(2, 5)]
@@ -0,0 +1,106 @@
+import io
+import lzma
+import random
+import zlib
+
+import pytest
+
+from hearthy.datasource import hcapblock, hcapng
+
+def key(evtime, event):
+    """ A comparable form of an event. """
+    if isinstance(event, hcapng.EvData):
+        return (evtime, 'data', event.stream_id, event.who, bytes(event.data))
+    elif isinstance(event, hcapng.EvNewConnection):
+        return (evtime, 'new', event.stream_id, event.source, event.dest)
+    elif isinstance(event, hcapng.EvClose):
+        return (evtime, 'close', event.stream_id)
+    return (evtime, 'header', event.ts)
+
+def make_capture(codec, seed=0, block_size=4096):
+    """ Returns the capture and the keys of its events. """
+    rnd = random.Random(seed)
+    f = io.BytesIO()
+    writer = hcapblock.Writer(f, 1234, codec=codec, block_size=block_size)
+    events = [(0, 'header', 1234)]
+    open_streams = []
+    for t in range(2000):
+        if not open_streams or rnd.random() < 0.01:
+            stream_id = len(events)
+            source, dest = ('10.0.0.1', 1000 + stream_id), ('10.0.0.2', 3724)
+            writer.new_connection(t, stream_id, source, dest)
+            events.append((t, 'new', stream_id, source, dest))
+            open_streams.append(stream_id)
+        elif rnd.random() < 0.005:
+            stream_id = open_streams.pop(rnd.randrange(len(open_streams)))
+            writer.close_connection(t, stream_id)
+            events.append((t, 'close', stream_id))
+        else:
+            stream_id = rnd.choice(open_streams)
+            who = rnd.randrange(2)
+            data = bytes(rnd.randrange(16) for i in range(rnd.randrange(1, 200)))
+            writer.data(t, stream_id, who, data)
+            events.append((t, 'data', stream_id, who, data))
+    writer.close()
+    return f.getvalue(), events
+
+CODECS = [hcapblock.CODEC_NONE, hcapblock.CODEC_ZLIB, hcapblock.CODEC_LZMA]
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_parse(codec):
+    buf, events = make_capture(codec)
+    assert [key(*e) for e in hcapng.parse(io.BytesIO(buf))] == events
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_block_stream_chunks(codec):
+    buf, events = make_capture(codec)
+    blocks = hcapblock.BlockStream(codec)
+    out = []
+    for pos in range(hcapblock.HEADER_SIZE, len(buf), 7):
+        out.extend(key(*e) for e in blocks.feed(buf[pos:pos + 7]))
+    assert blocks.done
+    assert out == events[1:]
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_reader(codec):
+    buf, events = make_capture(codec)
+    reader = hcapblock.BlockReader(io.BytesIO(buf))
+    assert reader.ts == 1234
+    assert len(reader.blocks) > 1
+    assert [key(*e) for e in reader.events()] == events[1:]
+
+    stream_id = events[-1][2]
+    assert [key(*e) for e in reader.events(stream_id=stream_id, start=500, end=1500)] == [
+        e for e in events[1:] if e[2] == stream_id and 500 <= e[0] < 1500]
+
+def test_reader_without_directory():
+    # as left by a writer that did not finish
+    buf, events = make_capture(hcapblock.CODEC_ZLIB)
+    offset = [b.offset for b in hcapblock.BlockReader(io.BytesIO(buf)).blocks][-1]
+    reader = hcapblock.BlockReader(io.BytesIO(buf[:offset]))
+    out = [key(*e) for e in reader.events()]
+    assert out == events[1:len(out) + 1]
+
+def block_capture(codec, data, raw_length):
+    return (hcapblock.VERSION + hcapblock._HEADER.pack(0, codec) +
+            hcapblock._BLOCK.pack(hcapblock.KIND_BLOCK, len(data), raw_length) + data)
+
+def events_bytes(n):
+    """ n data events as they are stored in a block. """
+    f = io.BytesIO()
+    writer = hcapng.Writer(f, 0)
+    for i in range(n):
+        writer.data(i, 0, 0, b'x' * 10)
+    return f.getvalue()[hcapng.HEADER_SIZE:]
+
+@pytest.mark.parametrize('codec,compress', [
+    (hcapblock.CODEC_ZLIB, zlib.compress), (hcapblock.CODEC_LZMA, lzma.compress)])
+@pytest.mark.parametrize('n', [10000, 1])
+def test_inflate_bound(codec, compress, n):
+    # valid events, but not the 100 bytes the block declares
+    raw = events_bytes(n)
+    buf = block_capture(codec, compress(raw), 100)
+    with pytest.raises(hcapng.HCapException, match='Block decompress'):
+        list(hcapng.parse(io.BytesIO(buf)))
+    with pytest.raises(hcapng.HCapException, match='Block decompress'):
+        list(hcapblock.BlockReader(io.BytesIO(buf)).events())
@@ -0,0 +1,91 @@
+import io
+
+import pytest
+
+from hearthy.datasource import hcapng
+
+def key(evtime, event):
+    if isinstance(event, hcapng.EvData):
+        return (evtime, 'data', event.stream_id, event.who, bytes(event.data))
+    elif isinstance(event, hcapng.EvNewConnection):
+        return (evtime, 'new', event.stream_id, event.source, event.dest)
+    elif isinstance(event, hcapng.EvClose):
+        return (evtime, 'close', event.stream_id)
+    return (evtime, 'header', event.ts)
+
+def make_capture():
+    f = io.BytesIO()
+    writer = hcapng.Writer(f, 1234)
+    writer.new_connection(0, 1, ('10.0.0.1', 50000), ('10.0.0.2', 3724))
+    for i in range(50):
+        writer.data(i, 1, i % 2, bytes([i]) * (i + 1))
+    writer.close_connection(60, 1)
+    events = [(0, 'header', 1234), (0, 'new', 1, ('10.0.0.1', 50000), ('10.0.0.2', 3724))]
+    events += [(i, 'data', 1, i % 2, bytes([i]) * (i + 1)) for i in range(50)]
+    events.append((60, 'close', 1))
+    return f.getvalue(), events
+
+@pytest.fixture
+def capture(tmp_path):
+    buf, events = make_capture()
+    path = tmp_path / 'capture.hcapng'
+    path.write_bytes(buf)
+    return str(path), buf, events
+
+def test_parse_file(capture):
+    path, buf, events = capture
+    with open(path, 'rb') as f:
+        assert [key(*e) for e in hcapng.parse(f)] == events
+        # as if read from the stream
+        assert f.tell() == len(buf)
+
+def test_parse_stream(capture):
+    path, buf, events = capture
+    assert [key(*e) for e in hcapng.parse(io.BytesIO(buf))] == events
+
+def test_parse_file_data_kept(capture):
+    path, buf, events = capture
+    with open(path, 'rb') as f:
+        parsed = list(hcapng.parse(f))
+    # the data of the mapping outlives the reader
+    assert [key(*e) for e in parsed] == events
+
+def offsets(path):
+    """ Offsets of the events of the capture at path. """
+    with open(path, 'rb') as f, hcapng.Reader(f) as reader:
+        return [pos for pos, evlen, evtime, evtype in reader.scan()]
+
+def test_parse_closed_early(capture):
+    path, buf, events = capture
+    with open(path, 'rb') as f:
+        g = hcapng.parse(f)
+        assert [key(*next(g)) for i in range(3)] == events[:3]
+        g.close()
+        # the stream is after the last event read
+        assert f.tell() == offsets(path)[2]
+
+def test_parse_after_start(tmp_path):
+    # the capture starts where the stream is
+    buf, events = make_capture()
+    path = tmp_path / 'embedded'
+    path.write_bytes(b'junk' * 10 + buf)
+    with open(str(path), 'rb') as f:
+        f.read(40)
+        assert [key(*e) for e in hcapng.parse(f)] == events
+
+def test_parse_offset(capture):
+    path, buf, events = capture
+    offset = offsets(path)[10]
+    for stream in (open(path, 'rb'), io.BytesIO(buf)):
+        with stream:
+            parsed = [key(*e) for e in hcapng.parse(stream, offset)]
+        assert parsed == events[:1] + events[11:]
+
+def test_truncated(capture):
+    path, buf, events = capture
+    with pytest.raises(hcapng.TruncatedException):
+        list(hcapng.parse(io.BytesIO(buf[:-1])))
+
+def test_not_a_capture():
+    with pytest.raises(hcapng.HCapException):
+        list(hcapng.parse(io.BytesIO(b'HTraceV0\x00\x00\x00')))
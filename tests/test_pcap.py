@@ -0,0 +1,113 @@
+import io
+import struct
+
+from hearthy.datasource import hcapng, pcap
+
+CLIENT = (b'\x0a\x00\x00\x01', 50000)
+SERVER = (b'\x0a\x00\x00\x02', 3724)
+
+SYN, FIN, RST, ACK = 0x02, 0x01, 0x04, 0x10
+
+def tcp_packet(who, seq, flags=ACK, data=b''):
+    """ An IPv4 TCP packet sent by the client (who=0) or the server. """
+    (saddr, sport), (daddr, dport) = (CLIENT, SERVER) if who == 0 else (SERVER, CLIENT)
+    tcp = struct.pack('!HHIIBBHHH', sport, dport, seq & 0xffffffff, 0, 5 << 4, flags,
+                      65535, 0, 0)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp) + len(data), 0, 0, 64, 6, 0,
+                     saddr, daddr)
+    return ip + tcp + data
+
+def handshake(client_isn, server_isn):
+    return [tcp_packet(0, client_isn, SYN),
+            tcp_packet(1, server_isn, SYN | ACK),
+            tcp_packet(0, client_isn + 1)]
+
+def run(packets, **kwargs):
+    """ Feeds packets, returns the events as comparable tuples. """
+    reassembler = pcap.Reassembler(**kwargs)
+    out = []
+    for t, packet in enumerate(packets):
+        for evtime, event in reassembler.feed(t, packet):
+            if isinstance(event, hcapng.EvData):
+                out.append(('data', event.who, bytes(event.data)))
+            elif isinstance(event, hcapng.EvNewConnection):
+                out.append(('new', event.source, event.dest))
+            else:
+                out.append(('close',))
+    return out
+
+def data_of(events, who):
+    return b''.join(e[2] for e in events if e[0] == 'data' and e[1] == who)
+
+def test_in_order():
+    packets = handshake(1000, 5000) + [
+        tcp_packet(0, 1001, data=b'hello'),
+        tcp_packet(1, 5001, data=b'world'),
+        tcp_packet(0, 1006, FIN | ACK),
+        tcp_packet(1, 5006, FIN | ACK)]
+    assert run(packets) == [
+        ('new', ('10.0.0.1', 50000), ('10.0.0.2', 3724)),
+        ('data', 0, b'hello'),
+        ('data', 1, b'world'),
+        ('close',)]
+
+def test_other_ports_ignored():
+    packets = handshake(1000, 5000) + [tcp_packet(0, 1001, data=b'hello')]
+    assert run(packets, ports=(1119,)) == []
+
+def test_no_handshake():
+    # connections are only followed from their handshake on
+    assert run([tcp_packet(0, 1001, data=b'hello')]) == []
+
+def test_out_of_order():
+    packets = handshake(1000, 5000) + [
+        tcp_packet(0, 1011, data=b'cccc'),
+        tcp_packet(0, 1006, data=b'bbbbb'),
+        tcp_packet(0, 1001, data=b'aaaaa')]
+    assert data_of(run(packets), 0) == b'aaaaabbbbbcccc'
+
+def test_retransmit():
+    packets = handshake(1000, 5000) + [
+        tcp_packet(0, 1001, data=b'abcdef'),
+        tcp_packet(0, 1001, data=b'abcdef'),
+        # overlaps what was handed out already
+        tcp_packet(0, 1004, data=b'defghi'),
+        tcp_packet(0, 1001, data=b'abc')]
+    assert data_of(run(packets), 0) == b'abcdefghi'
+
+def test_seq_wrap():
+    isn = 0xffffffff - 3
+    packets = handshake(isn, 5000) + [
+        # the sequence number wraps within the second segment
+        tcp_packet(0, isn + 1, data=b'ab'),
+        tcp_packet(0, isn + 5, data=b'efgh'),
+        tcp_packet(0, isn + 3, data=b'cd'),
+        tcp_packet(0, isn + 3, data=b'cdef')]
+    assert data_of(run(packets), 0) == b'abcdefgh'
+
+def test_max_buffer():
+    packets = handshake(1000, 5000) + [
+        tcp_packet(0, 1101, data=b'x' * 60),
+        tcp_packet(0, 1201, data=b'x' * 60)]
+    assert run(packets, max_buffer=100)[-1] == ('close',)
+
+def test_rst():
+    packets = handshake(1000, 5000) + [tcp_packet(1, 5001, RST)]
+    assert run(packets)[-1] == ('close',)
+
+def test_pcap_file():
+    packets = handshake(1000, 5000) + [tcp_packet(0, 1001, data=b'hello')]
+    f = io.BytesIO()
+    # raw IPv4 link type
+    f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 101))
+    for i, packet in enumerate(packets):
+        f.write(struct.pack('<IIII', 1000, i * 1000, len(packet), len(packet)))
+        f.write(packet)
+    f.seek(0)
+
+    events = list(pcap.parse(f))
+    assert isinstance(events[0][1], hcapng.EvHeader)
+    assert events[0][1].ts == 1000
+    assert [type(e) for t, e in events[1:]] == [hcapng.EvNewConnection, hcapng.EvData]
+    assert [t for t, e in events[1:]] == [1, 3]
+    assert bytes(events[-1][1].data) == b'hello'
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from hearthy import exceptions
+from hearthy.protocol.splitter import HEADER, Splitter
+
+def make_frames(rnd, n=200, max_len=300):
+    return [(rnd.randrange(400), bytes(rnd.randrange(256) for i in range(rnd.randrange(max_len))))
+            for i in range(n)]
+
+def encode(frames):
+    return b''.join(HEADER.pack(atype, len(data)) + data for atype, data in frames)
+
+def feed_chunks(splitter, stream, sizes, **kwargs):
+    out = []
+    pos = 0
+    for size in sizes:
+        out.extend((atype, bytes(data)) for atype, data in
+                   splitter.feed(stream[pos:pos + size], **kwargs))
+        pos += size
+    return out
+
+@pytest.mark.parametrize('seed', range(5))
+def test_any_chunking(seed):
+    rnd = random.Random(seed)
+    frames = make_frames(rnd)
+    stream = encode(frames)
+    sizes = [rnd.randrange(1, 700) for i in range(len(stream))]
+    assert feed_chunks(Splitter(), stream, sizes) == frames
+
+def test_byte_at_a_time():
+    frames = make_frames(random.Random(1), n=20)
+    stream = encode(frames)
+    splitter = Splitter()
+    assert feed_chunks(splitter, stream, [1] * len(stream)) == frames
+    assert splitter.pending == 0
+
+def test_header():
+    frames = make_frames(random.Random(2))
+    stream = encode(frames)
+    out = feed_chunks(Splitter(), stream, [97] * len(stream), header=True)
+    assert out == [(atype, HEADER.pack(atype, len(data)) + data) for atype, data in frames]
+
+def test_empty_frame():
+    assert feed_chunks(Splitter(), encode([(3, b'')]), [HEADER.size]) == [(3, b'')]
+
+def test_pending():
+    splitter = Splitter()
+    stream = encode([(1, b'abcdef')])
+    assert list(splitter.feed(stream[:5])) == []
+    assert splitter.pending == 5
+    assert [bytes(data) for atype, data in splitter.feed(stream[5:])] == [b'abcdef']
+    assert splitter.pending == 0
+
+def test_break_keeps_rest():
+    frames = make_frames(random.Random(3), n=10)
+    stream = encode(frames)
+    splitter = Splitter()
+    out = []
+    for atype, data in splitter.feed(stream):
+        out.append((atype, bytes(data)))
+        break
+    # the frames not yet handed out come with the next chunk
+    out.extend(feed_chunks(splitter, b'', [0]))
+    assert out == frames
+
+def test_max_frame():
+    splitter = Splitter(max_frame=HEADER.size + 10)
+    assert [bytes(data) for atype, data in splitter.feed(encode([(1, b'x' * 10)]))] == [b'x' * 10]
+    with pytest.raises(exceptions.BufferFullException):
+        list(splitter.feed(encode([(1, b'x' * 11)])))
+
+def test_max_frame_split_header():
+    # the length is checked as soon as the header is complete
+    splitter = Splitter(max_frame=100)
+    stream = HEADER.pack(1, 1000)
+    assert list(splitter.feed(stream[:3])) == []
+    with pytest.raises(exceptions.BufferFullException):
+        list(splitter.feed(stream[3:]))
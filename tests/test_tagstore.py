@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from hearthy.tracker import tagstore
+from hearthy.tracker.tagstore import DictTagStore, TagStore
+
+# an int tag, a tag holding names, one with both and one too large
+# for a column
+TAGS = [(1, lambda rnd: rnd.randrange(-5, 50)),
+        (2, lambda rnd: 'CARD_{0:02}'.format(rnd.randrange(20))),
+        (3, lambda rnd: rnd.choice([rnd.randrange(10), 'X{0}'.format(rnd.randrange(5))])),
+        (4, lambda rnd: rnd.choice([rnd.randrange(10), 2**40]))]
+
+def all_tags(store, eids):
+    tags = {eid: store.tags(eid) for eid in eids}
+    # get agrees with tags
+    for eid in eids:
+        for tag, value in TAGS:
+            assert store.get(eid, tag) == tags[eid].get(tag, None)
+    return tags
+
+def test_columns():
+    store = TagStore()
+    for eid in range(tagstore.PROMOTE):
+        store.add(eid, {1: eid, 2: 'CARD_{0}'.format(eid)})
+    assert 1 in store._columns and 2 in store._name_columns
+    assert store.get(3, 1) == 3
+    assert store.get(3, 2) == 'CARD_3'
+    assert store.get(3, 5, 'default') == 'default'
+    assert store.tags(100) == {}
+
+    # a column keeps values that do not fit it aside
+    store.set(3, 1, 'name')
+    store.set(4, 1, 2**40)
+    assert store.tags(3) == {1: 'name', 2: 'CARD_3'}
+    assert store.get(4, 1) == 2**40
+
+def test_snapshot_copy_on_write():
+    store = TagStore()
+    for eid in range(20):
+        store.add(eid, {1: eid, 2: 'CARD_{0}'.format(eid), 5: eid} if eid < 10 else {1: eid})
+    before = all_tags(store, range(30))
+    snapshot = store.snapshot()
+
+    store.set(0, 1, 100)
+    store.set(1, 2, 'OTHER')
+    store.set(2, 5, 7)
+    store.set(25, 1, 1)
+    store.set(3, 6, 'new tag')
+    assert all_tags(snapshot, range(30)) == before
+
+    # and the other way round
+    after = all_tags(store, range(30))
+    snapshot.set(0, 1, -1)
+    snapshot.set(5, 2, 'SNAP')
+    snapshot.set(29, 5, 9)
+    assert all_tags(store, range(30)) == after
+
+@pytest.mark.parametrize('seed', range(5))
+def test_snapshots_random(seed):
+    # every snapshot keeps the tags it was taken with, whatever
+    # happens to the store and the other snapshots afterwards
+    rnd = random.Random(seed)
+    eids = range(60)
+    stores = [(TagStore(), DictTagStore())]
+    for eid in eids:
+        stores[0][1].add(eid, {})
+
+    for i in range(3000):
+        store, expected = rnd.choice(stores)
+        if rnd.random() < 0.01:
+            stores.append((store.snapshot(), expected.snapshot()))
+            continue
+        eid = rnd.choice(eids)
+        tag, value = rnd.choice(TAGS)
+        value = value(rnd)
+        store.set(eid, tag, value)
+        expected.set(eid, tag, value)
+
+    assert len(stores) > 10
+    for store, expected in stores:
+        assert all_tags(store, eids) == all_tags(expected, eids)
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+
+from hearthy.tracker import trace
+
+def records(tracer):
+    """ Calls every kind of record once, returns what read should give. """
+    tracer.tag_change(1, 20, 3, 4)
+    tracer.full_entity(5, -1, 'CS2_029')
+    tracer.show_entity(6, -1, 'OLD_NAME', 'a name longer than sixteen bytes')
+    tracer.entity_tag(6, 49, None, 1)
+    tracer.turn(1, 20, None, 5)
+    # bools are numbers, values beyond 64 bits are kept as text
+    tracer.tag_change(2, 30, True, False)
+    tracer.tag_change(2, 30, 7, 2**64)
+    tracer.tag_change(2, 30, -2**70, -2**63)
+    tracer.entity_tag(7, 185, 'CS2_029', '')
+    return [
+        (trace.TAG_CHANGE, 1, 20, 3, 4),
+        (trace.FULL_ENTITY, 5, -1, None, 'CS2_029'),
+        (trace.SHOW_ENTITY, 6, -1, 'OLD_NAME', 'a name longer than sixteen bytes'),
+        (trace.ENTITY_TAG, 6, 49, None, 1),
+        (trace.TURN, 1, 20, None, 5),
+        (trace.TAG_CHANGE, 2, 30, 1, 0),
+        (trace.TAG_CHANGE, 2, 30, 7, str(2**64)),
+        (trace.TAG_CHANGE, 2, 30, str(-2**70), -2**63),
+        (trace.ENTITY_TAG, 7, 185, 'CS2_029', '')]
+
+def read(f):
+    return [tuple(r[1:]) for r in trace.read(f)]
+
+def test_file_tracer(tmp_path):
+    path = str(tmp_path / 'trace')
+    with trace.FileTracer(path) as tracer:
+        expected = records(tracer)
+    with open(path, 'rb') as f:
+        assert read(f) == expected
+
+def test_ring_tracer():
+    tracer = trace.RingTracer()
+    expected = records(tracer)
+    f = io.BytesIO()
+    tracer.dump(f)
+    f.seek(0)
+    assert read(f) == expected
+
+def test_ring_tracer_wraps():
+    tracer = trace.RingTracer(capacity=4)
+    for i in range(10):
+        tracer.tag_change(i, 1, None, 'value {0}'.format(i))
+    f = io.BytesIO()
+    tracer.dump(f)
+    f.seek(0)
+    # the last records, oldest first, with the names they use
+    assert read(f) == [(trace.TAG_CHANGE, i, 1, None, 'value {0}'.format(i))
+                       for i in range(6, 10)]
+
+def test_times():
+    tracer = trace.RingTracer()
+    records(tracer)
+    f = io.BytesIO()
+    tracer.dump(f)
+    f.seek(0)
+    times = [r.time for r in trace.read(f)]
+    assert times == sorted(times)
+
+def test_partial_record():
+    # a record being written is left out
+    tracer = trace.RingTracer()
+    expected = records(tracer)
+    f = io.BytesIO()
+    tracer.dump(f)
+    f = io.BytesIO(f.getvalue()[:-1])
+    assert read(f) == expected[:-1]
+
+def test_not_a_trace():
+    with pytest.raises(trace.TraceException):
+        list(trace.read(io.BytesIO(b'HCaptureV0\x00')))
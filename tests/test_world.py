@@ -0,0 +1,74 @@
+import pytest
+
+from hearthstone.enums import GameTag
+from hearthy.tracker import world as world_module
+from hearthy.tracker.processor import Processor
+from hearthy.tracker.world import DEFAULT_INDEXES
+
+def dump(world):
+    return {e.id: dict(e._tags) for e in world}
+
+def replay(packets, **kwargs):
+    """ Returns the world after the packets, one transaction each. """
+    p = Processor(**kwargs)
+    for ts, (who, packet) in enumerate(packets):
+        p.process(who, packet, ts)
+    return p._world
+
+@pytest.fixture(params=[3, world_module.KEYFRAME_INTERVAL])
+def keyframe_interval(request, monkeypatch):
+    # a short interval has at() replay from keyframes within turns
+    monkeypatch.setattr(world_module, 'KEYFRAME_INTERVAL', request.param)
+
+def states(packets):
+    """ dump and turn of the world after each packet. """
+    p = Processor()
+    ret = []
+    for ts, (who, packet) in enumerate(packets):
+        p.process(who, packet, ts)
+        ret.append((dump(p._world), p._world.turn))
+    return ret
+
+def test_at_turn(game, keyframe_interval):
+    packets, turn_starts = game
+    world = replay(packets, journal=True)
+    expected = states(packets)
+    assert world.turns == sorted(turn_starts)
+    for turn, i in turn_starts.items():
+        past = world.at(turn=turn)
+        assert (dump(past), past.turn) == expected[i]
+
+def test_at_time(game, keyframe_interval):
+    packets, turn_starts = game
+    world = replay(packets, journal=True)
+    for ts, state in enumerate(states(packets)):
+        past = world.at(time=ts)
+        assert (dump(past), past.turn) == state
+
+def test_at_leaves_world(game):
+    packets, turn_starts = game
+    world = replay(packets, journal=True)
+    before = dump(world)
+    past = world.at(turn=1)
+    with past.transaction() as t:
+        t.get_mutable(4)[GameTag.DAMAGE] = 99
+    assert dump(world) == before
+
+def test_at_indexes(game):
+    packets, turn_starts = game
+    world = replay(packets, journal=True, indexes=DEFAULT_INDEXES)
+    past = world.at(turn=3)
+    expected = replay(packets[:turn_starts[3] + 1])
+    for zone in range(1, 8):
+        assert (sorted(e.id for e in past.select(zone=zone)) ==
+                sorted(e.id for e in expected if e[GameTag.ZONE] == zone))
+
+def test_at_errors(game):
+    packets, turn_starts = game
+    with pytest.raises(ValueError):
+        replay(packets).at(turn=1)
+    world = replay(packets, journal=True)
+    with pytest.raises(ValueError):
+        world.at(turn=1000)
+    with pytest.raises(TypeError):
+        world.at()